@@ -1,5 +1,8 @@
-from django.contrib import admin
-from .models import Stock, BloodRequest, Certificate, Sponsor, Hospital, BloodCamp, CampRegistration, NotificationJob
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.http import FileResponse
+from .models import Stock, BloodRequest, Certificate, Sponsor, Hospital, BloodCamp, CampRegistration, NotificationJob, NotificationJobSummary, StockForecast
+from . import certificate_pdf, search
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
@@ -12,15 +15,38 @@ class StockAdmin(admin.ModelAdmin):
 class BloodRequestAdmin(admin.ModelAdmin):
     list_display = ['patient_name', 'bloodgroup', 'unit', 'status', 'date']
     list_filter = ['status', 'bloodgroup', 'date']
-    search_fields = ['patient_name']
+    search_fields = ['patient_name', 'reason']
     ordering = ['-date']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans where the database has one
+        matches = search.matching(queryset, search_term, 'request')
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        return matches, False
+
+    def get_ordering(self, request):
+        # Best matches first while searching, unless a column is sorted
+        rank = search.rank_order(request.GET.get(SEARCH_VAR, ''), 'request', self.model)
+        return [rank] if rank is not None else super().get_ordering(request)
+
 @admin.register(Certificate)
 class CertificateAdmin(admin.ModelAdmin):
     list_display = ['donor', 'certificate_type', 'donation_count', 'issued_date']
     list_filter = ['certificate_type', 'issued_date']
     search_fields = ['donor__user__first_name', 'donor__user__last_name']
     ordering = ['-issued_date']
+    actions = ['download_zip']
+
+    @admin.action(description='Download selected certificates as ZIP')
+    def download_zip(self, request, queryset):
+        if not certificate_pdf.REPORTLAB_AVAILABLE:
+            self.message_user(request, 'PDF generation is not available.', level=messages.ERROR)
+            return None
+        archive, skipped = certificate_pdf.write_zip(queryset.select_related('donor__user'))
+        if skipped:
+            self.message_user(request, f'{skipped} certificates could not be rendered and were left out.', level=messages.WARNING)
+        return FileResponse(archive, as_attachment=True, filename='certificates.zip', content_type='application/zip')
 
 @admin.register(Sponsor)
 class SponsorAdmin(admin.ModelAdmin):
@@ -90,4 +116,17 @@ class NotificationJobAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at', 'completed_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(NotificationJobSummary)
+class NotificationJobSummaryAdmin(admin.ModelAdmin):
+    list_display = ['day', 'notification_type', 'status', 'jobs', 'retries']
+    list_filter = ['notification_type', 'status']
+    date_hierarchy = 'day'
+    ordering = ['-day']
+
+@admin.register(StockForecast)
+class StockForecastAdmin(admin.ModelAdmin):
+    list_display = ['bloodgroup', 'current_units', 'daily_demand', 'daily_supply', 'days_until_stockout', 'generated_at']
+    readonly_fields = ['generated_at']
+    ordering = ['bloodgroup']
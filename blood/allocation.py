@@ -0,0 +1,281 @@
+"""
+Offline allocation-policy simulator
+
+Replays historical BloodDonate and BloodRequest rows against an in-memory
+stock model so allocation policies can be compared before they are used on
+the live Stock table. State is kept in flat arrays indexed by blood group
+instead of ORM objects, so a replay of millions of events stays in memory
+and runs in minutes.
+"""
+import heapq
+import time
+from array import array
+from collections import deque
+
+from django.utils.module_loading import import_string
+
+from .models import BLOOD_GROUPS, GROUP_INDEX
+
+# Red cell units are usable for 42 days after collection
+DEFAULT_SHELF_LIFE_DAYS = 42
+
+# Event kinds. Donations sort before requests made on the same day.
+DONATION = 0
+REQUEST = 1
+
+# Recipient group -> donor groups it can receive from, in preference order
+COMPATIBLE_DONORS = {
+    'O-': ('O-',),
+    'O+': ('O+', 'O-'),
+    'A-': ('A-', 'O-'),
+    'A+': ('A+', 'A-', 'O+', 'O-'),
+    'B-': ('B-', 'O-'),
+    'B+': ('B+', 'B-', 'O+', 'O-'),
+    'AB-': ('AB-', 'A-', 'B-', 'O-'),
+    'AB+': ('AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-'),
+}
+
+
+class StockState:
+    """
+    Array-backed stock for the eight blood groups
+
+    ``units`` holds the total per group; ``lots`` keeps FIFO queues of
+    ``[expiry_day, units]`` so units are drawn oldest first and expired
+    units can be counted as wastage.
+    """
+
+    def __init__(self, shelf_life_days=DEFAULT_SHELF_LIFE_DAYS):
+        self.shelf_life_days = shelf_life_days
+        self.units = array('q', [0] * len(BLOOD_GROUPS))
+        self.lots = [deque() for _ in BLOOD_GROUPS]
+
+    def receive(self, group, units, day):
+        self.units[group] += units
+        self.lots[group].append([day + self.shelf_life_days, units])
+
+    def take(self, group, units):
+        """Remove up to ``units`` from a group, oldest lots first"""
+        lots = self.lots[group]
+        taken = 0
+        while lots and taken < units:
+            lot = lots[0]
+            used = min(lot[1], units - taken)
+            lot[1] -= used
+            taken += used
+            if lot[1] == 0:
+                lots.popleft()
+        self.units[group] -= taken
+        return taken
+
+    def expire(self, day):
+        """Drop every lot whose expiry day has been reached, returning the units lost"""
+        wasted = 0
+        for group, lots in enumerate(self.lots):
+            while lots and lots[0][0] <= day:
+                units = lots.popleft()[1]
+                self.units[group] -= units
+                wasted += units
+        return wasted
+
+
+class AllocationPolicy:
+    """
+    Base class for allocation policies
+
+    ``sources`` lists the stock groups a request may draw from, in order.
+    Requests are filled all-or-nothing, matching ``update_approve_status_view``.
+    When ``backorder`` is set, unfilled requests wait for later donations
+    instead of being turned away.
+    """
+    name = None
+    backorder = False
+
+    def sources(self, group):
+        return (group,)
+
+    def can_fill(self, state, group, units):
+        return sum(state.units[source] for source in self.sources(group)) >= units
+
+    def fill(self, state, group, units):
+        remaining = units
+        for source in self.sources(group):
+            if not remaining:
+                break
+            remaining -= state.take(source, remaining)
+        return units - remaining
+
+
+class ExactMatchPolicy(AllocationPolicy):
+    """Current behaviour: same blood group only, reject when short"""
+    name = 'exact'
+
+
+class CompatiblePolicy(AllocationPolicy):
+    """Substitute ABO/Rh compatible groups when the exact group is short"""
+    name = 'compatible'
+
+    _sources = tuple(
+        tuple(GROUP_INDEX[donor] for donor in COMPATIBLE_DONORS[recipient])
+        for recipient in BLOOD_GROUPS
+    )
+
+    def sources(self, group):
+        return self._sources[group]
+
+
+class BackorderPolicy(AllocationPolicy):
+    """Same blood group only, queue short requests until stock arrives"""
+    name = 'backorder'
+    backorder = True
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (ExactMatchPolicy, CompatiblePolicy, BackorderPolicy)
+}
+
+
+def get_policy(name):
+    """Resolve a registered policy name or a dotted path to a policy class"""
+    policy_class = POLICIES.get(name) or import_string(name)
+    return policy_class()
+
+
+class SimulationResult:
+    """Counters collected during a replay"""
+
+    def __init__(self):
+        self.events = 0
+        self.donations = 0
+        self.requests = 0
+        self.filled_requests = 0
+        self.requested_units = 0
+        self.filled_units = 0
+        self.donated_units = 0
+        self.wasted_units = 0
+        self.total_wait_days = 0
+        self.max_wait_days = 0
+        self.unfilled_requests = 0
+        self.still_waiting = 0
+        self.elapsed = 0.0
+
+    @property
+    def fill_rate(self):
+        return self.filled_units / self.requested_units if self.requested_units else 0.0
+
+    @property
+    def average_wait_days(self):
+        return self.total_wait_days / self.filled_requests if self.filled_requests else 0.0
+
+    @property
+    def wastage_rate(self):
+        return self.wasted_units / self.donated_units if self.donated_units else 0.0
+
+    @property
+    def events_per_second(self):
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+
+class Simulator:
+    """
+    Replay a date-ordered event stream against a policy
+
+    Events are ``(day, kind, group, units)`` tuples where ``day`` is a date
+    ordinal and ``group`` an index into ``BLOOD_GROUPS``.
+    """
+
+    def __init__(self, policy, shelf_life_days=DEFAULT_SHELF_LIFE_DAYS, initial_units=0):
+        self.policy = policy
+        self.state = StockState(shelf_life_days)
+        self.result = SimulationResult()
+        self.initial_units = initial_units
+        # Waiting requests per group: deque of [request_day, units]
+        self.waiting = [deque() for _ in BLOOD_GROUPS]
+
+    def run(self, events):
+        state = self.state
+        result = self.result
+        policy = self.policy
+        current_day = None
+        started = time.perf_counter()
+
+        for day, kind, group, units in events:
+            if day != current_day:
+                if current_day is None and self.initial_units:
+                    for index in range(len(BLOOD_GROUPS)):
+                        state.receive(index, self.initial_units, day)
+                result.wasted_units += state.expire(day)
+                current_day = day
+            result.events += 1
+
+            if kind == DONATION:
+                result.donations += 1
+                result.donated_units += units
+                state.receive(group, units, day)
+                if policy.backorder and self.waiting[group]:
+                    self._drain_waiting(group, day)
+                continue
+
+            result.requests += 1
+            result.requested_units += units
+            if policy.can_fill(state, group, units):
+                result.filled_units += policy.fill(state, group, units)
+                result.filled_requests += 1
+            elif policy.backorder:
+                self.waiting[group].append([day, units])
+
+        result.unfilled_requests = result.requests - result.filled_requests
+        result.still_waiting = sum(len(queue) for queue in self.waiting)
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def _drain_waiting(self, group, day):
+        """Fill queued requests for a group in arrival order while stock allows"""
+        queue = self.waiting[group]
+        result = self.result
+        while queue and self.policy.can_fill(self.state, group, queue[0][1]):
+            request_day, units = queue.popleft()
+            result.filled_units += self.policy.fill(self.state, group, units)
+            result.filled_requests += 1
+            wait = day - request_day
+            result.total_wait_days += wait
+            if wait > result.max_wait_days:
+                result.max_wait_days = wait
+
+
+def _stream(queryset, kind, chunk_size):
+    for event_date, bloodgroup, units in queryset.iterator(chunk_size=chunk_size):
+        group = GROUP_INDEX.get(bloodgroup)
+        if group is None or not units:
+            continue
+        yield (event_date.toordinal(), kind, group, units)
+
+
+def history_events(start=None, end=None, donation_statuses=('Approved',), chunk_size=5000):
+    """
+    Merge BloodDonate and BloodRequest history into one date-ordered stream
+
+    Both tables are read with ``values_list`` and ``iterator`` so only a
+    chunk of tuples is held in memory at a time.
+    """
+    from donor.models import BloodDonate
+    from .models import BloodRequest
+
+    donations = BloodDonate.objects.filter(status__in=donation_statuses)
+    requests = BloodRequest.objects.all()
+    if start:
+        donations = donations.filter(date__gte=start)
+        requests = requests.filter(date__gte=start)
+    if end:
+        donations = donations.filter(date__lte=end)
+        requests = requests.filter(date__lte=end)
+
+    donations = donations.order_by('date', 'id').values_list('date', 'bloodgroup', 'unit')
+    requests = requests.order_by('date', 'id').values_list('date', 'bloodgroup', 'unit')
+
+    return heapq.merge(
+        _stream(donations, DONATION, chunk_size),
+        _stream(requests, REQUEST, chunk_size),
+        key=lambda event: (event[0], event[1]),
+    )
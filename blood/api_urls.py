@@ -1,5 +1,5 @@
 from django.urls import path
-from . import api_views
+from . import api_views, stream_views
 
 app_name = 'blood_api'
 
@@ -7,10 +7,16 @@ urlpatterns = [
     # Hospital location APIs
     path('nearby-hospitals/', api_views.nearby_hospitals, name='nearby_hospitals'),
     path('blood-stock/', api_views.blood_stock_summary, name='blood_stock_summary'),
+    path('blood-stock/stream/', stream_views.blood_stock_stream, name='blood_stock_stream'),
     
     # Notification APIs
     path('notify-hospitals/', api_views.notify_hospitals, name='notify_hospitals'),
     path('notification-status/<int:job_id>/', api_views.notification_status, name='notification_status'),
+    path('notification-status/<int:job_id>/stream/', stream_views.notification_status_stream, name='notification_status_stream'),
+    path('notification-status/<int:job_id>/wait/', stream_views.notification_status_wait, name='notification_status_wait'),
+    
+    # Certificate APIs
+    path('certificates/<str:certificate_id>/verify/', api_views.verify_certificate, name='verify_certificate'),
     
     # Staff APIs
     path('hospitals/<int:hospital_id>/update-stock/', api_views.update_hospital_stock, name='update_hospital_stock'),
@@ -1,30 +1,35 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import Throttled
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.utils.cache import patch_cache_control
 from django.utils import timezone
 from django.db.models import Q
 from decimal import Decimal
 import json
 import logging
 
-from .models import Hospital, Stock, NotificationJob
+from .models import BLOOD_GROUPS, Hospital, NotificationJob
+from . import conditional
+from . import stock as stock_service
+from . import throttling, verification
+from .throttling import AnonThrottle, NotificationDayThrottle, NotificationHourThrottle
 from .serializers import HospitalSerializer, NotificationJobSerializer
-from .tasks import send_hospital_notifications
 
 logger = logging.getLogger(__name__)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-@cache_page(60 * 5)  # Cache for 5 minutes
+@condition(etag_func=conditional.nearby_hospitals_etag)
+@cache_control(private=True, no_cache=True)  # Revalidate with If-None-Match
 def nearby_hospitals(request):
     """
     API endpoint to find nearby hospitals within a specified radius
@@ -38,7 +43,10 @@ def nearby_hospitals(request):
     - List of hospitals sorted by distance
     - Blood stock information for each hospital
     - Distance from user location
-    - Last updated timestamp
+    - Stock version the badges were read at
+    
+    Answers 304 when the hospital table and stock are unchanged since the
+    client's ETag for the same search.
     """
     try:
         # Get and validate parameters
@@ -101,10 +109,6 @@ def nearby_hospitals(request):
         # Serialize data
         serializer = HospitalSerializer(nearby_hospitals, many=True)
         
-        # Get last stock update time
-        last_stock_update = Stock.objects.order_by('-id').first()
-        last_updated = last_stock_update.id if last_stock_update else None
-        
         return Response({
             'hospitals': serializer.data,
             'total_found': len(nearby_hospitals),
@@ -113,8 +117,7 @@ def nearby_hospitals(request):
                 'latitude': float(user_lat),
                 'longitude': float(user_lng)
             },
-            'last_updated': timezone.now().isoformat(),
-            'stock_last_updated': last_updated
+            'stock_version': stock_service.get_version()
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -140,18 +143,11 @@ def notify_hospitals(request):
     Returns:
     - Notification job ID
     - Status information
+    
+    Limited to NOTIFICATION_RATE_LIMIT_PER_HOUR and NOTIFICATION_RATE_LIMIT_PER_DAY
+    valid requests per user (429 with code RATE_LIMIT_EXCEEDED); see blood.throttling.
     """
     try:
-        # Rate limiting check (max 5 requests per hour per user)
-        cache_key = f"notification_rate_limit_{request.user.id}"
-        current_requests = cache.get(cache_key, 0)
-        
-        if current_requests >= 5:
-            return Response({
-                'error': 'Rate limit exceeded. Maximum 5 notification requests per hour.',
-                'code': 'RATE_LIMIT_EXCEEDED'
-            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-        
         # Parse request data
         data = json.loads(request.body) if request.body else {}
         
@@ -164,6 +160,8 @@ def notify_hospitals(request):
                 'code': 'VALIDATION_ERROR'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        throttling.check(request, [NotificationHourThrottle, NotificationDayThrottle])
+        
         # Create notification job
         notification_job = NotificationJob.objects.create(
             user=request.user,
@@ -173,33 +171,17 @@ def notify_hospitals(request):
             notification_type=serializer.validated_data.get('notification_type', 'BOTH')
         )
         
-        # Increment rate limit counter
-        cache.set(cache_key, current_requests + 1, 3600)  # 1 hour
+        # Queue background task for sending notifications, batched with nearby requests;
+        # without Celery it is sent by this process's own queue (blood.background)
+        from .fanout import schedule
+        schedule(notification_job.id)
         
-        # Queue background task for sending notifications
-        try:
-            from .tasks import send_hospital_notifications
-            send_hospital_notifications.delay(notification_job.id)
-            
-            return Response({
-                'job_id': notification_job.id,
-                'status': 'queued',
-                'message': 'Notification request queued successfully',
-                'estimated_delivery': '2-5 minutes'
-            }, status=status.HTTP_201_CREATED)
-            
-        except ImportError:
-            # Fallback if Celery is not available - process synchronously
-            logger.warning("Celery not available, processing notification synchronously")
-            from .tasks import process_notification_sync
-            result = process_notification_sync(notification_job.id)
-            
-            return Response({
-                'job_id': notification_job.id,
-                'status': 'completed' if result else 'failed',
-                'message': 'Notification processed',
-                'processed_synchronously': True
-            }, status=status.HTTP_201_CREATED)
+        return Response({
+            'job_id': notification_job.id,
+            'status': 'queued',
+            'message': 'Notification request queued successfully',
+            'estimated_delivery': '2-5 minutes'
+        }, status=status.HTTP_201_CREATED)
         
     except json.JSONDecodeError:
         return Response({
@@ -207,6 +189,9 @@ def notify_hospitals(request):
             'code': 'INVALID_JSON'
         }, status=status.HTTP_400_BAD_REQUEST)
         
+    except Throttled:
+        raise
+        
     except Exception as e:
         logger.error(f"Error in notify_hospitals API: {str(e)}")
         return Response({
@@ -217,6 +202,11 @@ def notify_hospitals(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condition(
+    etag_func=conditional.notification_status_etag,
+    last_modified_func=conditional.notification_status_last_modified
+)
+@cache_control(private=True, no_cache=True)
 def notification_status(request, job_id):
     """
     API endpoint to check notification job status
@@ -224,6 +214,8 @@ def notification_status(request, job_id):
     Returns:
     - Job status and details
     - Error information if failed
+    
+    Answers 304 while the job's updated_at is unchanged.
     """
     try:
         notification_job = NotificationJob.objects.get(
@@ -252,6 +244,11 @@ def notification_status(request, job_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condition(
+    etag_func=conditional.blood_stock_etag,
+    last_modified_func=conditional.blood_stock_last_modified
+)
+@cache_control(private=True, no_cache=True)
 def blood_stock_summary(request):
     """
     API endpoint to get current blood stock summary
@@ -259,25 +256,27 @@ def blood_stock_summary(request):
     Returns:
     - Blood stock by type
     - Total units available
-    - Last updated timestamp
+    - Time of the last stock write
+    
+    Answers 304 while the stock version is unchanged.
     """
     try:
-        stocks = Stock.objects.all()
         stock_data = {}
         total_units = 0
+        last_updated = stock_service.last_modified()
         
-        for stock in stocks:
-            stock_data[stock.bloodgroup] = {
-                'units': stock.unit,
-                'available': stock.unit > 0,
-                'status': 'available' if stock.unit > 10 else 'low' if stock.unit > 0 else 'unavailable'
+        for bloodgroup, units in stock_service.as_dict().items():
+            stock_data[bloodgroup] = {
+                'units': units,
+                'available': units > 0,
+                'status': 'available' if units > 10 else 'low' if units > 0 else 'unavailable'
             }
-            total_units += stock.unit
+            total_units += units
         
         return Response({
             'blood_stock': stock_data,
             'total_units': total_units,
-            'last_updated': timezone.now().isoformat(),
+            'last_updated': last_updated.isoformat() if last_updated else None,
             'blood_types_count': len(stock_data)
         }, status=status.HTTP_200_OK)
         
@@ -318,17 +317,18 @@ def update_hospital_stock(request, hospital_id):
                 'code': 'MISSING_FIELDS'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        stock, created = Stock.objects.get_or_create(
-            bloodgroup=blood_group,
-            defaults={'unit': 0}
-        )
-        stock.unit = max(0, int(units))  # Ensure non-negative
-        stock.save()
+        if blood_group not in BLOOD_GROUPS:
+            return Response({
+                'error': f'blood_group must be one of {", ".join(BLOOD_GROUPS)}',
+                'code': 'INVALID_BLOOD_GROUP'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        stock_service.set_units(blood_group, units)  # Clamped to non-negative
         
         return Response({
             'message': f'Stock updated for {hospital.name}',
             'blood_group': blood_group,
-            'new_units': stock.unit
+            'new_units': stock_service.get_units(blood_group)
         }, status=status.HTTP_200_OK)
         
     except Hospital.DoesNotExist:
@@ -342,4 +342,39 @@ def update_hospital_stock(request, hospital_id):
         return Response({
             'error': 'Internal server error',
             'code': 'SERVER_ERROR'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class CertificateVerifyThrottle(AnonThrottle):
+    """Per-IP limit on public certificate checks (REST_FRAMEWORK throttle rate 'certificate_verify')"""
+    scope = 'certificate_verify'
+
+
+@api_view(['GET'])
+@authentication_classes([])  # Public: no session lookup per scan
+@permission_classes([AllowAny])
+@throttle_classes([CertificateVerifyThrottle])
+def verify_certificate(request, certificate_id):
+    """
+    Public endpoint to check a certificate by its ID (the target of the PDF's QR code)
+    
+    Returns:
+    - valid: True
+    - certificate: type, title, donor first name and last initial, donation count, issue date
+    - signature: the certificate fields signed with the site key
+    
+    Unknown IDs answer 404. Results are served from cache; see blood.verification.
+    """
+    result = verification.verify(certificate_id)
+    if result is None:
+        response = Response({
+            'valid': False,
+            'error': 'Certificate not found',
+            'code': 'CERTIFICATE_NOT_FOUND'
+        }, status=status.HTTP_404_NOT_FOUND)
+        patch_cache_control(response, public=True, max_age=verification.UNKNOWN_CACHE_TIMEOUT)
+        return response
+    
+    response = Response(result, status=status.HTTP_200_OK)
+    patch_cache_control(response, public=True, max_age=verification.VERIFIED_CACHE_TIMEOUT)
+    return response
@@ -1,5 +1,47 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_migrate, post_save, post_delete
 
 
 class BloodConfig(AppConfig):
     name = 'blood'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from donor.models import Donor
+        from patient.models import Patient
+        from . import conditional, job_status, profiles, roles, search, stock, verification, versions
+        from .models import BloodRequest, Certificate, Hospital, NotificationJob, Stock
+
+        post_migrate.connect(versions.create_cache_table, sender=self)
+        post_migrate.connect(stock.seed_stock, sender=self)
+        post_migrate.connect(search.tables_changed, sender=self)
+        post_save.connect(stock.stock_changed, sender=Stock)
+        post_delete.connect(stock.stock_changed, sender=Stock)
+        post_save.connect(conditional.hospitals_changed, sender=Hospital)
+        post_delete.connect(conditional.hospitals_changed, sender=Hospital)
+
+        post_save.connect(search.donor_saved, sender=Donor)
+        post_save.connect(search.patient_saved, sender=Patient)
+        post_save.connect(search.request_saved, sender=BloodRequest)
+        post_save.connect(search.user_saved, sender=User)
+        post_delete.connect(search.donor_deleted, sender=Donor)
+        post_delete.connect(search.patient_deleted, sender=Patient)
+        post_delete.connect(search.request_deleted, sender=BloodRequest)
+
+        post_save.connect(roles.profile_changed, sender=Donor)
+        post_save.connect(roles.profile_changed, sender=Patient)
+        post_delete.connect(roles.profile_changed, sender=Donor)
+        post_delete.connect(roles.profile_changed, sender=Patient)
+        post_save.connect(roles.user_changed, sender=User)
+        m2m_changed.connect(roles.groups_changed, sender=User.groups.through)
+
+        post_save.connect(profiles.profile_changed, sender=Donor)
+        post_save.connect(profiles.profile_changed, sender=Patient)
+        post_delete.connect(profiles.profile_changed, sender=Donor)
+        post_delete.connect(profiles.profile_changed, sender=Patient)
+        post_save.connect(profiles.user_changed, sender=User)
+
+        post_save.connect(verification.certificate_changed, sender=Certificate)
+        post_delete.connect(verification.certificate_changed, sender=Certificate)
+
+        post_save.connect(job_status.job_saved, sender=NotificationJob)
@@ -0,0 +1,274 @@
+"""
+In-process notification queue, for running without a Celery broker
+
+Without a broker, notify_hospitals used to send a job's email inside the
+request, so the response waited on SMTP. Jobs now go to LocalQueue
+instead: a bounded queue drained by a few daemon threads of the web
+process, and the request returns 201 at once.
+
+The queue is only memory; the job rows are the durable record. A queued
+job stays PENDING in the database until a thread claims it with an atomic
+PENDING -> PROCESSING update, so:
+
+- after a restart, start() re-queues every PENDING job, first resetting
+  jobs left in PROCESSING by a process that died (untouched for
+  STALE_AFTER);
+- when several web processes share the database, exactly one of them
+  claims each job;
+- a job that does not fit in a full queue waits in the database for the
+  next sweep, which runs whenever a thread has been idle SWEEP_INTERVAL.
+
+Jobs run through tasks.run_notification_job, like the Celery task: SMS
+and email per the job's notification_type and, after an error, up to
+max_retries more attempts 2^n minutes apart, here on a timer. At exit
+the queue stops taking jobs and finishes the queued ones for up to
+SHUTDOWN_TIMEOUT; whatever is left, including jobs waiting to retry, is
+PENDING again for the next start.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import NotificationJob
+
+logger = logging.getLogger(__name__)
+
+# Threads sending notifications per process, unless NOTIFICATION_LOCAL_WORKERS is set
+DEFAULT_WORKERS = 2
+
+# Jobs held in memory per process, unless NOTIFICATION_LOCAL_QUEUE_SIZE is set
+DEFAULT_QUEUE_SIZE = 1000
+
+# Idle seconds between sweeps for PENDING jobs
+SWEEP_INTERVAL = 60
+
+# PROCESSING jobs untouched this long belonged to a process that died.
+# Longer than the longest retry wait (2^max_retries minutes).
+STALE_AFTER = timedelta(minutes=15)
+
+# Seconds spent finishing queued jobs at exit
+SHUTDOWN_TIMEOUT = 10
+
+
+def use_celery():
+    """Whether notification jobs go to Celery (NOTIFICATION_USE_CELERY)"""
+    from .tasks import CELERY_AVAILABLE
+    return CELERY_AVAILABLE and getattr(settings, 'NOTIFICATION_USE_CELERY', False)
+
+
+class LocalQueue:
+    """
+    Bounded queue of notification job ids with its own worker threads
+
+    Args:
+        workers: threads sending notifications
+        maxsize: job ids held at once
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, maxsize=DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize)
+        self.threads = []
+        self.retrying = {}
+        self.stopping = threading.Event()
+        self.deadline = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the threads and queue every PENDING job; later calls do nothing"""
+        with self.lock:
+            if self.threads or self.stopping.is_set():
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'notification-local-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        self._safely(self.recover)
+
+    def put(self, job_id, retry=False):
+        """Queue a job id; False when stopping or full (the job then waits for a sweep)"""
+        if self.stopping.is_set():
+            return False
+        try:
+            self.queue.put_nowait((job_id, retry))
+            return True
+        except queue.Full:
+            logger.warning(f"Notification queue full, NotificationJob {job_id} waits for the next sweep")
+            return False
+
+    def recover(self):
+        """
+        Queue every PENDING job, oldest first, after resetting abandoned ones
+
+        Returns:
+            int: jobs queued
+        """
+        now = timezone.now()
+        NotificationJob.objects.filter(
+            status='PROCESSING', updated_at__lt=now - STALE_AFTER
+        ).exclude(pk__in=list(self.retrying)).update(status='PENDING', updated_at=now)
+        pending = NotificationJob.objects.filter(status='PENDING').order_by('created_at')
+        queued = 0
+        for job_id in pending.values_list('pk', flat=True)[:self.queue.maxsize]:
+            if not self.put(job_id):
+                break
+            queued += 1
+        return queued
+
+    def claim(self, job_id, retry=False):
+        """Take a PENDING job, or one of ours waiting to retry; False if another thread or process has it"""
+        queryset = NotificationJob.objects.filter(pk=job_id, status='PROCESSING' if retry else 'PENDING')
+        return bool(queryset.update(status='PROCESSING', updated_at=timezone.now()))
+
+    def process(self, job_id, retry=False):
+        """
+        Claim and send one job, scheduling a retry if sending raised
+
+        Returns:
+            dict: the job's result, or None when it was not claimed
+        """
+        from .tasks import retry_countdown, run_notification_job
+
+        if not self.claim(job_id, retry):
+            return None
+        try:
+            job = NotificationJob.objects.select_related('user').get(pk=job_id)
+            return run_notification_job(job)
+        except Exception as e:
+            logger.error(f"Error sending NotificationJob {job_id} in-process: {str(e)}")
+            job = NotificationJob.objects.get(pk=job_id)
+            countdown = retry_countdown(job)
+            if countdown is None:
+                job.mark_failed(str(e))
+            elif self.stopping.is_set():
+                # The next start retries it
+                NotificationJob.objects.filter(pk=job_id).update(status='PENDING')
+            else:
+                self.retry_later(job_id, countdown)
+            return {'status': 'failed', 'reason': str(e)}
+
+    def retry_later(self, job_id, countdown):
+        timer = threading.Timer(countdown, self._retry, args=(job_id,))
+        timer.daemon = True
+        with self.lock:
+            self.retrying[job_id] = timer
+        timer.start()
+
+    def _retry(self, job_id):
+        with self.lock:
+            self.retrying.pop(job_id, None)
+        self.put(job_id, retry=True)
+
+    def _safely(self, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"Error in notification queue: {str(e)}")
+        finally:
+            # Threads of this queue must not hold database connections between jobs
+            if threading.current_thread() in self.threads:
+                connections.close_all()
+
+    def _run(self):
+        while True:
+            stopping = self.stopping.is_set()
+            if stopping and time.monotonic() >= self.deadline:
+                return
+            try:
+                item = self.queue.get(timeout=0.1 if stopping else SWEEP_INTERVAL)
+            except queue.Empty:
+                if stopping:
+                    return
+                self._safely(self.recover)
+                continue
+            if item is None:
+                # Put there by stop() behind every queued job; pass it on to the next thread
+                self.queue.task_done()
+                self._wake()
+                return
+            try:
+                self._safely(self.process, *item)
+            finally:
+                self.queue.task_done()
+
+    def _wake(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Stop taking jobs and finish the queued ones for up to ``timeout`` seconds
+
+        Jobs waiting to retry go back to PENDING so the next start sends them.
+        """
+        with self.lock:
+            self.deadline = time.monotonic() + timeout
+            self.stopping.set()
+            retrying, self.retrying = self.retrying, {}
+        for timer in retrying.values():
+            timer.cancel()
+        self._wake()
+        for thread in self.threads:
+            thread.join(max(0.0, self.deadline - time.monotonic()))
+
+        # Retries still queued when time ran out are ours too
+        retry_ids = list(retrying)
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1]:
+                retry_ids.append(item[0])
+        if retry_ids:
+            self._safely(partial(
+                NotificationJob.objects.filter(pk__in=retry_ids, status='PROCESSING').update, status='PENDING'
+            ))
+
+
+_lock = threading.Lock()
+_queue = None
+_pid = None
+
+
+def get_queue():
+    """This process's queue, started on first use"""
+    global _queue, _pid
+    with _lock:
+        if _queue is None or _pid != os.getpid():
+            # A forked child inherits the object but not its threads
+            _queue = LocalQueue(
+                workers=getattr(settings, 'NOTIFICATION_LOCAL_WORKERS', DEFAULT_WORKERS),
+                maxsize=getattr(settings, 'NOTIFICATION_LOCAL_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+            )
+            _pid = os.getpid()
+            atexit.register(_queue.stop)
+        local_queue = _queue
+    local_queue.start()
+    return local_queue
+
+
+def _put(job_id):
+    get_queue().put(job_id)
+
+
+def enqueue(job_id):
+    """Queue a job in this process once the transaction that created it commits"""
+    transaction.on_commit(partial(_put, job_id))
+
+
+def start_if_local():
+    """Start the queue at server start-up when jobs do not go to Celery, re-queueing leftovers"""
+    if not use_celery():
+        get_queue()
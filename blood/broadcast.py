@@ -0,0 +1,163 @@
+"""
+Live stock update broadcaster
+
+A single broadcaster per process fans compact stock deltas out to every
+Server-Sent Events subscriber. Subscribers are asyncio queues read by async
+views, so idle dashboard connections cost a queue rather than a worker
+thread. Writes made in this process are pushed as soon as they commit,
+through the stock service listener hook; writes from other processes are
+picked up by one poller that watches the stock version shared by every
+process (blood.versions).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from .models import BLOOD_GROUPS
+from . import stock as stock_service
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the shared stock version for cross-process writes
+POLL_INTERVAL = 2.0
+# Seconds of silence before a keep-alive comment is sent
+HEARTBEAT_INTERVAL = 25.0
+# Streams are closed after this many seconds; EventSource reconnects on its own
+MAX_STREAM_SECONDS = 600
+# Client reconnect delay advertised to EventSource, in milliseconds
+RETRY_MS = 3000
+# Undelivered messages per subscriber before it is resynced with a full snapshot
+QUEUE_SIZE = 32
+
+
+def format_event(event, payload):
+    """Encode one SSE message with a compact JSON body"""
+    data = json.dumps(payload, separators=(',', ':'))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class StockBroadcaster:
+    """Fan-out of stock changes to SSE subscribers in this process"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # queue -> event loop that owns it
+        self._units = None
+        self._version = None
+        self._poller = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """Register a queue for the running event loop and start the poller if needed"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = loop
+            if self._poller is None or self._poller.done():
+                self._poller = loop.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def snapshot_event(self):
+        return format_event('snapshot', {
+            'v': self._version,
+            'stock': dict(zip(BLOOD_GROUPS, self._units or ())),
+        })
+
+    def publish(self, version, units):
+        """
+        Compute the delta against the last published state and fan it out
+
+        Safe to call from any thread.
+        """
+        with self._lock:
+            if version == self._version:
+                return
+            previous = self._units
+            self._units = tuple(units)
+            self._version = version
+            subscribers = list(self._subscribers.items())
+
+        if previous is None or not subscribers:
+            # Nobody has seen an earlier state; new streams start from a snapshot
+            return
+        delta = {
+            group: units
+            for group, units, old in zip(BLOOD_GROUPS, self._units, previous)
+            if units != old
+        }
+        if not delta:
+            return
+
+        message = format_event('delta', {'v': version, 'd': delta})
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # Loop already closed; the stream's cleanup will unsubscribe it
+                pass
+
+    def _offer(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client: drop the backlog and resend the full state instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.snapshot_event())
+
+    def stock_written(self, version):
+        """Stock service listener: push writes made in this process straight away"""
+        if not self._subscribers:
+            return
+        self.publish(version, stock_service.snapshot())
+
+    async def _refresh(self):
+        version = await sync_to_async(stock_service.get_version)()
+        if version != self._version:
+            units = await sync_to_async(stock_service.snapshot)()
+            self.publish(version, units)
+
+    async def _poll(self):
+        """Pick up writes made by other processes while anyone is listening"""
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._refresh()
+            except Exception as e:
+                logger.error(f"Stock broadcaster poll failed: {str(e)}")
+
+    async def stream(self, max_seconds=MAX_STREAM_SECONDS, heartbeat=HEARTBEAT_INTERVAL):
+        """Async generator of SSE messages for one client"""
+        queue = self.subscribe()
+        try:
+            await self._refresh()
+            yield f"retry: {RETRY_MS}\n\n"
+            yield self.snapshot_event()
+
+            deadline = time.monotonic() + max_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+
+broadcaster = StockBroadcaster()
+stock_service.add_listener(broadcaster.stock_written)
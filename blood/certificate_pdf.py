@@ -0,0 +1,457 @@
+"""
+Certificate PDF rendering and storage
+
+A certificate's PDF is rendered once, the first time it is needed, and
+kept in media storage as certificates/<certificate_id>-<hash>.pdf. The
+SHA-256 of the file is stored on the Certificate and doubles as the
+download ETag. Certificates do not change after issue, so later downloads
+are served straight from storage; render_certificates pre-renders the
+ones still missing.
+
+Rendering is CPU-bound, so many certificates at once (a camp closing, a
+backfill) are spread over processes: Celery workers when a broker is
+configured, otherwise a local spawn pool (see blood.workers). Workers
+only turn plain field values into PDF bytes; storage and database writes
+stay in the calling process.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from . import verification
+from .workers import default_workers, process_pool, split
+
+# Optional imports for PDF generation
+try:
+    from reportlab import rl_config
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+    # Embed image streams as binary: ASCII85-encoding the background in
+    # pure Python took longer than everything else in a render put together
+    rl_config.useA85 = 0
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = 'certificates'
+
+# Certificates per queued Celery task
+CELERY_BATCH_SIZE = 20
+
+# Resolution the background pattern is resampled to for an A4 page
+BACKGROUND_DPI = 150
+
+# Printed size of the verification QR code, in points
+QR_SIZE = 80
+
+
+def build_styles():
+    """Paragraph styles of the certificate layout"""
+    # Custom styles based on your cer.py design
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'title',
+            parent=styles['Title'],
+            alignment=TA_CENTER,
+            fontSize=34,
+            textColor=colors.HexColor("#002366"),  # Navy Blue
+            spaceAfter=30
+        ),
+        'name': ParagraphStyle(
+            'name',
+            parent=styles['Title'],
+            alignment=TA_CENTER,
+            fontSize=26,
+            textColor=colors.HexColor("#B22222"),  # Blood Red
+            spaceAfter=25
+        ),
+        'subtitle': ParagraphStyle(
+            'subtitle',
+            parent=styles['Normal'],
+            alignment=TA_CENTER,
+            fontSize=16,
+            textColor=colors.black,
+            spaceAfter=15
+        ),
+        'certificate_info': ParagraphStyle(
+            'certificate_info',
+            parent=styles['Normal'],
+            alignment=TA_CENTER,
+            fontSize=8,
+            textColor=colors.HexColor("#5E4E1B"),
+            spaceAfter=10
+        ),
+    }
+
+
+# Styles are immutable once built, so every render shares one set
+STYLES = build_styles() if REPORTLAB_AVAILABLE else None
+
+
+def pattern_path():
+    """Full-resolution background pattern shipped with the static files"""
+    return os.path.join(settings.STATICFILES_DIRS[0], 'images', 'certificates', 'pattern.jpg')
+
+
+_background_lock = threading.Lock()
+_background = {}
+
+
+def _rasterize_background(source):
+    """
+    Resample the pattern to the page at BACKGROUND_DPI and cache it as a JPEG
+
+    The cached file is keyed on the source's size and mtime and shared by
+    every process on the machine; it is written under a temporary name and
+    moved into place so readers never see a partial file.
+    """
+    stat = os.stat(source)
+    target = os.path.join(
+        tempfile.gettempdir(),
+        f'blood-certificate-bg-{stat.st_size}-{int(stat.st_mtime)}-{BACKGROUND_DPI}.jpg'
+    )
+    if not os.path.exists(target):
+        size = (round(A4[0] / 72 * BACKGROUND_DPI), round(A4[1] / 72 * BACKGROUND_DPI))
+        with Image.open(source) as image:
+            page = image.convert('RGB').resize(size, Image.LANCZOS)
+        fd, partial = tempfile.mkstemp(suffix='.jpg', dir=os.path.dirname(target))
+        with os.fdopen(fd, 'wb') as f:
+            page.save(f, 'JPEG', quality=85, optimize=True)
+        os.replace(partial, target)
+    return target
+
+
+def background_template():
+    """
+    Path of the page background, prepared once per process
+
+    Returns:
+        str: the resampled background, the original pattern if it cannot be
+        resampled, or None when there is no pattern to draw
+    """
+    source = pattern_path()
+    with _background_lock:
+        if source not in _background:
+            template = None
+            if os.path.exists(source):
+                template = source
+                if PIL_AVAILABLE:
+                    try:
+                        template = _rasterize_background(source)
+                    except Exception as e:
+                        logger.error(f"Could not prepare certificate background: {str(e)}")
+            _background[source] = template
+        return _background[source]
+
+
+def draw_certificate_background(canv, doc):
+    """Custom background drawer for certificate PDF"""
+    width, height = A4
+    background = background_template()
+    
+    if background:
+        try:
+            # ReportLab embeds a file drawn by path once per document
+            canv.drawImage(background, 0, 0, width=width, height=height, mask='auto')
+            return
+        except Exception:
+            pass
+    # Fallback gradient background
+    canv.setFillColor(colors.HexColor("#fef2f2"))
+    canv.rect(0, 0, width, height, fill=1)
+
+
+def verification_qr(url, size=QR_SIZE):
+    """Centred QR code flowable encoding the certificate's verification URL"""
+    widget = QrCodeWidget(url, barLevel='M')
+    x1, y1, x2, y2 = widget.getBounds()
+    drawing = Drawing(size, size, transform=[size / (x2 - x1), 0, 0, size / (y2 - y1), 0, 0])
+    drawing.add(widget)
+    drawing.hAlign = 'CENTER'
+    return drawing
+
+
+def pdf_fields(certificate):
+    """Plain values a certificate is rendered from, safe to send to another process"""
+    return {
+        'certificate_id': certificate.certificate_id,
+        'donor_name': certificate.donor.get_name,
+        'title': certificate.get_certificate_type_display(),
+        'donation_count': certificate.donation_count,
+        'issued_date': certificate.issued_date,
+        'verify_url': verification.verify_url(certificate.certificate_id),
+    }
+
+
+def render_pdf(certificate):
+    """
+    Render a certificate as PDF
+
+    Args:
+        certificate: Certificate, ideally with donor__user selected
+
+    Returns:
+        bytes: the PDF document
+    """
+    return render_fields(pdf_fields(certificate))
+
+
+def render_fields(fields, styles=None, on_page=draw_certificate_background):
+    """
+    Render a certificate PDF from pdf_fields() values
+
+    ``styles`` and ``on_page`` default to the shared STYLES and the cached
+    background; the benchmark overrides them to time the old behaviour.
+    """
+    # Paragraph text is markup: names like "Tom & <Jerry>" must be escaped to render
+    styles = styles or STYLES
+    title_style = styles['title']
+    name_style = styles['name']
+    subtitle_style = styles['subtitle']
+    certificate_info_style = styles['certificate_info']
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    
+    # Certificate content
+    elements = []
+    elements.append(Spacer(1, 100))
+    elements.append(Paragraph("BLOOD DONATION", title_style))
+    elements.append(Paragraph("CERTIFICATE", title_style))
+    elements.append(Spacer(1, 40))
+    
+    elements.append(Paragraph("This is to certify that", subtitle_style))
+    elements.append(Paragraph(f"<b>{escape(fields['donor_name'])}</b>", name_style))
+    elements.append(Paragraph("has been recognized as a", subtitle_style))
+    elements.append(Paragraph(f"<b>{escape(fields['title'])}</b>", subtitle_style))
+    elements.append(Paragraph(f"for <b>{fields['donation_count']} successful blood donation{'s' if fields['donation_count'] > 1 else ''}</b>", subtitle_style))
+    
+    elements.append(Spacer(1, 60))
+    elements.append(Paragraph(f"Certificate ID: {escape(fields['certificate_id'])}", certificate_info_style))
+    elements.append(Paragraph(f"Issued Date: {fields['issued_date'].strftime('%B %d, %Y')}", certificate_info_style))
+    
+    if fields.get('verify_url'):
+        elements.append(Spacer(1, 10))
+        elements.append(verification_qr(fields['verify_url']))
+        elements.append(Paragraph("Scan to verify this certificate", certificate_info_style))
+        elements.append(Spacer(1, 20))
+    else:
+        elements.append(Spacer(1, 80))
+    elements.append(Paragraph("<b>Thank you for saving lives through blood donation!</b>", subtitle_style))
+    
+    # Build PDF with custom background
+    doc.build(elements, onFirstPage=on_page, onLaterPages=on_page)
+    return buffer.getvalue()
+
+
+def store_pdf(certificate, pdf):
+    """
+    Save a rendered PDF to media storage and record it on the certificate
+
+    If another process stored this certificate first, its file wins and
+    ours is discarded, so each certificate keeps exactly one file.
+    """
+    from .models import Certificate
+
+    digest = hashlib.sha256(pdf).hexdigest()
+    name = default_storage.save(f'{STORAGE_DIR}/{certificate.certificate_id}-{digest[:16]}.pdf', ContentFile(pdf))
+    claimed = Certificate.objects.filter(pk=certificate.pk, pdf='').update(pdf=name, pdf_sha256=digest)
+    if claimed:
+        certificate.pdf.name, certificate.pdf_sha256 = name, digest
+    else:
+        default_storage.delete(name)
+        certificate.pdf.name, certificate.pdf_sha256 = (
+            Certificate.objects.filter(pk=certificate.pk).values_list('pdf', 'pdf_sha256').get()
+        )
+    return certificate
+
+
+def ensure_pdf(certificate):
+    """Render and store the certificate's PDF unless storage already has it"""
+    if certificate.pdf and default_storage.exists(certificate.pdf.name):
+        return certificate
+    if certificate.pdf:
+        # File lost from storage: clear the stale name so it can be claimed again
+        logger.error(f"Certificate PDF missing from storage: {certificate.pdf.name}")
+        type(certificate).objects.filter(pk=certificate.pk).update(pdf='', pdf_sha256='')
+        certificate.pdf.name = ''
+    return store_pdf(certificate, render_pdf(certificate))
+
+
+def _render_safely(fields):
+    """render_fields() in a pool worker: (pdf, None), or (None, error) rather than failing the whole map"""
+    try:
+        return render_fields(fields), None
+    except Exception as e:
+        return None, str(e)
+
+
+def render_many(certificates, workers=None, on_error=None):
+    """
+    Render and store the PDFs of certificates that have none, in parallel
+
+    A certificate that cannot be rendered or stored is logged and skipped;
+    the others are still rendered.
+
+    Args:
+        certificates: Certificates with donor__user selected
+        workers: rendering processes (default: one per CPU, 0 or 1 to render inline)
+        on_error: callable(certificate, message), called for each one skipped
+
+    Returns:
+        int: number of PDFs rendered
+    """
+    def failed(certificate, message):
+        logger.error(f"Could not render certificate {certificate.certificate_id}: {message}")
+        if on_error is not None:
+            on_error(certificate, message)
+
+    pending = [certificate for certificate in certificates if not certificate.pdf]
+    workers = default_workers() if workers is None else workers
+    rendered = 0
+    if workers <= 1 or len(pending) < 2:
+        for certificate in pending:
+            try:
+                store_pdf(certificate, render_pdf(certificate))
+                rendered += 1
+            except Exception as e:
+                failed(certificate, str(e))
+        return rendered
+
+    fields = []
+    for certificate in list(pending):
+        try:
+            fields.append(pdf_fields(certificate))
+        except Exception as e:
+            pending.remove(certificate)
+            failed(certificate, str(e))
+    if not pending:
+        return rendered
+
+    workers = min(workers, len(pending))
+    chunksize = max(1, len(pending) // (workers * 4))
+    with process_pool(workers) as pool:
+        # Results come back in order, so storing overlaps with rendering
+        results = pool.map(_render_safely, fields, chunksize=chunksize)
+        for certificate, (pdf, error) in zip(pending, results):
+            if error is not None:
+                failed(certificate, error)
+                continue
+            try:
+                store_pdf(certificate, pdf)
+                rendered += 1
+            except Exception as e:
+                failed(certificate, str(e))
+    return rendered
+
+
+def render_ids(certificate_ids, workers=None, on_error=None):
+    """Load certificates by certificate_id and render the ones missing a PDF"""
+    from .models import Certificate
+
+    certificates = Certificate.objects.filter(certificate_id__in=certificate_ids, pdf='').select_related('donor__user')
+    return render_many(list(certificates), workers=workers, on_error=on_error)
+
+
+def _render_in_background(certificate_ids):
+    try:
+        render_ids(certificate_ids)
+    except Exception as e:
+        logger.error(f"Background certificate rendering failed: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def queue_rendering(certificate_ids):
+    """
+    Render certificates in the background so their first download is instant
+
+    Batches go to Celery when CERTIFICATE_RENDER_USE_CELERY is set; without
+    Celery, or if the broker refuses them, a thread drives a local process
+    pool instead.
+
+    Returns:
+        str: 'celery', 'local', or None when there was nothing to render
+    """
+    certificate_ids = list(certificate_ids)
+    if not certificate_ids or not REPORTLAB_AVAILABLE:
+        return None
+    from .tasks import CELERY_AVAILABLE, render_certificates
+
+    if CELERY_AVAILABLE and getattr(settings, 'CERTIFICATE_RENDER_USE_CELERY', False):
+        try:
+            for batch in split(certificate_ids, -(-len(certificate_ids) // CELERY_BATCH_SIZE)):
+                render_certificates.delay(batch)
+            return 'celery'
+        except Exception as e:
+            logger.error(f"Could not queue certificate rendering, rendering locally: {str(e)}")
+
+    threading.Thread(target=_render_in_background, args=(certificate_ids,), daemon=True).start()
+    return 'local'
+
+
+def write_zip(certificates, workers=None):
+    """
+    ZIP of many certificate PDFs, written to an anonymous temporary file
+
+    Missing PDFs are rendered first (in parallel), then each stored file is
+    copied into the archive in pieces, so neither the PDFs nor the archive
+    are ever held in memory. Certificates that cannot be rendered are left
+    out of the archive rather than failing the whole download.
+
+    Returns:
+        tuple: (archive, skipped) - the archive, rewound and deleted from disk
+        when closed, and the number of certificates left out
+    """
+    certificates = list(certificates)
+    render_many(certificates, workers=workers)
+
+    skipped = 0
+    archive = tempfile.TemporaryFile()
+    # PDFs are already compressed; deflating them again costs CPU for nothing
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for certificate in certificates:
+            if not certificate.pdf.name:
+                # render_many() has logged why
+                skipped += 1
+                continue
+            try:
+                try:
+                    source = certificate.pdf.open('rb')
+                except FileNotFoundError:
+                    source = ensure_pdf(certificate).pdf.open('rb')
+            except Exception as e:
+                logger.error(f"Could not add certificate {certificate.certificate_id} to ZIP: {str(e)}")
+                skipped += 1
+                continue
+            with source, bundle.open(f'certificate_{certificate.certificate_id}.pdf', 'w', force_zip64=True) as target:
+                shutil.copyfileobj(source, target)
+    if skipped:
+        logger.error(f"Certificate ZIP left out {skipped} of {len(certificates)} certificates")
+    archive.seek(0)
+    return archive, skipped
@@ -0,0 +1,213 @@
+"""
+Donation counters and certificate awarding
+
+Each donor carries a count of approved donations and a bitmask of the
+certificate tiers already awarded (bit i is Certificate.CERTIFICATE_TYPES[i]).
+Both are updated inside the approval transaction, so working out which
+certificates are due is one comparison against the thresholds below, and
+issuing them is at most one bulk insert. The counters of donors created
+before these fields existed are filled in by migration donor 0005;
+backfill_donation_counters recomputes them should they ever drift.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from donor.models import BloodDonate, Donor
+
+from . import certificate_pdf, profiles, verification
+from . import stock as stock_service
+from .models import Certificate
+
+# Approved donations needed for each tier, in CERTIFICATE_TYPES order
+TIER_THRESHOLDS = {
+    'FIRST_DONATION': 1,
+    'REGULAR_DONOR': 5,
+    'HERO_DONOR': 10,
+    'LIFE_SAVER': 20,
+    'BLOOD_CHAMPION': 50,
+}
+
+TIERS = [
+    (certificate_type, TIER_THRESHOLDS[certificate_type], 1 << bit)
+    for bit, (certificate_type, _) in enumerate(Certificate.CERTIFICATE_TYPES)
+]
+
+
+def tier_mask(certificate_types):
+    """Bitmask of the given certificate types"""
+    return sum(bit for certificate_type, _, bit in TIERS if certificate_type in certificate_types)
+
+
+def due_mask(approved_donations):
+    """Bitmask of every tier reached with this many approved donations"""
+    return sum(bit for _, threshold, bit in TIERS if approved_donations >= threshold)
+
+
+def next_tier(approved_donations):
+    """(certificate_type, threshold) of the next tier to reach, or None past the last one"""
+    for certificate_type, threshold, _ in TIERS:
+        if approved_donations < threshold:
+            return certificate_type, threshold
+    return None
+
+
+def _award(donor, approved_donations, awarded):
+    """Issue the certificates due but not yet awarded; call inside a transaction"""
+    missing = due_mask(approved_donations) & ~awarded
+    donor.approved_donations = approved_donations
+    donor.certificate_tiers = awarded | missing
+    if not missing:
+        return []
+    Donor.objects.filter(pk=donor.pk).update(certificate_tiers=donor.certificate_tiers)
+    new_types = [certificate_type for certificate_type, _, bit in TIERS if missing & bit]
+    # bulk_create skips save(), so certificate ids are set here
+    new_certificates = Certificate.objects.bulk_create([
+        Certificate(
+            donor_id=donor.pk, certificate_type=certificate_type, donation_count=approved_donations,
+            certificate_id=Certificate.make_certificate_id(donor.pk, certificate_type),
+        )
+        for certificate_type in new_types
+    ])
+    certificate_ids = [certificate.certificate_id for certificate in new_certificates]
+    # bulk_create skips post_save too: clear any cached "unknown" verification
+    transaction.on_commit(partial(verification.invalidate, certificate_ids))
+    # Have the PDFs ready before the donor first downloads them
+    transaction.on_commit(partial(certificate_pdf.queue_rendering, certificate_ids))
+    return new_types
+
+
+def _counters(donor_pk):
+    return Donor.objects.filter(pk=donor_pk).values_list('approved_donations', 'certificate_tiers').get()
+
+
+def record_approval(donor):
+    """
+    Count one more approved donation and award any certificates it unlocks
+
+    Args:
+        donor: Donor whose donation was approved; its counters are refreshed
+
+    Returns:
+        list: certificate types newly awarded
+    """
+    with transaction.atomic():
+        # The UPDATE takes the row lock, so concurrent approvals are serialised
+        Donor.objects.filter(pk=donor.pk).update(approved_donations=F('approved_donations') + 1)
+        new_types = _award(donor, *_counters(donor.pk))
+    # Queryset updates bypass post_save
+    profiles.invalidate(donor.user_id)
+    return new_types
+
+
+def record_unapproval(donor):
+    """Take back one approved donation; certificates already issued are kept"""
+    Donor.objects.filter(pk=donor.pk, approved_donations__gt=0).update(approved_donations=F('approved_donations') - 1)
+    donor.approved_donations = max(donor.approved_donations - 1, 0)
+    profiles.invalidate(donor.user_id)
+
+
+def approve_donation(donation):
+    """
+    Approve a donation once: add its units to stock and count it for the donor
+
+    The status is flipped with a conditional UPDATE, so of two concurrent
+    approvals (a double click, two admins) only one adds stock and awards
+    certificates; approving an approved donation changes nothing.
+
+    Returns:
+        list: certificate types newly awarded, or None if it was already approved
+    """
+    with transaction.atomic():
+        approved = BloodDonate.objects.filter(pk=donation.pk).exclude(status='Approved').update(status='Approved')
+        if not approved:
+            return None
+        donation.status = 'Approved'
+        stock_service.add_units(donation.bloodgroup, donation.unit)
+        return record_approval(donation.donor)
+
+
+def reject_donation(donation):
+    """Reject a donation, taking it off the donor's count if it had been approved"""
+    with transaction.atomic():
+        unapproved = BloodDonate.objects.filter(pk=donation.pk, status='Approved').update(status='Rejected')
+        if unapproved:
+            record_unapproval(donation.donor)
+        else:
+            BloodDonate.objects.filter(pk=donation.pk).update(status='Rejected')
+    donation.status = 'Rejected'
+
+
+def award_due(donor):
+    """
+    Award certificates the donor's current count already qualifies for
+
+    Needed only for donors whose tiers fell behind their count, e.g. after
+    a backfill; a no-op without queries when nothing is due.
+    """
+    if not due_mask(donor.approved_donations) & ~donor.certificate_tiers:
+        return []
+    with transaction.atomic():
+        new_types = _award(donor, *_counters(donor.pk))
+    profiles.invalidate(donor.user_id)
+    return new_types
+
+
+def backfill(batch_size=1000, award=False):
+    """
+    Recompute every donor's counters from their donations and certificates
+
+    Args:
+        batch_size: donors written per bulk update
+        award: also issue certificates for tiers already reached but missing
+
+    Returns:
+        tuple: (donors updated, certificates issued)
+    """
+    counts = dict(
+        BloodDonate.objects.filter(status='Approved').values('donor')
+        .annotate(total=Count('id')).values_list('donor', 'total')
+    )
+    bits = {certificate_type: bit for certificate_type, _, bit in TIERS}
+    held = {}
+    for donor_id, certificate_type in Certificate.objects.values_list('donor_id', 'certificate_type').iterator():
+        held[donor_id] = held.get(donor_id, 0) | bits.get(certificate_type, 0)
+
+    updated = issued = 0
+    changed, new_certificates = [], []
+
+    def flush():
+        with transaction.atomic():
+            Donor.objects.bulk_update(changed, ['approved_donations', 'certificate_tiers'])
+            Certificate.objects.bulk_create(new_certificates)
+        profiles.invalidate_many([donor.user_id for donor in changed])
+        changed.clear()
+        new_certificates.clear()
+
+    donors = Donor.objects.only('id', 'user_id', 'approved_donations', 'certificate_tiers')
+    for donor in donors.order_by('pk').iterator(chunk_size=batch_size):
+        approved_donations = counts.get(donor.id, 0)
+        awarded = held.get(donor.id, 0)
+        if award:
+            missing = due_mask(approved_donations) & ~awarded
+            for certificate_type, _, bit in TIERS:
+                if missing & bit:
+                    new_certificates.append(Certificate(
+                        donor_id=donor.id, certificate_type=certificate_type, donation_count=approved_donations,
+                        certificate_id=Certificate.make_certificate_id(donor.id, certificate_type),
+                    ))
+            awarded |= missing
+        if (donor.approved_donations, donor.certificate_tiers) == (approved_donations, awarded):
+            continue
+        donor.approved_donations = approved_donations
+        donor.certificate_tiers = awarded
+        changed.append(donor)
+        if len(changed) >= batch_size:
+            updated += len(changed)
+            issued += len(new_certificates)
+            flush()
+    updated += len(changed)
+    issued += len(new_certificates)
+    flush()
+    return updated, issued
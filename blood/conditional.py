@@ -0,0 +1,77 @@
+"""
+Validators for conditional GETs on the read APIs
+
+ETags are derived from data versions rather than from rendered bodies, so
+an unchanged resource is answered with 304 before any query for the
+payload or any serialization runs. These functions are passed to Django's
+``condition`` decorator and receive the same arguments as the view.
+
+The versions are shared by every worker process (blood.versions), so all
+of them hand out the same ETag for the same data, and never one ETag for
+different data.
+"""
+import hashlib
+from functools import partial
+
+from django.db import transaction
+
+from . import stock as stock_service
+from . import versions
+from .models import NotificationJob
+
+HOSPITAL_VERSION_KEY = 'blood:hospital_version'
+
+
+def hospital_version():
+    """Current shared version of the Hospital table"""
+    return versions.get(HOSPITAL_VERSION_KEY)
+
+
+def hospitals_changed(sender, **kwargs):
+    """Signal receiver: bump the hospital version once a save or delete commits"""
+    transaction.on_commit(partial(versions.bump, HOSPITAL_VERSION_KEY))
+
+
+def blood_stock_etag(request):
+    return f"stock-{stock_service.get_version()}"
+
+
+def blood_stock_last_modified(request):
+    return stock_service.last_modified()
+
+
+def nearby_hospitals_etag(request):
+    """Hospitals and their stock badges for one search; None when the search is incomplete"""
+    lat = request.GET.get('lat')
+    lng = request.GET.get('lng')
+    if not lat or not lng:
+        return None
+    radius_km = request.GET.get('radius_km', '10')
+    # Hash the raw parameters: they may contain commas or quotes, which are not valid in an ETag
+    search = hashlib.md5(f"{lat}|{lng}|{radius_km}".encode()).hexdigest()
+    return f"hospitals-{hospital_version()}-{stock_service.get_version()}-{search}"
+
+
+def _job_updated_at(request, job_id):
+    # Looked up once per request and shared by the ETag and Last-Modified callables
+    if not hasattr(request, '_job_updated_at'):
+        request._job_updated_at = NotificationJob.objects.filter(
+            id=job_id, user_id=request.user.id
+        ).values_list('updated_at', flat=True).first()
+    return request._job_updated_at
+
+
+def job_etag(job_id, updated_at):
+    """Version of a notification job; shared with the long-poll in blood.stream_views"""
+    return f"job-{job_id}-{updated_at.timestamp():.6f}"
+
+
+def notification_status_etag(request, job_id):
+    updated_at = _job_updated_at(request, job_id)
+    if updated_at is None:
+        return None
+    return job_etag(job_id, updated_at)
+
+
+def notification_status_last_modified(request, job_id):
+    return _job_updated_at(request, job_id)
@@ -0,0 +1,317 @@
+"""
+Streaming CSV and XLSX exports for reporting
+
+Each dataset is read with ``values_list(...).iterator(chunk_size=...)`` and
+encoded batch by batch straight into the response, so memory stays flat
+however many rows are exported. XLSX files are produced by writing the
+worksheet XML into a zip stream; no spreadsheet library is needed and the
+workbook is never held in memory.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+
+from .models import BLOOD_GROUPS
+
+# Rows fetched per database round trip and encoded per response chunk
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ExportError(ValueError):
+    """Invalid export request, reported to the client as a 400"""
+
+
+class ExportSpec:
+    """Columns and filterable fields of one exportable dataset"""
+
+    def __init__(self, name, model, columns, date_field, status_field=None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.date_field = date_field
+        self.status_field = status_field
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def queryset(self, filters):
+        model = self.model()
+        queryset = model.objects.all()
+        if filters.get('start'):
+            queryset = queryset.filter(**{f'{self.date_field}__gte': filters['start']})
+        if filters.get('end'):
+            queryset = queryset.filter(**{f'{self.date_field}__lte': filters['end']})
+        if filters.get('status'):
+            queryset = queryset.filter(**{self.status_field: filters['status']})
+        if filters.get('bloodgroup'):
+            queryset = queryset.filter(bloodgroup=filters['bloodgroup'])
+        return queryset.order_by('pk').values_list(*[field for _, field in self.columns])
+
+
+def _donate_model():
+    from donor.models import BloodDonate
+    return BloodDonate
+
+
+def _request_model():
+    from .models import BloodRequest
+    return BloodRequest
+
+
+def _donor_model():
+    from donor.models import Donor
+    return Donor
+
+
+EXPORTS = {
+    spec.name: spec for spec in (
+        ExportSpec('donations', _donate_model, [
+            ('Donation ID', 'id'),
+            ('Donor ID', 'donor_id'),
+            ('First Name', 'donor__user__first_name'),
+            ('Last Name', 'donor__user__last_name'),
+            ('Mobile', 'donor__mobile'),
+            ('Blood Group', 'bloodgroup'),
+            ('Units', 'unit'),
+            ('Age', 'age'),
+            ('Disease', 'disease'),
+            ('Status', 'status'),
+            ('Date', 'date'),
+        ], date_field='date', status_field='status'),
+        ExportSpec('requests', _request_model, [
+            ('Request ID', 'id'),
+            ('Patient Name', 'patient_name'),
+            ('Patient Age', 'patient_age'),
+            ('Reason', 'reason'),
+            ('Blood Group', 'bloodgroup'),
+            ('Units', 'unit'),
+            ('Status', 'status'),
+            ('Date', 'date'),
+            ('Requested By Patient ID', 'request_by_patient_id'),
+            ('Requested By Donor ID', 'request_by_donor_id'),
+        ], date_field='date', status_field='status'),
+        ExportSpec('donors', _donor_model, [
+            ('Donor ID', 'id'),
+            ('First Name', 'user__first_name'),
+            ('Last Name', 'user__last_name'),
+            ('Email', 'user__email'),
+            ('Blood Group', 'bloodgroup'),
+            ('Mobile', 'mobile'),
+            ('Address', 'address'),
+            ('Joined', 'user__date_joined__date'),
+        ], date_field='user__date_joined__date'),
+    )
+}
+
+
+def parse_filters(spec, params):
+    """Validate the start/end/status/bloodgroup query parameters for a dataset"""
+    filters = {}
+    for name in ('start', 'end'):
+        if params.get(name):
+            try:
+                filters[name] = date.fromisoformat(params[name])
+            except ValueError:
+                raise ExportError(f'{name} must be a date in YYYY-MM-DD format')
+    if params.get('status'):
+        if spec.status_field is None:
+            raise ExportError(f'{spec.name} cannot be filtered by status')
+        filters['status'] = params['status']
+    if params.get('bloodgroup'):
+        if params['bloodgroup'] not in BLOOD_GROUPS:
+            raise ExportError(f'bloodgroup must be one of {", ".join(BLOOD_GROUPS)}')
+        filters['bloodgroup'] = params['bloodgroup']
+    return filters
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def csv_chunks(headers, rows, chunk_size=CHUNK_SIZE):
+    """Encoded CSV, one chunk per batch of rows; starts with a BOM so Excel reads UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for batch in _batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# Characters XML 1.0 does not allow, even escaped
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_WORKBOOK_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _ChunkSink:
+    """Write-only file object that hands zip output back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _column_letters(count):
+    letters = []
+    for index in range(count):
+        name = ''
+        index += 1
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+
+def _cell(ref, value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row_xml(number, letters, values):
+    cells = ''.join(_cell(f'{letter}{number}', value) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def xlsx_chunks(headers, rows, sheet_name='Export', chunk_size=CHUNK_SIZE):
+    """
+    Encoded XLSX workbook with a single sheet, one chunk per batch of rows
+
+    The zip is written to an unseekable sink, so each member is followed by
+    a data descriptor instead of having its header patched afterwards.
+    """
+    sink = _ChunkSink()
+    letters = _column_letters(len(headers))
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _WORKBOOK_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _row_xml(1, letters, headers)
+            ).encode('utf-8'))
+            number = 1
+            for batch in _batches(rows, chunk_size):
+                parts = []
+                for values in batch:
+                    number += 1
+                    parts.append(_row_xml(number, letters, values))
+                sheet.write(''.join(parts).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'xlsx': xlsx_chunks,
+}
+
+
+def export_chunks(dataset, fmt, params):
+    """
+    Byte chunks of an export, read lazily from the database
+
+    Raises:
+        ExportError: unknown dataset or format, or invalid filters
+    """
+    spec = EXPORTS.get(dataset)
+    if spec is None:
+        raise ExportError(f'Unknown export: {dataset}')
+    writer = WRITERS.get(fmt)
+    if writer is None:
+        raise ExportError(f'Format must be one of {", ".join(WRITERS)}')
+    filters = parse_filters(spec, params)
+    rows = spec.queryset(filters).iterator(chunk_size=CHUNK_SIZE)
+    return writer(spec.headers, rows)
+
+
+async def aiter_chunks(chunks):
+    """
+    Async view of a sync chunk iterator
+
+    Under ASGI, StreamingHttpResponse buffers a sync iterator into a list
+    before sending it, so exports are pulled one chunk at a time instead.
+    """
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,334 @@
+"""
+Batched notification fan-out
+
+During an emergency many NotificationJobs arrive from the same few square
+kilometres within seconds. Handling them one at a time repeats the same
+work for every job: load every partner hospital, compute every distance,
+read the stock. Instead, notify_hospitals only queues the job and
+schedules one send_pending_notifications run a moment later (see
+schedule()), which claims every pending job and:
+
+1. loads the partner hospitals and the stock snapshot once per batch;
+2. groups the jobs by origin cell (a CELL_DEGREES square) and radius;
+3. per group, keeps the hospitals within the radius of the cell centre
+   plus the cell's half-diagonal, a superset of what any job in the cell
+   can reach;
+4. per job, measures exact distances to those few candidates only, then
+   renders and sends that user's messages as before.
+
+Each job still gets exactly the hospitals within its radius of its own
+position; only the expensive scan is shared. Job statuses are written
+with one bulk update per group. A job whose sending raised is retried
+like a single job (tasks.retry_countdown): it stays PROCESSING and goes
+back to Celery, or to the in-process queue, after 2^n minutes.
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED where the database has it,
+so several workers can drain the queue together. Without it (SQLite) the
+claim only takes rows that are still PENDING, so a job read by two
+workers at once is sent by one of them. Each sweep first resets jobs left
+in PROCESSING by a worker that died (see reset_stale()).
+"""
+import copy
+import logging
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Hospital, NotificationJob
+from . import job_status, providers
+from . import stock as stock_service
+
+logger = logging.getLogger(__name__)
+
+# Origin cell edge, in degrees of latitude/longitude (about 1.1 km at the equator)
+CELL_DEGREES = 0.01
+
+# Upper bound on the distance from a cell's centre to any point in it
+CELL_MARGIN_KM = math.hypot(CELL_DEGREES / 2, CELL_DEGREES / 2) * 6371 * math.pi / 180
+
+# Jobs claimed per batch
+DEFAULT_BATCH_SIZE = 500
+
+# Set while a send_pending_notifications run is scheduled
+SCHEDULED_KEY = 'blood:notifications:batch_scheduled'
+
+
+class FanoutResult:
+    """Counters of one or more processed batches"""
+
+    def __init__(self):
+        self.jobs = 0
+        self.groups = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.elapsed = 0.0
+
+    @property
+    def jobs_per_second(self):
+        return self.jobs / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'jobs': self.jobs,
+            'groups': self.groups,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'jobs_per_second': round(self.jobs_per_second, 1),
+        }
+
+
+def cell_key(latitude, longitude, radius_km):
+    """(lat index, lng index, radius) of the origin cell a position falls in"""
+    return (
+        math.floor(float(latitude) / CELL_DEGREES),
+        math.floor(float(longitude) / CELL_DEGREES),
+        radius_km,
+    )
+
+
+def cell_centre(key):
+    lat_index, lng_index, _ = key
+    return (lat_index + 0.5) * CELL_DEGREES, (lng_index + 0.5) * CELL_DEGREES
+
+
+def partner_hospitals():
+    """Partner hospitals that have coordinates"""
+    return list(Hospital.objects.filter(
+        is_partner=True,
+        latitude__isnull=False,
+        longitude__isnull=False
+    ))
+
+
+def cell_candidates(hospitals, key):
+    """Hospitals any position in the cell could reach within the cell's radius"""
+    latitude, longitude = cell_centre(key)
+    reach = key[2] + CELL_MARGIN_KM
+    candidates = []
+    for hospital in hospitals:
+        distance = hospital.calculate_distance(latitude, longitude)
+        if distance is not None and distance <= reach:
+            candidates.append(hospital)
+    return candidates
+
+
+def nearby(hospitals, latitude, longitude, radius_km):
+    """
+    Hospitals within radius_km of a position, closest first
+
+    Returns copies carrying a ``distance`` attribute (km, 2 places), so the
+    same hospital can be shared by jobs at different distances.
+    """
+    found = []
+    for hospital in hospitals:
+        distance = hospital.calculate_distance(latitude, longitude)
+        if distance is not None and distance <= radius_km:
+            hospital = copy.copy(hospital)
+            hospital.distance = round(distance, 2)
+            found.append(hospital)
+    found.sort(key=lambda h: h.distance)
+    return found
+
+
+def claim_pending(limit=DEFAULT_BATCH_SIZE):
+    """Mark up to ``limit`` of the oldest pending jobs as PROCESSING and return them"""
+    with transaction.atomic():
+        queryset = NotificationJob.objects.filter(status='PENDING').order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+        ids = list(queryset.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # Another worker may have claimed some of them since they were read
+        now = timezone.now()
+        NotificationJob.objects.filter(pk__in=ids, status='PENDING').update(
+            status='PROCESSING', updated_at=now
+        )
+        return list(
+            NotificationJob.objects.filter(pk__in=ids, status='PROCESSING', updated_at=now)
+            .select_related('user').order_by('created_at')
+        )
+
+
+def reset_stale():
+    """
+    Make jobs left in PROCESSING by a worker that died PENDING again
+
+    Uses background.STALE_AFTER, which outlasts the longest retry wait.
+
+    Returns:
+        int: jobs reset
+    """
+    from .background import STALE_AFTER
+    now = timezone.now()
+    return NotificationJob.objects.filter(
+        status='PROCESSING', updated_at__lt=now - STALE_AFTER
+    ).update(status='PENDING', updated_at=now)
+
+
+def retry_later(job_id, countdown):
+    """
+    Send a PROCESSING job again in ``countdown`` seconds
+
+    Returns:
+        str: 'celery' or 'local'
+    """
+    from . import background
+    from .tasks import send_hospital_notifications
+
+    if background.use_celery():
+        try:
+            send_hospital_notifications.apply_async(args=[job_id], countdown=countdown)
+            return 'celery'
+        except Exception as e:
+            logger.error(f"Could not queue retry of NotificationJob {job_id}, retrying it in-process: {str(e)}")
+    background.get_queue().retry_later(job_id, countdown)
+    return 'local'
+
+
+def _finish(jobs):
+    now = timezone.now()
+    for job in jobs:
+        job.updated_at = now
+    NotificationJob.objects.bulk_update(jobs, ['status', 'error_message', 'completed_at', 'updated_at'])
+    job_status.notifier.jobs_changed(jobs)
+
+
+def process_jobs(jobs, deliver=None):
+    """
+    Send the notifications of claimed jobs, sharing work between nearby ones
+
+    Args:
+        jobs: NotificationJobs in PROCESSING, ideally with user selected
+        deliver: callable(job, nearby_hospitals, blood_stock) returning the
+            per-channel results; defaults to tasks.notify_user
+
+    Returns:
+        FanoutResult: job, group and outcome counts with throughput
+    """
+    from .tasks import delivered, follow_late_sms, retry_countdown
+    if deliver is None:
+        from .tasks import notify_user as deliver
+
+    result = FanoutResult()
+    started = time.perf_counter()
+    hospitals = partner_hospitals()
+    blood_stock = stock_service.as_dict()
+
+    groups = defaultdict(list)
+    for job in jobs:
+        groups[cell_key(job.user_latitude, job.user_longitude, job.radius_km)].append(job)
+
+    # One SMTP connection for every email of the batch
+    with providers.email_batch():
+        for key, group in groups.items():
+            candidates = cell_candidates(hospitals, key)
+            for job in group:
+                try:
+                    nearby_hospitals = nearby(candidates, job.user_latitude, job.user_longitude, job.radius_km)
+                    if not nearby_hospitals:
+                        job.status, job.error_message = 'FAILED', "No hospitals found within specified radius"
+                        continue
+                    results = deliver(job, nearby_hospitals, blood_stock)
+                    if delivered(results):
+                        job.status, job.completed_at = 'COMPLETED', timezone.now()
+                    else:
+                        job.status = 'FAILED'
+                        job.error_message = f"All notifications failed. SMS: {results['sms']}, Email: {results['email']}"
+                except Exception as e:
+                    logger.error(f"Error notifying for NotificationJob {job.pk}: {str(e)}")
+                    job.error_message = str(e)
+                    countdown = retry_countdown(job)
+                    if countdown is None:
+                        job.status = 'FAILED'
+                    else:
+                        retry_later(job.pk, countdown)
+            _finish(group)
+            for job in group:
+                follow_late_sms(job)
+            result.groups += 1
+            result.jobs += len(group)
+            result.completed += sum(1 for job in group if job.status == 'COMPLETED')
+            result.failed += sum(1 for job in group if job.status == 'FAILED')
+            result.retried += sum(1 for job in group if job.status == 'PROCESSING')
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def drain(batch_size=DEFAULT_BATCH_SIZE, deliver=None, max_batches=None):
+    """
+    Claim and process pending jobs until none are left
+
+    Returns:
+        FanoutResult: totals over every batch
+    """
+    total = FanoutResult()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        jobs = claim_pending(batch_size)
+        if not jobs:
+            break
+        result = process_jobs(jobs, deliver=deliver)
+        batches += 1
+        total.jobs += result.jobs
+        total.groups += result.groups
+        total.completed += result.completed
+        total.failed += result.failed
+        total.retried += result.retried
+        total.elapsed += result.elapsed
+    if total.jobs:
+        logger.info(
+            f"Sent notifications for {total.jobs} jobs in {total.groups} groups "
+            f"({total.jobs_per_second:.0f} jobs/s, {total.failed} failed, {total.retried} to retry)"
+        )
+    return total
+
+
+def schedule(job_id):
+    """
+    Queue a job for sending
+
+    With NOTIFICATION_BATCH_WINDOW seconds set, the first job in a window
+    schedules one send_pending_notifications run at the end of it and
+    later jobs ride along; otherwise the job gets its own task.
+
+    Without Celery (NOTIFICATION_USE_CELERY), or if the broker refuses the
+    task, the job goes to this process's queue instead; see blood.background.
+
+    Returns:
+        str: 'celery' or 'local'
+    """
+    from . import background
+    from .tasks import send_hospital_notifications, send_pending_notifications
+
+    if background.use_celery():
+        window = getattr(settings, 'NOTIFICATION_BATCH_WINDOW', 0)
+        try:
+            if not window:
+                send_hospital_notifications.delay(job_id)
+            elif cache.add(SCHEDULED_KEY, job_id, window):
+                try:
+                    send_pending_notifications.apply_async(countdown=window)
+                except Exception:
+                    # Let the next job try to schedule a run
+                    cache.delete(SCHEDULED_KEY)
+                    raise
+            return 'celery'
+        except Exception as e:
+            logger.error(f"Could not queue NotificationJob {job_id}, sending it in-process: {str(e)}")
+
+    background.enqueue(job_id)
+    return 'local'
+
+
+def batch_started():
+    """Let the next job schedule a new run; called before a run claims jobs"""
+    cache.delete(SCHEDULED_KEY)
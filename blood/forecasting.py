@@ -0,0 +1,142 @@
+"""
+Blood group demand forecasting
+
+Builds daily request/donation series for the eight blood groups from a
+single grouped query and projects days until stockout with exponential
+smoothing. The smoothing is one weighted dot product per series, so all
+groups are forecast together without a Python loop over days.
+"""
+import logging
+from datetime import date, timedelta
+
+from django.db.models import IntegerField, Sum, Value
+from django.utils import timezone
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from .models import BLOOD_GROUPS, GROUP_INDEX, BloodRequest, StockForecast
+from . import stock as stock_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_DAYS = 90
+DEFAULT_ALPHA = 0.3
+
+REQUEST_SERIES = 0
+DONATION_SERIES = 1
+
+
+def daily_series(history_days=DEFAULT_HISTORY_DAYS, end=None):
+    """
+    Build daily unit totals per blood group
+
+    Requests and approved donations are aggregated by day and group in one
+    ``UNION ALL`` query.
+
+    Returns:
+        ndarray: shape ``(2, len(BLOOD_GROUPS), history_days)`` holding
+        requested units at index 0 and donated units at index 1
+    """
+    from donor.models import BloodDonate
+
+    end = end or date.today()
+    start = end - timedelta(days=history_days - 1)
+
+    requests = (
+        BloodRequest.objects
+        .filter(date__gte=start, date__lte=end)
+        .values('date', 'bloodgroup')
+        .annotate(series=Value(REQUEST_SERIES, output_field=IntegerField()), units=Sum('unit'))
+        .values_list('series', 'date', 'bloodgroup', 'units')
+    )
+    donations = (
+        BloodDonate.objects
+        .filter(date__gte=start, date__lte=end, status='Approved')
+        .values('date', 'bloodgroup')
+        .annotate(series=Value(DONATION_SERIES, output_field=IntegerField()), units=Sum('unit'))
+        .values_list('series', 'date', 'bloodgroup', 'units')
+    )
+
+    series = np.zeros((2, len(BLOOD_GROUPS), history_days))
+    for kind, day, bloodgroup, units in requests.union(donations, all=True):
+        group = GROUP_INDEX.get(bloodgroup)
+        if group is None:
+            continue
+        series[kind, group, (day - start).days] = units or 0
+    return series
+
+
+def smoothing_weights(length, alpha=DEFAULT_ALPHA):
+    """
+    Weights that reproduce simple exponential smoothing as a dot product
+
+    The level after ``length`` observations is
+    ``(1 - alpha)^(n-1) * x[0] + sum(alpha * (1 - alpha)^(n-1-t) * x[t])``.
+    """
+    exponents = np.arange(length - 1, -1, -1)
+    weights = alpha * (1 - alpha) ** exponents
+    weights[0] = (1 - alpha) ** (length - 1)
+    return weights
+
+
+def forecast_levels(series, alpha=DEFAULT_ALPHA):
+    """Smoothed daily level for every series along the last axis"""
+    return series @ smoothing_weights(series.shape[-1], alpha)
+
+
+def days_until_stockout(current_units, daily_demand, daily_supply):
+    """
+    Project days until stock runs out at the forecast net consumption
+
+    Returns ``None`` where supply keeps up with demand.
+    """
+    net = daily_demand - daily_supply
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days = np.where(net > 0, current_units / net, np.nan)
+    return [None if np.isnan(value) else round(float(value), 1) for value in days]
+
+
+def refresh_stock_forecasts(history_days=DEFAULT_HISTORY_DAYS, alpha=DEFAULT_ALPHA):
+    """
+    Recompute and store StockForecast rows for every blood group
+
+    Returns:
+        int: number of forecasts written
+    """
+    if not NUMPY_AVAILABLE:
+        logger.warning("NumPy not available, skipping stock forecast")
+        return 0
+
+    series = daily_series(history_days)
+    demand, supply = forecast_levels(series, alpha)
+
+    current = np.array(stock_service.snapshot(), dtype=float)
+    stockout = days_until_stockout(current, demand, supply)
+
+    generated_at = timezone.now()
+    forecasts = [
+        StockForecast(
+            bloodgroup=group,
+            current_units=int(current[index]),
+            daily_demand=round(float(demand[index]), 2),
+            daily_supply=round(float(supply[index]), 2),
+            days_until_stockout=stockout[index],
+            history_days=history_days,
+            generated_at=generated_at,
+        )
+        for index, group in enumerate(BLOOD_GROUPS)
+    ]
+    StockForecast.objects.bulk_create(
+        forecasts,
+        update_conflicts=True,
+        unique_fields=['bloodgroup'],
+        update_fields=[
+            'current_units', 'daily_demand', 'daily_supply',
+            'days_until_stockout', 'history_days', 'generated_at',
+        ],
+    )
+    return len(forecasts)
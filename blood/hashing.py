@@ -0,0 +1,42 @@
+"""
+Password hashing across worker processes
+
+The task function lives apart from the importer so spawned workers can
+unpickle it without importing any models (see blood.workers).
+"""
+from .workers import default_workers, process_pool, split
+
+
+def _hash_passwords(passwords):
+    from django.contrib.auth.hashers import make_password
+    return [make_password(password or None) for password in passwords]
+
+
+class PasswordHasherPool:
+    """
+    Hash passwords across worker processes
+
+    With ``workers`` of 0 or 1 hashing runs inline.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = default_workers() if workers is None else workers
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._executor = process_pool(self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def hash(self, passwords):
+        """Encoded passwords in input order; blank entries get an unusable password"""
+        if self._executor is None or len(passwords) < 2:
+            return _hash_passwords(passwords)
+        hashed = []
+        for part in self._executor.map(_hash_passwords, split(passwords, self.workers)):
+            hashed.extend(part)
+        return hashed
@@ -0,0 +1,209 @@
+"""
+Live notification job status
+
+After notify_hospitals, the page used to poll /api/notification-status/
+every two seconds: a full authenticated request and a query each time,
+mostly to hear "still pending". Clients now wait on the job instead:
+
+- /api/notification-status/<id>/stream/ is a Server-Sent Events stream
+  sending a ``status`` event with the job's state on connect and again on
+  every change, closing once the job is COMPLETED or FAILED;
+- /api/notification-status/<id>/wait/ is the long-polling fallback for
+  clients without EventSource: with an If-None-Match of the job's ETag
+  (its updated_at, as on notification-status) it answers only when the
+  job changes, or 304 after ``timeout`` seconds.
+
+Both wait on JobNotifier, one per process, which keeps an asyncio queue
+per waiting client. Saves made in this process (mark_completed,
+mark_failed, the in-process queue, batched fan-out) are pushed as soon as
+they commit. Jobs finished by other processes, such as Celery workers,
+are picked up by one poller that reads every watched job in a single
+query every POLL_INTERVAL seconds, and only while anyone is waiting.
+"""
+import asyncio
+import logging
+import threading
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .broadcast import format_event
+from .models import NotificationJob
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reads of the watched jobs, for changes made by other processes
+POLL_INTERVAL = 2.0
+# Seconds of silence before a keep-alive comment is sent
+HEARTBEAT_INTERVAL = 25.0
+# Streams are closed after this many seconds; EventSource reconnects on its own
+MAX_STREAM_SECONDS = 600
+# Client reconnect delay advertised to EventSource, in milliseconds
+RETRY_MS = 3000
+# Long-poll wait, by default and at most, in seconds
+LONG_POLL_SECONDS = 25
+MAX_LONG_POLL_SECONDS = 60
+
+# Statuses after which a job no longer changes
+FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+
+STATE_FIELDS = ['id', 'status', 'notification_type', 'retry_count', 'error_message', 'updated_at', 'completed_at']
+
+
+def job_state(job):
+    """What clients are told about a job; JSON-ready"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'notification_type': job.notification_type,
+        'retry_count': job.retry_count,
+        'error_message': job.error_message,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+def load_state(job_id, user_id):
+    """A user's job as (state, updated_at), or (None, None) if it is not theirs"""
+    job = NotificationJob.objects.filter(id=job_id, user_id=user_id).only(*STATE_FIELDS).first()
+    if job is None:
+        return None, None
+    return job_state(job), job.updated_at
+
+
+def is_finished(state):
+    return state['status'] in FINISHED_STATUSES
+
+
+class JobNotifier:
+    """Fan-out of job state changes to the clients waiting on them in this process"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # job id -> {queue: event loop that owns it}
+        self._published = {}  # job id -> updated_at last published
+        self._poller = None
+
+    def watching(self, job_id):
+        return job_id in self._subscribers
+
+    def subscribe(self, job_id):
+        """Queue receiving the job's states, for the running event loop; starts the poller if needed"""
+        loop = asyncio.get_running_loop()
+        # Only the latest state matters; see _offer
+        queue = asyncio.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(job_id, {})[queue] = loop
+            if self._poller is None or self._poller.done():
+                self._poller = loop.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(job_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(job_id, None)
+                self._published.pop(job_id, None)
+
+    def publish(self, state):
+        """Send a job's state to everyone waiting on it, unless already sent; safe from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(state['id'], {}).items())
+            if not subscribers or self._published.get(state['id']) == state['updated_at']:
+                return
+            self._published[state['id']] = state['updated_at']
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, state)
+            except RuntimeError:
+                # Loop already closed; the waiter's cleanup will unsubscribe it
+                pass
+
+    def _offer(self, queue, state):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(state)
+
+    def jobs_changed(self, jobs):
+        """Publish jobs saved in this process, e.g. by bulk_update, which sends no signals"""
+        for job in jobs:
+            if self.watching(job.pk):
+                self.publish(job_state(job))
+
+    def _load(self, job_ids):
+        return [job_state(job) for job in NotificationJob.objects.filter(pk__in=job_ids).only(*STATE_FIELDS)]
+
+    async def refresh(self):
+        """Publish whatever changed in the watched jobs, wherever it was saved"""
+        job_ids = list(self._subscribers)
+        if not job_ids:
+            return
+        for state in await sync_to_async(self._load)(job_ids):
+            self.publish(state)
+
+    async def _poll(self):
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Job status poll failed: {str(e)}")
+
+    async def wait(self, queue, after, timeout):
+        """
+        Next state from ``queue`` whose updated_at is not ``after``
+
+        Returns:
+            dict: the state, or None after ``timeout`` seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                state = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return None
+            if state['updated_at'] != after:
+                return state
+
+
+notifier = JobNotifier()
+
+
+async def stream(job_id, user_id, max_seconds=MAX_STREAM_SECONDS, heartbeat=HEARTBEAT_INTERVAL):
+    """Async generator of SSE messages for one client waiting on a job"""
+    queue = notifier.subscribe(job_id)
+    try:
+        # Read after subscribing, so no change can fall in between
+        state, _ = await sync_to_async(load_state)(job_id, user_id)
+        if state is None:
+            return
+        yield f"retry: {RETRY_MS}\n\n"
+        yield format_event('status', state)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_seconds
+        while not is_finished(state):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            changed = await notifier.wait(queue, state['updated_at'], min(heartbeat, remaining))
+            if changed is None:
+                yield ": keep-alive\n\n"
+                continue
+            state = changed
+            yield format_event('status', state)
+    finally:
+        notifier.unsubscribe(job_id, queue)
+
+
+def job_saved(sender, instance, **kwargs):
+    """Signal receiver: push a watched job's new state once its transaction commits"""
+    if notifier.watching(instance.pk):
+        transaction.on_commit(partial(notifier.publish, job_state(instance)))
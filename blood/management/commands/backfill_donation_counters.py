@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blood import certificates
+
+
+class Command(BaseCommand):
+    help = "Recompute donors' approved-donation counters and awarded certificate tiers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Donors written per bulk update')
+        parser.add_argument('--award', action='store_true',
+                            help='Also issue certificates for tiers already reached but never awarded')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated, issued = certificates.backfill(batch_size=options['batch_size'], award=options['award'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} donors and issued {issued} certificates in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,66 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blood import certificate_pdf, verification
+
+
+def _legacy_background(canv, doc):
+    # What every page used to do: look the pattern up and embed it at full size
+    width, height = certificate_pdf.A4
+    path = certificate_pdf.pattern_path()
+    if os.path.exists(path):
+        canv.drawImage(path, 0, 0, width=width, height=height, mask='auto')
+
+
+def _render_legacy(fields):
+    rl_config = certificate_pdf.rl_config
+    use_a85, rl_config.useA85 = rl_config.useA85, 1
+    try:
+        return certificate_pdf.render_fields(fields, styles=certificate_pdf.build_styles(), on_page=_legacy_background)
+    finally:
+        rl_config.useA85 = use_a85
+
+
+class Command(BaseCommand):
+    help = 'Measure certificate PDF rendering throughput before and after the cached background and styles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20,
+                            help='Certificates rendered per measurement')
+        parser.add_argument('--skip-before', action='store_true',
+                            help='Only measure the current renderer')
+
+    def time_renders(self, render, fields, count):
+        started = time.perf_counter()
+        for _ in range(count):
+            pdf = render(fields)
+        elapsed = time.perf_counter() - started
+        return count / elapsed, len(pdf)
+
+    def handle(self, *args, **options):
+        if not certificate_pdf.REPORTLAB_AVAILABLE:
+            raise CommandError('ReportLab is not installed')
+
+        fields = {
+            'certificate_id': 'CERT1234567202601010',
+            'donor_name': 'Benchmark Donor',
+            'title': 'Hero Donor (10+ donations)',
+            'donation_count': 10,
+            'issued_date': date.today(),
+            'verify_url': verification.verify_url('CERT1234567202601010'),
+        }
+        count = options['count']
+
+        # The first render prepares the background template; time steady state
+        certificate_pdf.render_fields(fields)
+        after, after_size = self.time_renders(certificate_pdf.render_fields, fields, count)
+
+        if not options['skip_before']:
+            before, before_size = self.time_renders(_render_legacy, fields, count)
+            self.stdout.write(f'Before: {before:.2f} certificates/s ({before_size // 1024} KB each)')
+        self.stdout.write(f'After:  {after:.2f} certificates/s ({after_size // 1024} KB each)')
+        if not options['skip_before']:
+            self.stdout.write(self.style.SUCCESS(f'{after / before:.1f}x faster'))
@@ -0,0 +1,102 @@
+import random
+import time
+from contextlib import nullcontext
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blood import fanout, providers
+from blood import stock as stock_service
+from blood.models import Hospital, NotificationJob
+from blood.tasks import notify_user
+from donor.models import Donor
+
+
+def _no_send(job, nearby_hospitals, blood_stock):
+    # Delivery is the same either way; time the fan-out work only
+    return {'sms': None, 'email': f'Email sent ({len(nearby_hospitals)} hospitals)'}
+
+
+class Command(BaseCommand):
+    help = 'Measure notification fan-out throughput, one job at a time versus batched by origin cell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000, help='Pending jobs to process')
+        parser.add_argument('--hospitals', type=int, default=2000, help='Partner hospitals to search')
+        parser.add_argument('--spread-km', type=float, default=3.0,
+                            help='Jobs are scattered over a square this wide')
+        parser.add_argument('--radius', type=int, default=10, help='Search radius of every job, in km')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--provider-latency', type=float, default=0,
+                            help='Milliseconds per message of a fake SMS and email provider. '
+                                 'When set, jobs ask for both channels and are really rendered and "sent".')
+
+    def create_data(self, options):
+        rng = random.Random(options['seed'])
+        # Around Mumbai; hospitals over about 200 km, jobs over a few km
+        centre_lat, centre_lng = 19.076, 72.8777
+        Hospital.objects.bulk_create([
+            Hospital(
+                name=f'Benchmark Hospital {i}', address='-', city='-', state='-',
+                contact_phone='-', contact_email='bench@example.com', emergency_contact='-', is_partner=True,
+                latitude=Decimal(f'{centre_lat + rng.uniform(-1, 1):.6f}'),
+                longitude=Decimal(f'{centre_lng + rng.uniform(-1, 1):.6f}'),
+            )
+            for i in range(options['hospitals'])
+        ])
+        user = User.objects.create_user(username='benchmark-notifications', email='bench@example.com')
+        Donor.objects.create(user=user, bloodgroup='O+', address='-', mobile='9000000000')
+        spread = options['spread_km'] / 111.2 / 2
+        NotificationJob.objects.bulk_create([
+            NotificationJob(
+                user=user, radius_km=options['radius'], notification_type=self.notification_type,
+                user_latitude=Decimal(f'{centre_lat + rng.uniform(-spread, spread):.6f}'),
+                user_longitude=Decimal(f'{centre_lng + rng.uniform(-spread, spread):.6f}'),
+            )
+            for _ in range(options['jobs'])
+        ])
+
+    def one_at_a_time(self, jobs):
+        """What send_hospital_notifications does for each job"""
+        started = time.perf_counter()
+        for job in jobs:
+            nearby_hospitals = fanout.nearby(
+                fanout.partner_hospitals(), job.user_latitude, job.user_longitude, job.radius_km
+            )
+            self.deliver(job, nearby_hospitals, stock_service.as_dict())
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        latency = options['provider_latency'] / 1000
+        self.deliver, self.notification_type, sending = _no_send, 'EMAIL', nullcontext()
+        if latency:
+            fake = providers.FakeProvider(latency=latency)
+            self.deliver, self.notification_type = notify_user, 'BOTH'
+            sending = providers.override(sms=fake, email=fake)
+
+        # Benchmark rows never outlive the run
+        with transaction.atomic(), sending:
+            self.create_data(options)
+            jobs = list(NotificationJob.objects.filter(status='PENDING').select_related('user'))
+
+            elapsed = self.one_at_a_time(jobs)
+            self.stdout.write(
+                f'One at a time: {len(jobs)} jobs in {elapsed:.2f}s ({len(jobs) / elapsed:,.0f} jobs/s)'
+            )
+
+            result = fanout.drain(batch_size=fanout.DEFAULT_BATCH_SIZE, deliver=self.deliver)
+            self.stdout.write(
+                f'Batched: {result.jobs} jobs in {result.groups} groups in {result.elapsed:.2f}s '
+                f'({result.jobs_per_second:,.0f} jobs/s)'
+            )
+            if latency and result.jobs:
+                # SMS and email each take `latency`; sent one after the other a job would take twice that
+                self.stdout.write(
+                    f'Job latency: {result.elapsed / result.jobs * 1000:.0f} ms with both channels at '
+                    f'{latency * 1000:.0f} ms per message'
+                )
+            if elapsed and result.elapsed:
+                self.stdout.write(self.style.SUCCESS(f'Speed-up: {elapsed / result.elapsed:.1f}x'))
+            transaction.set_rollback(True)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from blood import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete finished notification jobs past retention, rolling their counts into daily summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep jobs this many days (default: NOTIFICATION_JOB_RETENTION_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=retention.DEFAULT_CHUNK_SIZE,
+                            help='Job ids deleted per transaction')
+        parser.add_argument('--no-summary', action='store_true',
+                            help='Delete without adding to NotificationJobSummary')
+
+    def handle(self, *args, **options):
+        result = retention.cleanup_notification_jobs(
+            days=options['days'],
+            chunk_size=options['chunk_size'],
+            summarize=False if options['no_summary'] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {result.deleted} jobs in {result.chunks} chunks, updated {result.summarized} '
+            f'summary rows in {result.elapsed:.1f}s ({result.rows_per_second:,.0f} rows/s)'
+        ))
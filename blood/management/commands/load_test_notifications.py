@@ -0,0 +1,156 @@
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from blood import providers
+from blood.models import Hospital, NotificationJob
+from blood.simulator import ProviderSimulator
+from blood.tasks import send_hospital_notifications
+from donor.models import Donor
+
+USERNAME_PREFIX = 'loadtest-'
+HOSPITAL_NAME = 'Load Test Hospital'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = ('Load-test notification delivery: enqueue synthetic NotificationJobs and run '
+            'send_hospital_notifications on each against local Twilio/SendGrid stand-ins')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=200, help='Synthetic jobs to send')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Jobs processed at once, like Celery worker processes')
+        parser.add_argument('--type', default='BOTH', choices=['SMS', 'EMAIL', 'BOTH'], dest='notification_type')
+        parser.add_argument('--latency-ms', type=float, default=80, help='Mean provider latency per request')
+        parser.add_argument('--jitter-ms', type=float, default=20, help='Latency varies by up to this much')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered 500')
+        parser.add_argument('--throttle', type=int, default=0,
+                            help='Requests per second each API accepts before answering 429 (0: unlimited)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic users and jobs')
+
+    def create_jobs(self, options):
+        rng = random.Random(options['seed'])
+        centre_lat, centre_lng = 19.076, 72.8777
+        Hospital.objects.bulk_create([
+            Hospital(
+                name=HOSPITAL_NAME, address='-', city='Mumbai', state='Maharashtra',
+                contact_phone='022-0000000', contact_email='loadtest@example.com', emergency_contact='108',
+                is_partner=True,
+                latitude=Decimal(f'{centre_lat + rng.uniform(-0.05, 0.05):.6f}'),
+                longitude=Decimal(f'{centre_lng + rng.uniform(-0.05, 0.05):.6f}'),
+            )
+            for _ in range(20)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com')
+            for i in range(options['jobs'])
+        ])
+        if users and users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+        Donor.objects.bulk_create([
+            Donor(user=user, bloodgroup='O+', address='-', mobile=f'9{i:09d}')
+            for i, user in enumerate(users)
+        ])
+        jobs = NotificationJob.objects.bulk_create([
+            NotificationJob(
+                user=user, radius_km=10, notification_type=options['notification_type'],
+                user_latitude=Decimal(f'{centre_lat + rng.uniform(-0.02, 0.02):.6f}'),
+                user_longitude=Decimal(f'{centre_lng + rng.uniform(-0.02, 0.02):.6f}'),
+            )
+            for user in users
+        ])
+        if jobs and jobs[0].pk is None:
+            jobs = list(NotificationJob.objects.filter(user__username__startswith=USERNAME_PREFIX))
+        return [job.pk for job in jobs]
+
+    def cleanup(self):
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        Hospital.objects.filter(name=HOSPITAL_NAME).delete()
+
+    def run_job(self, job_id):
+        started = time.perf_counter()
+        error = None
+        try:
+            send_hospital_notifications(job_id)
+        except Exception as e:
+            # Under Celery this would be a task retry
+            error = type(e).__name__
+        elapsed = time.perf_counter() - started
+        connection.close()
+        return elapsed, error
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f'Users named {USERNAME_PREFIX}* already exist; remove them or rerun without --keep')
+
+        simulator = ProviderSimulator(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            throttle=options['throttle'],
+            seed=options['seed'],
+        )
+        with simulator:
+            sms = providers.TwilioSms('ACloadtest', 'loadtest', '+15005550006', base_url=simulator.url)
+            email = providers.SendGridEmail('loadtest', 'noreply@bloodbank.com', send_url=simulator.sendgrid_url)
+            job_ids = self.create_jobs(options)
+            try:
+                with providers.override(sms=sms, email=email), \
+                        ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                    started = time.perf_counter()
+                    outcomes = list(pool.map(self.run_job, job_ids))
+                    wall = time.perf_counter() - started
+                self.report(options, job_ids, outcomes, wall, simulator)
+            finally:
+                if not options['keep']:
+                    self.cleanup()
+
+    def report(self, options, job_ids, outcomes, wall, simulator):
+        latencies = sorted(elapsed for elapsed, _ in outcomes)
+        errors = Counter(error for _, error in outcomes if error)
+        statuses = Counter(NotificationJob.objects.filter(pk__in=job_ids).values_list('status', flat=True))
+        retried = NotificationJob.objects.filter(pk__in=job_ids, retry_count__gt=0).count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(job_ids)} jobs in {wall:.2f}s with {options["workers"]} workers '
+            f'({len(job_ids) / wall:,.1f} jobs/s)'
+        ))
+        self.stdout.write(
+            f'  Job latency: p50 {percentile(latencies, 0.50) * 1000:.0f} ms, '
+            f'p90 {percentile(latencies, 0.90) * 1000:.0f} ms, '
+            f'p99 {percentile(latencies, 0.99) * 1000:.0f} ms, '
+            f'max {latencies[-1] * 1000:.0f} ms, mean {statistics.mean(latencies) * 1000:.0f} ms'
+        )
+        self.stdout.write(
+            '  Job status: ' + ', '.join(f'{status} {count}' for status, count in sorted(statuses.items()))
+        )
+        self.stdout.write(f'  Task errors (Celery retries): {sum(errors.values())}, jobs with retries recorded: {retried}')
+        for error, count in errors.most_common():
+            self.stdout.write(f'    {error}: {count}')
+
+        channels = {'SMS': ['twilio'], 'EMAIL': ['sendgrid'], 'BOTH': ['twilio', 'sendgrid']}[options['notification_type']]
+        for api in channels:
+            attempts = simulator.requests(api)
+            accepted = simulator.requests(api, 201 if api == 'twilio' else 202)
+            throttled = simulator.requests(api, 429)
+            failed = simulator.requests(api, 500)
+            # Every job sends one message per channel; extra requests are HTTP retries
+            self.stdout.write(
+                f'  {api}: {attempts} requests for {len(job_ids)} messages '
+                f'({max(0, attempts - len(job_ids))} retries), {accepted} accepted, '
+                f'{throttled} throttled, {failed} failed'
+            )
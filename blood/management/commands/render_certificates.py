@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blood import certificate_pdf
+from blood.models import Certificate
+
+
+class Command(BaseCommand):
+    help = 'Render and store the PDFs of certificates that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Render at most this many certificates')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: one per CPU, 0 to render inline)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Certificates loaded and handed to the pool at a time')
+
+    def handle(self, *args, **options):
+        if not certificate_pdf.REPORTLAB_AVAILABLE:
+            raise CommandError('ReportLab is not installed')
+
+        pending = Certificate.objects.filter(pdf='').select_related('donor__user').order_by('pk')
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        failed = []
+
+        def on_error(certificate, message):
+            failed.append(certificate)
+            self.stderr.write(f'{certificate.certificate_id}: {message}')
+
+        started = time.perf_counter()
+        rendered = 0
+        batch = []
+        for certificate in pending.iterator(chunk_size=options['batch_size']):
+            batch.append(certificate)
+            if len(batch) >= options['batch_size']:
+                rendered += certificate_pdf.render_many(batch, workers=options['workers'], on_error=on_error)
+                batch = []
+        if batch:
+            rendered += certificate_pdf.render_many(batch, workers=options['workers'], on_error=on_error)
+        elapsed = time.perf_counter() - started
+
+        rate = rendered / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} certificates in {elapsed:.1f}s ({rate:.1f}/s, {len(failed)} failed)'
+        ))
@@ -0,0 +1,71 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.allocation import (
+    DEFAULT_SHELF_LIFE_DAYS, POLICIES, Simulator, get_policy, history_events,
+)
+
+
+class Command(BaseCommand):
+    help = 'Replay donation/request history against an allocation policy and report fill rate, wait time and wastage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy', action='append', dest='policies',
+            help=f'Policy name ({", ".join(POLICIES)}) or dotted path to a policy class. Repeat to compare.'
+        )
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to replay (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to replay (YYYY-MM-DD)')
+        parser.add_argument('--shelf-life', type=int, default=DEFAULT_SHELF_LIFE_DAYS,
+                            help='Days a donated unit stays usable')
+        parser.add_argument('--initial-units', type=int, default=0,
+                            help='Units per blood group in stock before the first event')
+        parser.add_argument('--include-pending', action='store_true',
+                            help='Count pending donations as stock, not only approved ones')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        policy_names = options['policies'] or list(POLICIES)
+        statuses = ('Approved', 'Pending') if options['include_pending'] else ('Approved',)
+
+        for name in policy_names:
+            try:
+                policy = get_policy(name)
+            except ImportError:
+                raise CommandError(f'Unknown allocation policy: {name}')
+
+            events = history_events(
+                start=options['start'],
+                end=options['end'],
+                donation_statuses=statuses,
+                chunk_size=options['chunk_size'],
+            )
+            simulator = Simulator(
+                policy,
+                shelf_life_days=options['shelf_life'],
+                initial_units=options['initial_units'],
+            )
+            result = simulator.run(events)
+
+            self.stdout.write(self.style.SUCCESS(f'\nPolicy: {name}'))
+            self.stdout.write(
+                f'  Events replayed: {result.events} '
+                f'({result.donations} donations, {result.requests} requests) '
+                f'in {result.elapsed:.2f}s ({result.events_per_second:,.0f} events/s)'
+            )
+            self.stdout.write(
+                f'  Fill rate: {result.fill_rate:.1%} '
+                f'({result.filled_units}/{result.requested_units} units, '
+                f'{result.filled_requests} requests filled, {result.unfilled_requests} unfilled)'
+            )
+            if policy.backorder:
+                self.stdout.write(
+                    f'  Wait time: {result.average_wait_days:.1f} days average, '
+                    f'{result.max_wait_days} days max, {result.still_waiting} still waiting'
+                )
+            self.stdout.write(
+                f'  Wastage: {result.wasted_units} units expired '
+                f'({result.wastage_rate:.1%} of donated units)'
+            )
@@ -0,0 +1,106 @@
+"""
+Project middleware
+
+Every middleware in settings.MIDDLEWARE must handle async requests too.
+A sync-only one makes Django run the rest of the chain through
+async_to_sync under ASGI, holding a worker thread for as long as the
+view runs; for the SSE streams and long polls of blood.stream_views that
+is up to a minute per client. Both classes here follow the pattern of
+Django's own MiddlewareMixin: they mark themselves as coroutine functions
+when the next handler is async, and then answer through ``__acall__``.
+"""
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import profiles, roles
+
+
+def _profile(get_profile, user_id):
+    """The user's profile, or None if it was deleted after the role was cached"""
+    try:
+        return get_profile(user_id)
+    except ObjectDoesNotExist:
+        roles.invalidate([user_id])
+        return None
+
+
+class RoleMiddleware:
+    """
+    Attach ``request.role``, ``request.donor`` and ``request.patient``
+
+    The role comes from the shared cache (see blood.roles). The profile of
+    a donor or patient is loaded on first access, together with its user
+    (see blood.profiles); for everyone else ``request.donor`` and
+    ``request.patient`` are None. A profile deleted since its role was
+    cached loads as None too, so test them for truth rather than identity.
+    Must come after AuthenticationMiddleware.
+
+    On async requests the role is resolved in a thread; the profiles are
+    still loaded synchronously, so async views must reach them through
+    sync_to_async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _attach(self, request, role, donor_id, patient_id):
+        request.role = role
+        request.donor = SimpleLazyObject(partial(_profile, profiles.get_donor, request.user.id)) if donor_id else None
+        request.patient = SimpleLazyObject(partial(_profile, profiles.get_patient, request.user.id)) if patient_id else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._attach(request, *roles.resolve(request.user))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # request.user is loaded from the session on first access, which queries the database
+        self._attach(request, *await sync_to_async(roles.resolve)(request.user))
+        return await self.get_response(request)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, able to pass async requests on without a thread
+
+    WhiteNoise 6.6 is sync-only. Static files are still served from a
+    thread; every other request goes straight to the next async handler.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _static_file(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Looks in the static directories on disk
+            static_file = await sync_to_async(self._static_file)(request)
+        else:
+            static_file = self._static_file(request)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
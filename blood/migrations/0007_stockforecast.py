@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0006_add_hospital_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockForecast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bloodgroup', models.CharField(max_length=10, unique=True)),
+                ('current_units', models.PositiveIntegerField(default=0)),
+                ('daily_demand', models.FloatField(default=0)),
+                ('daily_supply', models.FloatField(default=0)),
+                ('days_until_stockout', models.FloatField(blank=True, null=True)),
+                ('history_days', models.PositiveIntegerField(default=0)),
+                ('generated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['bloodgroup'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:38
+
+from django.db import migrations, models
+
+
+def merge_duplicate_stock(apps, schema_editor):
+    """Fold duplicate Stock rows into the oldest row per blood group before adding the unique constraint"""
+    Stock = apps.get_model('blood', 'Stock')
+    keep = {}
+    for stock in Stock.objects.order_by('id'):
+        if stock.bloodgroup not in keep:
+            keep[stock.bloodgroup] = stock
+            continue
+        first = keep[stock.bloodgroup]
+        first.unit += stock.unit
+        first.save(update_fields=['unit'])
+        stock.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0007_stockforecast'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stock, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stock',
+            name='bloodgroup',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+    ]
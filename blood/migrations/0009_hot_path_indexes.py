@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0008_stock_bloodgroup_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['status', 'id'], name='bloodreq_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['request_by_donor', 'status'], name='bloodreq_donor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['request_by_patient', 'status'], name='bloodreq_patient_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(fields=['donor', 'certificate_type'], name='certificate_donor_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationjob',
+            index=models.Index(fields=['user', '-created_at'], name='notifjob_user_created_idx'),
+        ),
+    ]
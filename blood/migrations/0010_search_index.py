@@ -0,0 +1,90 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:20
+
+from django.db import migrations
+
+# The SQL is frozen here rather than taken from blood.search, so later changes
+# to that module cannot change what this migration does on a fresh database
+
+# Tokenizers drop '+' and '-', so blood groups are indexed as single words
+BLOOD_GROUP_TOKEN = (
+    "CASE {column} WHEN 'A+' THEN 'apos' WHEN 'A-' THEN 'aneg' WHEN 'B+' THEN 'bpos' WHEN 'B-' THEN 'bneg' "
+    "WHEN 'AB+' THEN 'abpos' WHEN 'AB-' THEN 'abneg' WHEN 'O+' THEN 'opos' WHEN 'O-' THEN 'oneg' ELSE '' END"
+)
+
+# (kind, object_id, name, mobile, address, bloodgroup, reason) of every donor (1), patient (2) and blood request (3)
+DOCUMENTS = (
+    "SELECT 1 AS kind, d.id AS object_id, TRIM(u.first_name || ' ' || u.last_name) AS name, "
+    "d.mobile AS mobile, d.address AS address, " + BLOOD_GROUP_TOKEN.format(column='d.bloodgroup') + " AS bloodgroup, "
+    "'' AS reason FROM donor_donor d JOIN auth_user u ON u.id = d.user_id "
+    "UNION ALL "
+    "SELECT 2, p.id, TRIM(u.first_name || ' ' || u.last_name), p.mobile, p.address, "
+    + BLOOD_GROUP_TOKEN.format(column='p.bloodgroup') + ", p.disease "
+    "FROM patient_patient p JOIN auth_user u ON u.id = p.user_id "
+    "UNION ALL "
+    "SELECT 3, r.id, r.patient_name, '', '', " + BLOOD_GROUP_TOKEN.format(column='r.bloodgroup') + ", r.reason "
+    "FROM blood_bloodrequest r"
+)
+
+# The FTS5 rowid packs (object id, kind) as object_id * 4 + kind
+SQLITE_POPULATE = (
+    "INSERT OR REPLACE INTO blood_search (rowid, kind, object_id, name, mobile, address, bloodgroup, reason) "
+    f"SELECT object_id * 4 + kind, kind, object_id, name, mobile, address, bloodgroup, reason FROM ({DOCUMENTS}) documents"
+)
+
+POSTGRES_POPULATE = (
+    "INSERT INTO blood_search (kind, object_id, document) "
+    "SELECT kind, object_id, "
+    "setweight(to_tsvector('simple', name), 'A') || "
+    "setweight(to_tsvector('simple', mobile), 'B') || "
+    "setweight(to_tsvector('simple', address), 'C') || "
+    "setweight(to_tsvector('simple', bloodgroup), 'B') || "
+    "setweight(to_tsvector('simple', reason), 'D') "
+    f"FROM ({DOCUMENTS}) documents "
+    "ON CONFLICT (kind, object_id) DO UPDATE SET document = EXCLUDED.document"
+)
+
+
+def create_search_table(apps, schema_editor):
+    """FTS5 table on SQLite, tsvector + GIN on PostgreSQL; other databases use the icontains fallback"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE blood_search USING fts5("
+            "kind UNINDEXED, object_id UNINDEXED, name, mobile, address, bloodgroup, reason, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE blood_search ("
+            "kind smallint NOT NULL, object_id integer NOT NULL, document tsvector NOT NULL, "
+            "PRIMARY KEY (kind, object_id))"
+        )
+        schema_editor.execute("CREATE INDEX blood_search_document_idx ON blood_search USING GIN (document)")
+
+
+def populate_search_table(apps, schema_editor):
+    """Index the donors, patients and blood requests that already exist"""
+    sql = {'sqlite': SQLITE_POPULATE, 'postgresql': POSTGRES_POPULATE}.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS blood_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0009_hot_path_indexes'),
+        ('donor', '0004_blooddonate_donor_status_idx'),
+        ('patient', '0002_patient_aadhaar_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.RunPython(populate_search_table, migrations.RunPython.noop),
+    ]
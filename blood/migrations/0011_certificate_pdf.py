@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf',
+            field=models.FileField(blank=True, upload_to='certificates/'),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0011_certificate_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationJobSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('notification_type', models.CharField(choices=[('SMS', 'SMS'), ('EMAIL', 'Email'), ('BOTH', 'SMS and Email')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], max_length=20)),
+                ('jobs', models.PositiveIntegerField(default=0)),
+                ('retries', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'notification_type', 'status'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notificationjob',
+            index=models.Index(fields=['created_at'], name='notifjob_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificationjobsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'notification_type', 'status'), name='notifjobsummary_day_unique'),
+        ),
+    ]
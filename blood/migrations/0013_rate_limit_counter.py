@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0012_notification_job_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('count', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -6,8 +6,12 @@ from datetime import date
 from django.utils import timezone
 import math
 
+# The eight ABO/Rh groups tracked in Stock, in display order
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-')
+GROUP_INDEX = {group: index for index, group in enumerate(BLOOD_GROUPS)}
+
 class Stock(models.Model):
-    bloodgroup=models.CharField(max_length=10)
+    bloodgroup=models.CharField(max_length=10,unique=True)
     unit=models.PositiveIntegerField(default=0)
     def __str__(self):
         return self.bloodgroup
@@ -22,6 +26,16 @@ class BloodRequest(models.Model):
     unit=models.PositiveIntegerField(default=0)
     status=models.CharField(max_length=20,default="Pending")
     date=models.DateField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Admin request queues: filter on status, keyset-paginate on id
+            models.Index(fields=['status', 'id'], name='bloodreq_status_id_idx'),
+            # Donor and patient dashboards count their requests per status
+            models.Index(fields=['request_by_donor', 'status'], name='bloodreq_donor_status_idx'),
+            models.Index(fields=['request_by_patient', 'status'], name='bloodreq_patient_status_idx'),
+        ]
+
     def __str__(self):
         return self.bloodgroup
 
@@ -40,15 +54,29 @@ class Certificate(models.Model):
     issued_date = models.DateField(auto_now_add=True)
     donation_count = models.PositiveIntegerField()
     certificate_id = models.CharField(max_length=20, unique=True)
+    # Rendered once on first download; see blood.certificate_pdf
+    pdf = models.FileField(upload_to='certificates/', blank=True)
+    pdf_sha256 = models.CharField(max_length=64, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['donor', 'certificate_type'], name='certificate_donor_type_idx'),
+        ]
     
     def __str__(self):
         return f"{self.donor.get_name} - {self.get_certificate_type_display()}"
     
     def save(self, *args, **kwargs):
         if not self.certificate_id:
-            self.certificate_id = f"CERT{self.donor.id}{date.today().strftime('%Y%m%d')}"
+            self.certificate_id = self.make_certificate_id(self.donor_id, self.certificate_type)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def make_certificate_id(cls, donor_id, certificate_type, issued=None):
+        """CERT<donor id><issue date><tier>, unique even when several tiers are awarded on one day"""
+        tier = [value for value, _ in cls.CERTIFICATE_TYPES].index(certificate_type)
+        return f"CERT{donor_id}{(issued or date.today()).strftime('%Y%m%d')}{tier}"
+
 # Sponsors and Hospitals System
 class Sponsor(models.Model):
     name = models.CharField(max_length=100)
@@ -201,6 +229,11 @@ class NotificationJob(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notifjob_user_created_idx'),
+            # Finds the jobs past retention; see blood.retention
+            models.Index(fields=['created_at'], name='notifjob_created_idx'),
+        ]
     
     def __str__(self):
         return f"Notification for {self.user.username} - {self.status}"
@@ -225,4 +258,54 @@ class NotificationJob(models.Model):
     @property
     def can_retry(self):
         """Check if notification can be retried"""
-        return self.retry_count < self.max_retries and self.status == 'FAILED'
\ No newline at end of file
+        return self.retry_count < self.max_retries and self.status == 'FAILED'
+
+class NotificationJobSummary(models.Model):
+    """Daily job counts, kept after old NotificationJobs are cleaned up"""
+    day = models.DateField()
+    notification_type = models.CharField(max_length=10, choices=NotificationJob.NOTIFICATION_TYPES)
+    status = models.CharField(max_length=20, choices=NotificationJob.STATUS_CHOICES)
+    jobs = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day', 'notification_type', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'notification_type', 'status'], name='notifjobsummary_day_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.notification_type} {self.status}: {self.jobs}"
+
+class StockForecast(models.Model):
+    """Projected demand and days until stockout per blood group, refreshed nightly"""
+    bloodgroup = models.CharField(max_length=10, unique=True)
+    current_units = models.PositiveIntegerField(default=0)
+    daily_demand = models.FloatField(default=0)
+    daily_supply = models.FloatField(default=0)
+    days_until_stockout = models.FloatField(null=True, blank=True)
+    history_days = models.PositiveIntegerField(default=0)
+    generated_at = models.DateTimeField(default=timezone.now)
+
+    # Projections at or below this many days are flagged on the dashboard
+    WARNING_DAYS = 7
+
+    class Meta:
+        ordering = ['bloodgroup']
+
+    def __str__(self):
+        return f"{self.bloodgroup} forecast ({self.generated_at:%Y-%m-%d})"
+
+    @property
+    def is_at_risk(self):
+        """Check if a stockout is projected within the warning window"""
+        return self.days_until_stockout is not None and self.days_until_stockout <= self.WARNING_DAYS
+
+class RateLimitCounter(models.Model):
+    """One fixed-window request count of blood.ratelimit's database store"""
+    key = models.CharField(max_length=200, unique=True)
+    count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
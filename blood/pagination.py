@@ -0,0 +1,74 @@
+"""
+Keyset pagination for the admin list pages
+
+Pages are addressed by the primary key of the last row shown (``?after=``)
+or the first row shown (``?before=``) instead of an offset, so every page is
+an index range scan of the same cost however deep the admin scrolls, and no
+COUNT(*) over the whole table is needed. Rows are ordered newest first by
+primary key, which is unique and therefore stable across pages.
+"""
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class KeysetPage:
+    """One page of rows plus the cursors needed to link its neighbours"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.has_previous and self.object_list else None
+
+
+def _cursor(request, name):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def keyset_paginate(request, queryset, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Return the page of ``queryset`` selected by the request's cursor
+
+    Args:
+        request: view request carrying an optional ``after`` or ``before`` id
+        queryset: rows to page through; any existing ordering is replaced
+        per_page: rows per page
+
+    Returns:
+        KeysetPage: at most ``per_page`` rows, newest first
+    """
+    after = _cursor(request, 'after')
+    before = _cursor(request, 'before')
+
+    if before is not None:
+        # Walk backwards from the cursor, then flip the rows back to newest first
+        rows = list(queryset.filter(pk__gt=before).order_by('pk')[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        # Older rows follow unless the cursor is past the newest row (e.g. it was deleted)
+        return KeysetPage(rows, has_next=bool(rows), has_previous=has_previous)
+
+    if after is not None:
+        queryset = queryset.filter(pk__lt=after)
+    rows = list(queryset.order_by('-pk')[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], has_next=has_next, has_previous=after is not None)
@@ -0,0 +1,115 @@
+"""
+Donor and patient profile loading for the self-service pages
+
+A profile is fetched together with its user's names in one query and
+kept in the shared cache (common to every worker process, see
+settings.CACHES) for a short time, so a donor moving between their pages
+costs no profile queries at all. Within a request the profile is loaded
+at most once (see RoleMiddleware). Saving or deleting the profile or its
+user drops the cached copy, again once the change commits so that no
+process caches the old values in between.
+
+Only the fields the self-service pages read are cached, as plain values;
+the rest, such as the Aadhaar number and the password hash, stay out of
+the cache and are loaded from the database if ever accessed.
+"""
+from functools import partial, wraps
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Q
+from django.shortcuts import redirect
+
+PROFILE_CACHE_TIMEOUT = 60
+
+DONOR_FIELDS = ('id', 'user_id', 'profile_pic', 'bloodgroup', 'address', 'mobile',
+                'approved_donations', 'certificate_tiers')
+PATIENT_FIELDS = ('id', 'user_id', 'profile_pic', 'age', 'bloodgroup', 'disease', 'doctorname',
+                  'address', 'mobile')
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email')
+
+
+def _cache_key(kind, user_id):
+    return f'blood:profile:{kind}:{user_id}'
+
+
+def _get(kind, model, fields, user_id):
+    key = _cache_key(kind, user_id)
+    values = cache.get(key)
+    if values is None:
+        values = model.objects.filter(user_id=user_id).values_list(
+            *fields, *(f'user__{field}' for field in USER_FIELDS)
+        ).get()
+        cache.set(key, values, PROFILE_CACHE_TIMEOUT)
+    # Fields left out are deferred, as with only()
+    profile = model.from_db(DEFAULT_DB_ALIAS, fields, values[:len(fields)])
+    profile.user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values[len(fields):])
+    return profile
+
+
+def get_donor(user_id):
+    """Donor of a user, with the user's names loaded; raises Donor.DoesNotExist"""
+    from donor.models import Donor
+    return _get('donor', Donor, DONOR_FIELDS, user_id)
+
+
+def get_patient(user_id):
+    """Patient of a user, with the user's names loaded; raises Patient.DoesNotExist"""
+    from patient.models import Patient
+    return _get('patient', Patient, PATIENT_FIELDS, user_id)
+
+
+def invalidate(user_id):
+    invalidate_many([user_id])
+
+
+def invalidate_many(user_ids):
+    """Drop the cached profiles of the given users, now and once the current transaction commits"""
+    keys = [_cache_key(kind, user_id) for user_id in user_ids for kind in ('donor', 'patient')]
+    cache.delete_many(keys)
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+def profile_changed(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+
+def request_counts(**owner):
+    """
+    Dashboard counters of the blood requests made by one donor or patient
+
+    Args:
+        owner: request_by_donor=... or request_by_patient=...
+
+    Returns:
+        dict: requestpending, requestapproved, requestmade and requestrejected,
+        from a single aggregate query
+    """
+    from .models import BloodRequest
+    return BloodRequest.objects.filter(**owner).aggregate(
+        requestpending=Count('id', filter=Q(status='Pending')),
+        requestapproved=Count('id', filter=Q(status='Approved')),
+        requestmade=Count('id'),
+        requestrejected=Count('id', filter=Q(status='Rejected')),
+    )
+
+
+def _profile_required(attribute, login_url):
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(request, attribute, None):
+                return redirect(login_url)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Self-service views use request.donor / request.patient set by RoleMiddleware
+donor_required = _profile_required('donor', 'donorlogin')
+patient_required = _profile_required('patient', 'patientlogin')
@@ -0,0 +1,406 @@
+"""
+SMS and email provider clients
+
+Building a Twilio or SendGrid client per message costs a new HTTPS
+connection (TCP and TLS handshakes) every time. Clients are built here
+instead, once per worker process, from the NOTIFICATION_SMS_PROVIDER and
+NOTIFICATION_EMAIL_PROVIDER settings, and reused for every message; each
+keeps a pooled keep-alive HTTP session. The registry is rebuilt after a
+fork, since a pooled connection must not be shared between processes.
+
+Django email opens one SMTP connection per message unless it is given
+one, so senders of many messages wrap them in email_batch(), which keeps
+one connection open for the whole batch.
+
+A job's SMS is sent on send_pool(), a small per-process thread pool, while
+its email goes out from the job's own thread; every channel has its own
+timeout (NOTIFICATION_SMS_TIMEOUT, NOTIFICATION_EMAIL_TIMEOUT). The HTTP
+clients split what is left of it after the wait for a reply between their
+connection attempts (http_timeout()). The reply itself gets its own
+NOTIFICATION_HTTP_READ_TIMEOUT and is never retried; an SMS still waiting
+when its channel times out is followed up by tasks.follow_late_sms().
+
+The 'fake' provider sends nothing and records every message in memory,
+optionally after a delay, for tests and benchmarks; override() swaps in
+any client for a block of code.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.signals import setting_changed
+
+# Optional imports for external services
+try:
+    import requests
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+try:
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client as TwilioClient
+    TWILIO_AVAILABLE = True
+except ImportError:
+    TWILIO_AVAILABLE = False
+
+try:
+    from sendgrid.helpers.mail import Mail
+    SENDGRID_AVAILABLE = requests is not None
+except ImportError:
+    SENDGRID_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SENDGRID_SEND_URL = 'https://api.sendgrid.com/v3/mail/send'
+
+# Seconds a channel may take to send one message, unless set in settings
+DEFAULT_TIMEOUT = 10
+
+# Threads sending SMS per process, unless NOTIFICATION_SEND_THREADS is set
+DEFAULT_SEND_THREADS = 8
+
+# Keep-alive connections kept per provider session
+HTTP_POOL_SIZE = 10
+
+# Extra attempts after a provider answers 429 (throttled) or 503 (unavailable),
+# or when no connection could be made. Read timeouts and other errors are not
+# retried: the message may already have gone out.
+HTTP_RETRIES = 2
+HTTP_RETRY_STATUSES = (429, 503)
+HTTP_BACKOFF_FACTOR = 0.2
+
+# Seconds to wait for a provider's reply, unless NOTIFICATION_HTTP_READ_TIMEOUT is set
+DEFAULT_HTTP_READ_TIMEOUT = 5
+
+# Floor of the connect timeout, for channel timeouts too short to split
+MIN_HTTP_TIMEOUT = 0.05
+
+
+def _mount_pool(session):
+    """Keep-alive pool on a requests session, retrying throttled requests with backoff"""
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(
+            total=HTTP_RETRIES,
+            read=0,
+            other=0,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            allowed_methods=None,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            # A Retry-After header could wait past the channel's timeout
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        ),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+class ProviderError(Exception):
+    """A provider refused or failed to deliver a message"""
+
+
+class TwilioSms:
+    name = 'twilio'
+
+    def __init__(self, account_sid, auth_token, from_number, base_url=None):
+        self.from_number = from_number
+        # The client's HTTP session pools connections to the API
+        http_client = TwilioHttpClient(pool_connections=True)
+        # Passed on to requests as is; the constructor only takes a single number
+        http_client.timeout = http_timeout('sms')
+        _mount_pool(http_client.session)
+        self.client = TwilioClient(account_sid, auth_token, http_client=http_client)
+        if base_url:
+            # e.g. a local simulator (see blood.simulator)
+            self.client.api.base_url = base_url.rstrip('/')
+
+    def send_sms(self, to, body):
+        """Send one SMS; returns the message SID"""
+        return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+
+
+class SendGridEmail:
+    name = 'sendgrid'
+
+    def __init__(self, api_key, from_email, send_url=SENDGRID_SEND_URL):
+        self.from_email = from_email
+        self.send_url = send_url
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+        _mount_pool(self.session)
+
+    def send_email(self, to_email, subject, html_content, text_content):
+        """Send one email; returns the API's HTTP status code"""
+        mail = Mail(
+            from_email=self.from_email,
+            to_emails=to_email,
+            subject=subject,
+            html_content=html_content,
+            plain_text_content=text_content
+        )
+        response = self.session.post(self.send_url, json=mail.get(), timeout=http_timeout('email'))
+        if response.status_code >= 400:
+            raise ProviderError(f"SendGrid answered {response.status_code}: {response.text[:200]}")
+        return response.status_code
+
+
+class DjangoEmail:
+    name = 'django'
+
+    def __init__(self, from_email):
+        self.from_email = from_email
+
+    def send_email(self, to_email, subject, html_content, text_content):
+        """Send one email through the open email_batch() connection, if any; returns the count sent"""
+        msg = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=self.from_email,
+            to=[to_email],
+            connection=_batch_connection() or get_connection(timeout=timeout('email')),
+        )
+        msg.attach_alternative(html_content, "text/html")
+        return msg.send()
+
+
+class FakeProvider:
+    """Records messages instead of sending them, each after ``latency`` seconds"""
+    name = 'fake'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sms = []
+        self.emails = []
+
+    def send_sms(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.sms.append((to, body))
+            return f'FAKE{len(self.sms)}'
+
+    def send_email(self, to_email, subject, html_content, text_content):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.emails.append((to_email, subject, text_content))
+        return 1
+
+
+def _from_email():
+    return os.environ.get('EMAIL_FROM_ADDRESS', settings.DEFAULT_FROM_EMAIL)
+
+
+def _build_twilio():
+    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    from_number = os.environ.get('TWILIO_FROM_NUMBER')
+    if not TWILIO_AVAILABLE or not all([account_sid, auth_token, from_number]):
+        return None
+    return TwilioSms(account_sid, auth_token, from_number, base_url=os.environ.get('TWILIO_API_URL'))
+
+
+def _build_sendgrid():
+    api_key = os.environ.get('SENDGRID_API_KEY')
+    if not SENDGRID_AVAILABLE or not api_key:
+        return None
+    return SendGridEmail(
+        api_key, os.environ.get('EMAIL_FROM_ADDRESS', 'noreply@bloodbank.com'),
+        send_url=os.environ.get('SENDGRID_API_URL', SENDGRID_SEND_URL)
+    )
+
+
+def _build_django():
+    return DjangoEmail(_from_email())
+
+
+def _build_email_auto():
+    # SendGrid when it is set up, otherwise Django's email backend
+    return _build_sendgrid() or _build_django()
+
+
+BUILDERS = {
+    'sms': {
+        'twilio': _build_twilio,
+        'fake': FakeProvider,
+    },
+    'email': {
+        'auto': _build_email_auto,
+        'sendgrid': _build_sendgrid,
+        'django': _build_django,
+        'fake': FakeProvider,
+    },
+}
+
+SETTINGS = {
+    'sms': 'NOTIFICATION_SMS_PROVIDER',
+    'email': 'NOTIFICATION_EMAIL_PROVIDER',
+}
+
+DEFAULTS = {
+    'sms': 'twilio',
+    'email': 'auto',
+}
+
+_lock = threading.Lock()
+_clients = {}
+_pid = None
+_fakes = {}
+_overrides = {}
+_pool = None
+
+
+def provider_name(kind):
+    """Configured provider for 'sms' or 'email'"""
+    return getattr(settings, SETTINGS[kind], DEFAULTS[kind])
+
+
+def timeout(kind):
+    """Seconds one 'sms' or 'email' send may take"""
+    return getattr(settings, f'NOTIFICATION_{kind.upper()}_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def http_read_timeout():
+    """Seconds an HTTP client waits for a provider's reply"""
+    return getattr(settings, 'NOTIFICATION_HTTP_READ_TIMEOUT', DEFAULT_HTTP_READ_TIMEOUT)
+
+
+def http_timeout(kind):
+    """
+    (connect, read) timeouts of an HTTP client, as requests takes them
+
+    Reads are not retried, so the reply gets the whole http_read_timeout().
+    Connecting may be tried 1 + HTTP_RETRIES times; those waits, the backoff
+    between them (none before the first, then HTTP_BACKOFF_FACTOR * 2^n) and
+    the read add up to at most timeout(kind) when it leaves room for them.
+    """
+    read = http_read_timeout()
+    backoff = sum(HTTP_BACKOFF_FACTOR * 2 ** n for n in range(1, HTTP_RETRIES))
+    connect = max(MIN_HTTP_TIMEOUT, (timeout(kind) - read - backoff) / (1 + HTTP_RETRIES))
+    return connect, read
+
+
+def _check_fork():
+    # Call with _lock held
+    global _pid, _pool
+    if _pid != os.getpid():
+        _clients.clear()
+        _pool = None
+        _pid = os.getpid()
+
+
+def get(kind, name=None):
+    """
+    Shared client of a provider, built on first use in this process
+
+    Args:
+        kind: 'sms' or 'email'
+        name: provider name; defaults to the configured one
+
+    Returns:
+        the client, or None when the provider is not installed or configured
+    """
+    if name is None and kind in _overrides:
+        return _overrides[kind]
+    name = name or provider_name(kind)
+    key = (kind, name)
+    with _lock:
+        _check_fork()
+        if key not in _clients:
+            if name == 'fake':
+                # One fake per process records both kinds of message
+                _clients[key] = _fakes.setdefault('fake', FakeProvider())
+            else:
+                _clients[key] = BUILDERS[kind][name]()
+        return _clients[key]
+
+
+def fake():
+    """The in-memory fake provider of this process"""
+    with _lock:
+        return _fakes.setdefault('fake', FakeProvider())
+
+
+def reset():
+    """Drop every client so the next get() builds them from current settings"""
+    with _lock:
+        _clients.clear()
+        _fakes.clear()
+
+
+@contextmanager
+def override(**clients):
+    """Use the given clients as the configured 'sms' and/or 'email' provider inside the block"""
+    previous = dict(_overrides)
+    _overrides.update(clients)
+    try:
+        yield
+    finally:
+        _overrides.clear()
+        _overrides.update(previous)
+
+
+def send_pool():
+    """This process's bounded pool of threads for provider calls"""
+    global _pool
+    with _lock:
+        _check_fork()
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'NOTIFICATION_SEND_THREADS', DEFAULT_SEND_THREADS),
+                thread_name_prefix='notification-send',
+            )
+        return _pool
+
+
+def _settings_changed(setting, **kwargs):
+    if setting in SETTINGS.values():
+        reset()
+
+
+setting_changed.connect(_settings_changed)
+
+
+_batch = threading.local()
+
+
+def _batch_connection():
+    """Connection of the current email_batch(), opened on first use; None outside a batch"""
+    if not getattr(_batch, 'active', False):
+        return None
+    if _batch.connection is None:
+        connection = get_connection(timeout=timeout('email'))
+        # Opened here, the backend leaves it open between messages
+        connection.open()
+        _batch.connection = connection
+    return _batch.connection
+
+
+@contextmanager
+def email_batch():
+    """
+    Send every Django email of the block over one SMTP connection
+
+    The connection is only opened if the block sends a Django email.
+    Nested batches share the outer connection.
+    """
+    if getattr(_batch, 'active', False):
+        yield
+        return
+    _batch.active, _batch.connection = True, None
+    try:
+        yield
+    finally:
+        connection = _batch.connection
+        _batch.active, _batch.connection = False, None
+        if connection is not None:
+            connection.close()
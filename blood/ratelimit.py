@@ -0,0 +1,231 @@
+"""
+Sliding-window rate limiter on a shared, atomic counter store
+
+A limit only holds if every web worker counts into the same place, and
+counts atomically: a get-then-set on a per-process cache lets each gunicorn
+worker grant the full quota again, and lets concurrent requests overwrite
+each other's increments.
+
+Counts are kept per fixed window (``window`` seconds) in a shared store
+with an atomic increment. A request's rate is estimated as the previous
+window's count weighted by how much of it still overlaps the sliding
+window, plus the current window's count:
+
+    rate = previous * (1 - elapsed / window) + current
+
+This smooths the burst at window edges that plain fixed windows allow
+(twice the limit across a boundary) with two counters per client instead
+of a log of every request. A rejected request's increment is taken back,
+so retrying while throttled does not push the block further out.
+
+Stores, chosen by RATE_LIMIT_STORE:
+
+- 'redis': INCR, EXPIRE and GET in one MULTI/EXEC at RATE_LIMIT_REDIS_URL.
+- 'database': RateLimitCounter rows bumped with UPDATE ... count + 1, for
+  hosts without Redis. Every throttled request pays for it: an UPDATE (an
+  INSERT as well in a new window) and a SELECT in one short transaction,
+  plus the DELETE of expired rows on roughly one hit in a hundred. That is
+  the price of exact counts shared by every worker; set REDIS_URL to move
+  them off the database.
+- 'cache': Django's default cache (add, then incr). Atomic only with
+  Django's Redis cache backend; DatabaseCache, the default without Redis,
+  reads and then writes, so concurrent hits can be lost.
+
+blood.throttling plugs the limiter into DRF.
+"""
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import RateLimitCounter
+
+# Optional import for the shared store
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'blood:ratelimit:'
+
+# Share of database store hits that also delete expired counters
+CULL_PROBABILITY = 0.01
+
+Decision = namedtuple('Decision', ['allowed', 'rate', 'limit', 'retry_after'])
+
+
+class RedisStore:
+    def __init__(self, url):
+        # redis-py's pool reconnects after a fork by itself
+        self.client = redis.Redis.from_url(url)
+
+    def incr(self, key, previous_key, ttl):
+        """Add one to ``key``; returns (previous window count, current window count)"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        return int(previous or 0), int(current)
+
+    def decr(self, key):
+        self.client.decr(key)
+
+
+class DatabaseStore:
+    def incr(self, key, previous_key, ttl):
+        """Add one to ``key``; returns (previous window count, current window count)"""
+        counters = RateLimitCounter.objects.filter(key=key)
+        with transaction.atomic():
+            if not counters.update(count=F('count') + 1):
+                try:
+                    with transaction.atomic():
+                        RateLimitCounter.objects.create(
+                            key=key, count=1, expires_at=timezone.now() + timedelta(seconds=ttl)
+                        )
+                except IntegrityError:
+                    # Another request created it first
+                    counters.update(count=F('count') + 1)
+            # Read under the row lock the update took
+            counts = dict(
+                RateLimitCounter.objects.filter(key__in=[key, previous_key]).values_list('key', 'count')
+            )
+        if random.random() < CULL_PROBABILITY:
+            self.cull()
+        return counts.get(previous_key, 0), counts.get(key, 1)
+
+    def decr(self, key):
+        RateLimitCounter.objects.filter(key=key).update(count=F('count') - 1)
+
+    def cull(self):
+        RateLimitCounter.objects.filter(expires_at__lt=timezone.now()).delete()
+
+
+class CacheStore:
+    def incr(self, key, previous_key, ttl):
+        """Add one to ``key``; returns (previous window count, current window count)"""
+        cache.add(key, 0, ttl)
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.add(key, 0, ttl)
+            current = cache.incr(key)
+        return cache.get(previous_key, 0), current
+
+    def decr(self, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+
+def _build_redis():
+    if not REDIS_AVAILABLE:
+        raise RuntimeError("RATE_LIMIT_STORE is 'redis' but the redis package is not installed")
+    return RedisStore(getattr(settings, 'RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0'))
+
+
+STORES = {
+    'redis': _build_redis,
+    'database': DatabaseStore,
+    'cache': CacheStore,
+}
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def get_store():
+    """Configured counter store of this process, built on first use"""
+    name = getattr(settings, 'RATE_LIMIT_STORE', 'database')
+    with _lock:
+        if name not in _stores:
+            _stores[name] = STORES[name]()
+        return _stores[name]
+
+
+def _settings_changed(setting, **kwargs):
+    if setting in ('RATE_LIMIT_STORE', 'RATE_LIMIT_REDIS_URL'):
+        with _lock:
+            _stores.clear()
+
+
+setting_changed.connect(_settings_changed)
+
+
+def _retry_after(previous, current, fraction, limit, window):
+    """Seconds until one more request fits, given the counts without it"""
+    room = limit - current - 1
+    if room >= 0 and previous:
+        # Later in this window, once enough of the previous one has slid out
+        return max(0.0, (1 - room / previous - fraction) * window)
+    # In the next window, where this window's count becomes the previous one
+    wait = (1 - fraction) * window
+    if current >= limit:
+        wait += (1 - (limit - 1) / current) * window
+    return wait
+
+
+class SlidingWindowLimiter:
+    """
+    At most ``limit`` hits per ``window`` seconds per identity
+
+    Args:
+        name: kept apart from other limiters' counts, e.g. a throttle scope
+        limit: hits allowed per sliding window
+        window: window length in seconds
+        store: counter store; defaults to get_store()
+    """
+
+    def __init__(self, name, limit, window, store=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.store = store
+
+    def _key(self, ident, bucket):
+        return f'{KEY_PREFIX}{self.name}:{ident}:{bucket}'
+
+    def hit(self, ident, now=None):
+        """
+        Count one hit by ``ident`` unless it would exceed the limit
+
+        Returns:
+            Decision: allowed, the estimated rate, the limit and, when
+            refused, seconds until a retry can succeed
+        """
+        store = self.store or get_store()
+        now = time.time() if now is None else now
+        bucket, offset = divmod(now, self.window)
+        bucket, fraction = int(bucket), offset / self.window
+        key = self._key(ident, bucket)
+
+        # The counter outlives its own window so it can serve as the next one's previous count
+        previous, current = store.incr(key, self._key(ident, bucket - 1), ttl=2 * self.window)
+        rate = previous * (1 - fraction) + current
+        if rate <= self.limit:
+            return Decision(True, rate, self.limit, 0.0)
+
+        store.decr(key)
+        return Decision(
+            False, rate, self.limit,
+            _retry_after(previous, current - 1, fraction, self.limit, self.window)
+        )
+
+    def undo(self, ident, now):
+        """Take back the hit ``hit(ident, now)`` counted, e.g. after another limit refused the request"""
+        store = self.store or get_store()
+        store.decr(self._key(ident, int(now // self.window)))
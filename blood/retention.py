@@ -0,0 +1,137 @@
+"""
+NotificationJob retention
+
+Every notify_hospitals call leaves a NotificationJob behind, so the table
+grows without bound and the per-user history scans slow down with it.
+cleanup_notification_jobs() removes finished (COMPLETED or FAILED) jobs
+older than NOTIFICATION_JOB_RETENTION_DAYS.
+
+Deleting them with one statement would lock a large range of rows for as
+long as it runs. Instead the old jobs' primary-key range is walked in
+windows of ``chunk_size`` ids, each handled in its own short transaction:
+
+1. the window's finished jobs are selected by id;
+2. unless NOTIFICATION_JOB_SUMMARIES is off, their counts are added to
+   NotificationJobSummary, one row per day, type and status, so reporting
+   survives the cleanup;
+3. exactly those ids are deleted.
+
+Jobs still PENDING or PROCESSING are never removed, however old.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import NotificationJob, NotificationJobSummary
+
+logger = logging.getLogger(__name__)
+
+# Days finished jobs are kept, unless NOTIFICATION_JOB_RETENTION_DAYS is set
+DEFAULT_RETENTION_DAYS = 30
+
+# Ids per transaction
+DEFAULT_CHUNK_SIZE = 1000
+
+FINISHED_STATUSES = ('COMPLETED', 'FAILED')
+
+
+class CleanupResult:
+    """Counters of one cleanup run"""
+
+    def __init__(self):
+        self.deleted = 0
+        self.summarized = 0
+        self.chunks = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.deleted / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'deleted': self.deleted,
+            'summarized': self.summarized,
+            'chunks': self.chunks,
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def retention_days():
+    return getattr(settings, 'NOTIFICATION_JOB_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def _summarize(ids):
+    """Add the counts of the given jobs to NotificationJobSummary; returns the summary rows touched"""
+    rows = (
+        NotificationJob.objects.filter(pk__in=ids)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'notification_type', 'status')
+        .annotate(jobs=Count('pk'), retries=Sum('retry_count'))
+        .order_by()
+    )
+    touched = 0
+    for row in rows:
+        summary, _ = NotificationJobSummary.objects.get_or_create(
+            day=row['day'], notification_type=row['notification_type'], status=row['status']
+        )
+        # F() so concurrent runs add up instead of overwriting each other
+        NotificationJobSummary.objects.filter(pk=summary.pk).update(
+            jobs=F('jobs') + row['jobs'],
+            retries=F('retries') + (row['retries'] or 0),
+        )
+        touched += 1
+    return touched
+
+
+def cleanup_notification_jobs(days=None, chunk_size=DEFAULT_CHUNK_SIZE, summarize=None):
+    """
+    Delete finished NotificationJobs past retention, one id window at a time
+
+    Args:
+        days: jobs created this many days ago or earlier go; defaults to
+            NOTIFICATION_JOB_RETENTION_DAYS
+        chunk_size: ids per transaction
+        summarize: roll counts into NotificationJobSummary first; defaults
+            to NOTIFICATION_JOB_SUMMARIES
+
+    Returns:
+        CleanupResult: rows deleted, summary rows touched, chunks and throughput
+    """
+    if days is None:
+        days = retention_days()
+    if summarize is None:
+        summarize = getattr(settings, 'NOTIFICATION_JOB_SUMMARIES', True)
+
+    result = CleanupResult()
+    started = time.perf_counter()
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = NotificationJob.objects.filter(created_at__lt=cutoff, status__in=FINISHED_STATUSES)
+    bounds = expired.aggregate(low=Min('pk'), high=Max('pk'))
+
+    if bounds['low'] is not None:
+        start = bounds['low']
+        while start <= bounds['high']:
+            end = start + chunk_size
+            with transaction.atomic():
+                ids = list(expired.filter(pk__gte=start, pk__lt=end).values_list('pk', flat=True))
+                if ids:
+                    if summarize:
+                        result.summarized += _summarize(ids)
+                    result.deleted += NotificationJob.objects.filter(pk__in=ids).delete()[0]
+            result.chunks += 1
+            start = end
+
+    result.elapsed = time.perf_counter() - started
+    if result.deleted:
+        logger.info(
+            f"Deleted {result.deleted} notification jobs older than {days} days in {result.chunks} chunks "
+            f"({result.rows_per_second:.0f} rows/s)"
+        )
+    return result
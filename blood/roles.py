@@ -0,0 +1,96 @@
+"""
+Per-user role resolution
+
+Whether a user is a donor or a patient, and the id of their profile, is
+resolved with two small queries and kept in the shared cache (common to
+every worker process, see settings.CACHES) so that later requests need
+none. The DONOR group takes precedence, then PATIENT; staff in neither
+are admins. Group membership, profile and user changes clear the entry
+through the receivers below, again once the change commits so that no
+process caches the old role in between.
+"""
+from functools import partial
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+
+ROLE_ADMIN = 'admin'
+ROLE_DONOR = 'donor'
+ROLE_PATIENT = 'patient'
+
+ROLE_CACHE_TIMEOUT = 60 * 60
+
+_GROUPS = ('DONOR', 'PATIENT')
+
+
+def _cache_key(user_id):
+    return f'blood:role:{user_id}'
+
+
+def _load(user):
+    from donor.models import Donor
+    from patient.models import Patient
+
+    groups = set(user.groups.filter(name__in=_GROUPS).values_list('name', flat=True))
+    if 'DONOR' in groups:
+        return ROLE_DONOR, Donor.objects.filter(user_id=user.id).values_list('id', flat=True).first(), None
+    if 'PATIENT' in groups:
+        return ROLE_PATIENT, None, Patient.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    if user.is_staff:
+        return ROLE_ADMIN, None, None
+    return None, None, None
+
+
+def resolve(user):
+    """
+    Role and profile ids of a user, from the shared cache when possible
+
+    Args:
+        user: User or AnonymousUser
+
+    Returns:
+        tuple: (role, donor_id, patient_id); staff outside the DONOR and
+        PATIENT groups are ROLE_ADMIN, and role is None for anonymous users
+        and accounts with no other access
+    """
+    if not user.is_authenticated:
+        return None, None, None
+    key = _cache_key(user.id)
+    resolved = cache.get(key)
+    if resolved is None:
+        resolved = _load(user)
+        cache.set(key, resolved, ROLE_CACHE_TIMEOUT)
+    return resolved
+
+
+def get_role(user):
+    """Cached role of a user; see resolve()"""
+    return resolve(user)[0]
+
+
+def invalidate(user_ids):
+    """Drop the cached roles of the given users, now and once the current transaction commits"""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+def profile_changed(sender, instance, **kwargs):
+    invalidate([instance.user_id])
+
+
+def user_changed(sender, instance, **kwargs):
+    # is_staff decides the role of users outside both groups
+    invalidate([instance.pk])
+
+
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not isinstance(instance, Group):
+        if action.startswith('post_'):
+            invalidate([instance.pk])
+    elif action == 'pre_clear':
+        # post_clear does not say which users were removed
+        invalidate(list(instance.user_set.values_list('pk', flat=True)))
+    elif action in ('post_add', 'post_remove'):
+        invalidate(pk_set)
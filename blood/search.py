@@ -0,0 +1,448 @@
+"""
+Full-text search over donors, patients and blood requests
+
+One search table holds a document per donor, patient and blood request:
+an FTS5 virtual table on SQLite and a weighted ``tsvector`` column with a
+GIN index on PostgreSQL (both created, and filled from existing rows, by
+migration 0010). Documents are kept in sync by signal receivers rather
+than database triggers, because donor and patient names live on
+``auth_user`` and a trigger cannot follow that join. ``manage.py
+rebuild_search_index`` repopulates the table in bulk.
+
+Matches are ranked by the database (bm25 / ts_rank) with names weighted
+above blood group, mobile, address and reason, and paged with
+LIMIT/OFFSET, so a query touches only the index and one page of rows.
+Django admin narrows its querysets with a subquery on the index and
+orders them by rank (matching() and rank_order()). On other databases,
+search falls back to unindexed ``icontains`` filters.
+
+Whether the table exists is looked up once per process and again after
+each migrate, not on every save.
+"""
+import logging
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'blood_search'
+
+KIND_DONOR = 1
+KIND_PATIENT = 2
+KIND_REQUEST = 3
+KIND_NAMES = {KIND_DONOR: 'donor', KIND_PATIENT: 'patient', KIND_REQUEST: 'request'}
+KINDS = {name: kind for kind, name in KIND_NAMES.items()}
+
+DEFAULT_PAGE_SIZE = 20
+
+# Tokenizers drop '+' and '-', so blood groups are indexed as single words
+BLOOD_GROUP_TOKENS = {
+    'A+': 'apos', 'A-': 'aneg', 'B+': 'bpos', 'B-': 'bneg',
+    'AB+': 'abpos', 'AB-': 'abneg', 'O+': 'opos', 'O-': 'oneg',
+}
+_BLOOD_GROUP_TERM = re.compile(r'(?<![\w+-])(ab|a|b|o)([+-])(?![\w+-])', re.IGNORECASE)
+_WORD = re.compile(r'\w+')
+
+
+def query_terms(query):
+    """Split a user query into index tokens, mapping blood groups like 'AB+' to theirs"""
+    query = _BLOOD_GROUP_TERM.sub(
+        lambda match: ' ' + BLOOD_GROUP_TOKENS[match.group(1).upper() + match.group(2)] + ' ',
+        query or ''
+    )
+    return [term.lower() for term in _WORD.findall(query)]
+
+
+def _full_name(user):
+    return f"{user.first_name} {user.last_name}".strip()
+
+
+def donor_document(donor):
+    """(kind, id, name, mobile, address, bloodgroup, reason) for a donor with its user loaded"""
+    return (KIND_DONOR, donor.id, _full_name(donor.user), donor.mobile, donor.address,
+            BLOOD_GROUP_TOKENS.get(donor.bloodgroup, ''), '')
+
+
+def patient_document(patient):
+    return (KIND_PATIENT, patient.id, _full_name(patient.user), patient.mobile, patient.address,
+            BLOOD_GROUP_TOKENS.get(patient.bloodgroup, ''), patient.disease)
+
+
+def request_document(blood_request):
+    return (KIND_REQUEST, blood_request.id, blood_request.patient_name, '', '',
+            BLOOD_GROUP_TOKENS.get(blood_request.bloodgroup, ''), blood_request.reason)
+
+
+class SqliteSearchBackend:
+    """FTS5 table; rowid packs (object id, kind) so updates and deletes are rowid lookups"""
+
+    RANK = f"bm25({SEARCH_TABLE}, 0, 0, 10.0, 3.0, 2.0, 5.0, 1.0)"
+
+    def _rowid(self, kind, object_id):
+        return object_id * 4 + kind
+
+    def _match(self, terms):
+        # Every term must match, each as a prefix; quoting keeps FTS5 operators literal
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def upsert(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} "
+            "(rowid, kind, object_id, name, mobile, address, bloodgroup, reason) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            [(self._rowid(doc[0], doc[1]),) + tuple(doc) for doc in documents]
+        )
+
+    def delete(self, cursor, kind, object_ids):
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+            [(self._rowid(kind, object_id),) for object_id in object_ids]
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def search(self, cursor, terms, kinds, limit, offset):
+        placeholders = ', '.join(['%s'] * len(kinds))
+        cursor.execute(
+            f"SELECT kind, object_id FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND kind IN ({placeholders}) "
+            f"ORDER BY {self.RANK} LIMIT %s OFFSET %s",
+            [self._match(terms), *kinds, limit, offset]
+        )
+        return cursor.fetchall()
+
+    def ids_sql(self, terms, kind):
+        """(sql, params) selecting the ids of every match of one kind"""
+        return (
+            f"SELECT object_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind = %s",
+            [self._match(terms), kind]
+        )
+
+    def rank_sql(self, terms, kind, id_column):
+        """(sql, params) of the rank of the row whose id is in ``id_column``; lower is better"""
+        return (
+            f"(SELECT {self.RANK} FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {id_column} * 4 + %s)",
+            [self._match(terms), kind]
+        )
+
+
+class PostgresSearchBackend:
+    """tsvector document per row with a GIN index, weighted A (name) to D (reason)"""
+
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'D')"
+    )
+
+    def upsert(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (kind, object_id, document) VALUES (%s, %s, {self.DOCUMENT}) "
+            "ON CONFLICT (kind, object_id) DO UPDATE SET document = EXCLUDED.document",
+            list(documents)
+        )
+
+    def delete(self, cursor, kind, object_ids):
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = ANY(%s)",
+            [kind, list(object_ids)]
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+
+    def _tsquery(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, cursor, terms, kinds, limit, offset):
+        cursor.execute(
+            f"SELECT kind, object_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+            "WHERE document @@ query AND kind = ANY(%s) "
+            "ORDER BY ts_rank(document, query) DESC, object_id DESC LIMIT %s OFFSET %s",
+            [self._tsquery(terms), list(kinds), limit, offset]
+        )
+        return cursor.fetchall()
+
+    def ids_sql(self, terms, kind):
+        """(sql, params) selecting the ids of every match of one kind"""
+        return (
+            f"SELECT object_id FROM {SEARCH_TABLE} WHERE kind = %s AND document @@ to_tsquery('simple', %s)",
+            [kind, self._tsquery(terms)]
+        )
+
+    def rank_sql(self, terms, kind, id_column):
+        """(sql, params) of the rank of the row whose id is in ``id_column``; lower is better"""
+        return (
+            f"(SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {SEARCH_TABLE} "
+            f"WHERE kind = %s AND object_id = {id_column})",
+            [self._tsquery(terms), kind]
+        )
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_table_ready = None
+
+
+def get_backend():
+    """Backend for the default database, or None when it has no search table"""
+    global _table_ready
+    backend_class = BACKENDS.get(connection.vendor)
+    if backend_class is None:
+        return None
+    if _table_ready is None:
+        _table_ready = SEARCH_TABLE in connection.introspection.table_names()
+    return backend_class() if _table_ready else None
+
+
+def tables_changed(**kwargs):
+    """post_migrate receiver: look for the search table again on next use"""
+    global _table_ready
+    _table_ready = None
+
+
+def index_documents(documents):
+    backend = get_backend()
+    if backend is None or not documents:
+        return
+    with connection.cursor() as cursor:
+        backend.upsert(cursor, documents)
+
+
+def remove_documents(kind, object_ids):
+    backend = get_backend()
+    if backend is None or not object_ids:
+        return
+    with connection.cursor() as cursor:
+        backend.delete(cursor, kind, object_ids)
+
+
+def _document_querysets():
+    from donor.models import Donor
+    from patient.models import Patient
+    from .models import BloodRequest
+
+    return (
+        (Donor.objects.select_related('user').only(
+            'mobile', 'address', 'bloodgroup', 'user__first_name', 'user__last_name'), donor_document),
+        (Patient.objects.select_related('user').only(
+            'mobile', 'address', 'bloodgroup', 'disease', 'user__first_name', 'user__last_name'), patient_document),
+        (BloodRequest.objects.only('patient_name', 'bloodgroup', 'reason'), request_document),
+    )
+
+
+def write_documents(cursor, backend, querysets, batch_size=2000):
+    """
+    Index every row of (queryset, document builder) pairs in batches
+
+    Returns:
+        int: number of documents indexed
+    """
+    indexed = 0
+    for queryset, build in querysets:
+        batch = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(build(obj))
+            if len(batch) >= batch_size:
+                backend.upsert(cursor, batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            backend.upsert(cursor, batch)
+            indexed += len(batch)
+    return indexed
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Repopulate the search table from scratch
+
+    Returns:
+        int: number of documents indexed
+    """
+    backend = get_backend()
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        return write_documents(cursor, backend, _document_querysets(), batch_size)
+
+
+class SearchHit:
+    """One ranked result with its model instance loaded"""
+
+    def __init__(self, kind, obj):
+        self.kind = KIND_NAMES[kind]
+        self.object = obj
+
+
+class SearchPage:
+    def __init__(self, hits, number, has_next):
+        self.hits = hits
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = number > 1
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __bool__(self):
+        return bool(self.hits)
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _load(keys):
+    """Fetch the model instances for (kind, id) keys in bulk, preserving rank order"""
+    querysets = {kind: queryset for kind, (queryset, _) in zip(KIND_NAMES, _document_querysets())}
+    wanted = {}
+    for kind, object_id in keys:
+        wanted.setdefault(kind, []).append(object_id)
+    loaded = {
+        kind: querysets[kind].defer(None).in_bulk(object_ids)
+        for kind, object_ids in wanted.items()
+    }
+    # Rows deleted since they were indexed are skipped
+    return [
+        SearchHit(kind, loaded[kind][object_id])
+        for kind, object_id in keys if object_id in loaded[kind]
+    ]
+
+
+def _fallback_keys(terms, kinds, limit, offset):
+    """Unindexed icontains search for databases without a search backend"""
+    keys = []
+    fields = {
+        KIND_DONOR: ('user__first_name', 'user__last_name', 'mobile', 'address'),
+        KIND_PATIENT: ('user__first_name', 'user__last_name', 'mobile', 'address', 'disease'),
+        KIND_REQUEST: ('patient_name', 'reason'),
+    }
+    groups = {token: group for group, token in BLOOD_GROUP_TOKENS.items()}
+    for kind, (queryset, _) in zip(KIND_NAMES, _document_querysets()):
+        if kind not in kinds:
+            continue
+        for term in terms:
+            condition = Q()
+            for field in fields[kind]:
+                condition |= Q(**{f'{field}__icontains': term})
+            if term in groups:
+                condition |= Q(bloodgroup=groups[term])
+            queryset = queryset.filter(condition)
+        keys.extend((kind, pk) for pk in queryset.order_by('-pk').values_list('pk', flat=True)[:offset + limit])
+    return keys[offset:offset + limit]
+
+
+def search(query, kinds=None, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Ranked full-text search
+
+    Args:
+        query: free text; every word must match the start of a word in the document
+        kinds: iterable of 'donor', 'patient' and/or 'request' (default: all)
+        page: 1-based page number
+        per_page: hits per page
+
+    Returns:
+        SearchPage: hits for the page, best match first
+    """
+    terms = query_terms(query)
+    page = max(1, page)
+    if not terms:
+        return SearchPage([], page, has_next=False)
+
+    kinds = [KINDS[name] for name in (kinds or KINDS)]
+    offset = (page - 1) * per_page
+    backend = get_backend()
+    if backend is None:
+        keys = _fallback_keys(terms, kinds, per_page + 1, offset)
+    else:
+        with connection.cursor() as cursor:
+            keys = backend.search(cursor, terms, kinds, per_page + 1, offset)
+
+    has_next = len(keys) > per_page
+    return SearchPage(_load(keys[:per_page]), page, has_next)
+
+
+def matching(queryset, query, kind):
+    """
+    Narrow a queryset of one kind to every match, with a subquery on the index
+
+    Returns:
+        QuerySet, or None without search terms or a search backend
+    """
+    terms = query_terms(query)
+    backend = get_backend()
+    if not terms or backend is None:
+        return None
+    return queryset.filter(pk__in=RawSQL(*backend.ids_sql(terms, KINDS[kind])))
+
+
+def rank_order(query, kind, model):
+    """
+    Ordering expression putting a model's best matches first, e.g. for ModelAdmin.get_ordering()
+
+    Returns:
+        OrderBy, or None without search terms or a search backend
+    """
+    terms = query_terms(query)
+    backend = get_backend()
+    if not terms or backend is None:
+        return None
+    quote = connection.ops.quote_name
+    id_column = f'{quote(model._meta.db_table)}.{quote(model._meta.pk.column)}'
+    return RawSQL(*backend.rank_sql(terms, KINDS[kind], id_column)).asc()
+
+
+# Signal receivers keeping documents in sync
+
+def donor_saved(sender, instance, **kwargs):
+    index_documents([donor_document(instance)])
+
+
+def patient_saved(sender, instance, **kwargs):
+    index_documents([patient_document(instance)])
+
+
+def request_saved(sender, instance, **kwargs):
+    index_documents([request_document(instance)])
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Re-index the donor or patient whose name just changed"""
+    if created or (update_fields and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    documents = []
+    for queryset, build in _document_querysets()[:2]:
+        documents.extend(build(obj) for obj in queryset.filter(user_id=instance.id))
+    index_documents(documents)
+
+
+def donor_deleted(sender, instance, **kwargs):
+    remove_documents(KIND_DONOR, [instance.id])
+
+
+def patient_deleted(sender, instance, **kwargs):
+    remove_documents(KIND_PATIENT, [instance.id])
+
+
+def request_deleted(sender, instance, **kwargs):
+    remove_documents(KIND_REQUEST, [instance.id])
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Hospital, Stock, NotificationJob
+from . import stock as stock_service
 from django.contrib.auth.models import User
 
 
@@ -27,12 +28,11 @@ class HospitalSerializer(serializers.ModelSerializer):
     def get_blood_stock(self, obj):
         """Get blood stock information grouped by type"""
         stock_data = {}
-        stocks = Stock.objects.all()
         
-        for stock in stocks:
-            stock_data[stock.bloodgroup] = {
-                'units': stock.unit,
-                'available': stock.unit > 0
+        for bloodgroup, units in stock_service.as_dict().items():
+            stock_data[bloodgroup] = {
+                'units': units,
+                'available': units > 0
             }
         
         return stock_data
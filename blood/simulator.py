@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the Twilio and SendGrid APIs
+
+ProviderSimulator serves the two endpoints notifications use, Twilio's
+Messages.json and SendGrid's mail/send, from a threaded HTTP server on
+localhost. Each request waits a configurable latency and may be throttled
+(429) or fail (500), so the real provider clients can be load-tested
+without sending anything or paying for it. Point the clients at it with
+providers.TwilioSms(base_url=...) and providers.SendGridEmail(send_url=...)
+or the TWILIO_API_URL and SENDGRID_API_URL environment variables.
+
+Every request is counted per API and status in ``stats``.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+TWILIO_MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<account_sid>[^/]+)/Messages\.json$')
+SENDGRID_SEND_PATH = '/v3/mail/send'
+
+
+class _TokenBucket:
+    """Allows ``rate`` requests per second, in bursts of up to ``rate``"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, api, status, payload=None):
+        self.server.simulator.record(api, status)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        simulator = self.server.simulator
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        match = TWILIO_MESSAGES_PATH.match(self.path)
+        if match:
+            api = 'twilio'
+        elif self.path == SENDGRID_SEND_PATH:
+            api = 'sendgrid'
+        else:
+            return self._reply('unknown', 404, {'message': 'Not found'})
+
+        outcome = simulator.decide(api)
+        if outcome == 'throttled':
+            return self._reply(api, 429, {'code': 20429, 'message': 'Too Many Requests', 'status': 429})
+        time.sleep(simulator.delay())
+        if outcome == 'error':
+            return self._reply(api, 500, {'code': 20500, 'message': 'Internal Server Error', 'status': 500})
+
+        if api == 'sendgrid':
+            return self._reply(api, 202)
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+        self._reply(api, 201, {
+            'sid': 'SM' + uuid.uuid4().hex,
+            'account_sid': match.group('account_sid'),
+            'to': form.get('To'),
+            'from': form.get('From'),
+            'body': form.get('Body'),
+            'status': 'queued',
+        })
+
+
+class ProviderSimulator:
+    """
+    Threaded local HTTP server imitating Twilio and SendGrid
+
+    Args:
+        latency: mean seconds per accepted request
+        jitter: requests take latency +/- up to this many seconds
+        error_rate: share of requests answered 500
+        throttle: requests per second each API accepts before answering 429 (0: unlimited)
+        seed: for repeatable error and latency draws
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, throttle=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def sendgrid_url(self):
+        return self.url + SENDGRID_SEND_PATH
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def decide(self, api):
+        """'throttled', 'error' or 'ok' for the next request to an API"""
+        with self._lock:
+            if self.throttle:
+                bucket = self._buckets.setdefault(api, _TokenBucket(self.throttle))
+                if not bucket.take():
+                    return 'throttled'
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 'error'
+            return 'ok'
+
+    def delay(self):
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def record(self, api, status):
+        with self._lock:
+            self.stats[api, status] += 1
+
+    def requests(self, api, status=None):
+        """Requests an API received, optionally only those answered with ``status``"""
+        with self._lock:
+            return sum(count for (name, code), count in self.stats.items()
+                       if name == api and (status is None or code == status))
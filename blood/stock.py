@@ -0,0 +1,159 @@
+"""
+Blood stock service
+
+Every write to Stock goes through this module so that the per-process
+snapshot of the eight blood groups stays consistent with the database.
+Reads are served from a fixed-size array that is reloaded only when the
+shared stock version (blood.versions) moves on. Writes bump it once their
+transaction commits.
+"""
+import logging
+import threading
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import versions
+from .models import BLOOD_GROUPS, GROUP_INDEX, Stock
+
+logger = logging.getLogger(__name__)
+
+STOCK_VERSION_KEY = 'blood:stock_version'
+STOCK_UPDATED_KEY = 'blood:stock_updated_at'
+
+# Template context names used by the admin stock pages
+CONTEXT_NAMES = {
+    'A+': 'A1', 'A-': 'A2', 'B+': 'B1', 'B-': 'B2',
+    'AB+': 'AB1', 'AB-': 'AB2', 'O+': 'O1', 'O-': 'O2',
+}
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_version = None
+
+# Callables notified with the new version after every stock write
+_listeners = []
+
+
+def get_version():
+    """Current shared stock version"""
+    return versions.get(STOCK_VERSION_KEY)
+
+
+def invalidate():
+    """Have every process reload its snapshot once the current transaction commits"""
+    transaction.on_commit(_committed)
+
+
+def _committed():
+    global _snapshot
+    version = versions.bump(STOCK_VERSION_KEY)
+    cache.set(STOCK_UPDATED_KEY, timezone.now(), timeout=None)
+    with _lock:
+        _snapshot = None
+    for listener in _listeners:
+        try:
+            listener(version)
+        except Exception as e:
+            logger.error(f"Stock listener failed: {str(e)}")
+    return version
+
+
+def last_modified():
+    """Time of the last stock write seen by the cache, or None if unknown"""
+    return cache.get(STOCK_UPDATED_KEY)
+
+
+def add_listener(listener):
+    """Register a callable to be notified with the new version after each stock write"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def snapshot():
+    """
+    Units per blood group in BLOOD_GROUPS order
+
+    Returns:
+        array: read-only view of the cached snapshot; copy before mutating
+    """
+    global _snapshot, _snapshot_version
+    version = get_version()
+    current = _snapshot
+    if current is not None and _snapshot_version == version:
+        return current
+
+    units = array('q', [0] * len(BLOOD_GROUPS))
+    for bloodgroup, unit in Stock.objects.values_list('bloodgroup', 'unit'):
+        index = GROUP_INDEX.get(bloodgroup)
+        if index is not None:
+            units[index] = unit
+    with _lock:
+        _snapshot = units
+        _snapshot_version = version
+    return units
+
+
+def get_units(bloodgroup):
+    return snapshot()[GROUP_INDEX[bloodgroup]]
+
+
+def as_dict():
+    """Units keyed by blood group"""
+    return dict(zip(BLOOD_GROUPS, snapshot()))
+
+
+def total_units():
+    return sum(snapshot())
+
+
+def template_context():
+    """Units keyed by the A1/A2/... names used in the admin stock templates"""
+    return {CONTEXT_NAMES[group]: units for group, units in as_dict().items()}
+
+
+def set_units(bloodgroup, units):
+    """Overwrite the units held for a blood group"""
+    updated = Stock.objects.filter(bloodgroup=bloodgroup).update(unit=max(0, int(units)))
+    if updated:
+        invalidate()
+    return bool(updated)
+
+
+def add_units(bloodgroup, units):
+    """Atomically add donated units to a blood group"""
+    updated = Stock.objects.filter(bloodgroup=bloodgroup).update(unit=F('unit') + units)
+    if updated:
+        invalidate()
+    return bool(updated)
+
+
+def take_units(bloodgroup, units):
+    """
+    Atomically remove units from a blood group if enough are available
+
+    Returns:
+        bool: True if the units were taken, False if stock was short
+    """
+    updated = Stock.objects.filter(bloodgroup=bloodgroup, unit__gte=units).update(unit=F('unit') - units)
+    if updated:
+        invalidate()
+    return bool(updated)
+
+
+def seed_stock(**kwargs):
+    """Create a zero-unit Stock row for any missing blood group (post_migrate hook)"""
+    existing = set(Stock.objects.values_list('bloodgroup', flat=True))
+    missing = [Stock(bloodgroup=group) for group in BLOOD_GROUPS if group not in existing]
+    if missing:
+        Stock.objects.bulk_create(missing, ignore_conflicts=True)
+        invalidate()
+        logger.info(f"Seeded stock rows for {', '.join(stock.bloodgroup for stock in missing)}")
+
+
+def stock_changed(sender, **kwargs):
+    """Signal receiver for Stock writes that bypass this module, e.g. Django admin"""
+    invalidate()
@@ -0,0 +1,131 @@
+"""
+Server-Sent Events and long-poll endpoints
+
+These are native async Django views, so under the ASGI application in
+``bloodbankmanagement/asgi.py`` each open stream or waiting long-poll is a
+coroutine waiting on a queue rather than a blocked worker thread. That
+holds only while every middleware is async-capable (see blood.middleware).
+"""
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+from . import conditional, job_status
+from .broadcast import broadcaster
+
+
+def _is_authenticated(request):
+    return request.user.is_authenticated
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+async def _check_request(request):
+    """Error response for anything but an authenticated GET, else None"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not await sync_to_async(_is_authenticated)(request):
+        return JsonResponse({
+            'error': 'Authentication credentials were not provided.',
+            'code': 'NOT_AUTHENTICATED'
+        }, status=403)
+    return None
+
+
+async def blood_stock_stream(request):
+    """
+    SSE stream of blood stock changes
+
+    Sends a ``snapshot`` event with every group on connect, then ``delta``
+    events carrying only the groups whose units changed:
+    ``{"v": <stock version>, "d": {"A+": 12}}``
+    """
+    error = await _check_request(request)
+    if error:
+        return error
+
+    return event_stream_response(broadcaster.stream())
+
+
+def _job_not_found():
+    return JsonResponse({
+        'error': 'Notification job not found',
+        'code': 'JOB_NOT_FOUND'
+    }, status=404)
+
+
+async def notification_status_stream(request, job_id):
+    """
+    SSE stream of one notification job's status
+
+    Sends a ``status`` event with the job's state on connect and on every
+    change, and ends once the job is COMPLETED or FAILED; see blood.job_status.
+    """
+    error = await _check_request(request)
+    if error:
+        return error
+    user_id = await sync_to_async(lambda: request.user.id)()
+    state, _ = await sync_to_async(job_status.load_state)(job_id, user_id)
+    if state is None:
+        return _job_not_found()
+
+    return event_stream_response(job_status.stream(job_id, user_id))
+
+
+async def notification_status_wait(request, job_id):
+    """
+    Long-poll for a notification job's status, for clients without EventSource
+
+    Query Parameters:
+    - timeout: seconds to wait for a change (default 25, at most 60)
+
+    Without an If-None-Match, or when it no longer matches, the job's state
+    is returned at once with its ETag. While it matches, the request waits
+    for the job to change and answers 304 if it does not within ``timeout``.
+    """
+    error = await _check_request(request)
+    if error:
+        return error
+    try:
+        timeout = min(float(request.GET.get('timeout', job_status.LONG_POLL_SECONDS)), job_status.MAX_LONG_POLL_SECONDS)
+    except ValueError:
+        return JsonResponse({
+            'error': 'timeout must be a number of seconds',
+            'code': 'INVALID_PARAMETERS'
+        }, status=400)
+
+    user_id = await sync_to_async(lambda: request.user.id)()
+    queue = job_status.notifier.subscribe(job_id)
+    try:
+        # Read after subscribing, so no change can fall in between
+        state, updated_at = await sync_to_async(job_status.load_state)(job_id, user_id)
+        if state is None:
+            return _job_not_found()
+
+        etag = quote_etag(conditional.job_etag(job_id, updated_at))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            changed = None
+            if not job_status.is_finished(state):
+                changed = await job_status.notifier.wait(queue, state['updated_at'], max(timeout, 0))
+            if changed is None:
+                response = HttpResponse(status=304)
+                response['ETag'] = etag
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+            state = changed
+            etag = quote_etag(conditional.job_etag(job_id, datetime.fromisoformat(state['updated_at'])))
+    finally:
+        job_status.notifier.unsubscribe(job_id, queue)
+
+    response = JsonResponse(state)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -1,8 +1,11 @@
-import os
 import logging
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from decimal import Decimal
+from functools import partial
+from django.db import connection
 from django.utils import timezone
-from django.conf import settings
 from django.template.loader import render_to_string
 from django.core.mail import send_mail
 
@@ -22,14 +25,9 @@ try:
 except ImportError:
     TWILIO_AVAILABLE = False
 
-try:
-    import sendgrid
-    from sendgrid.helpers.mail import Mail
-    SENDGRID_AVAILABLE = True
-except ImportError:
-    SENDGRID_AVAILABLE = False
-
-from .models import NotificationJob, Hospital, Stock
+from .models import NotificationJob
+from . import fanout, providers
+from . import stock as stock_service
 
 logger = logging.getLogger(__name__)
 
@@ -51,64 +49,7 @@ def send_hospital_notifications(self, job_id):
         job.status = 'PROCESSING'
         job.save()
         
-        # Find nearby hospitals
-        hospitals = Hospital.objects.filter(
-            is_partner=True,
-            latitude__isnull=False,
-            longitude__isnull=False
-        )
-        
-        nearby_hospitals = []
-        for hospital in hospitals:
-            distance = hospital.calculate_distance(job.user_latitude, job.user_longitude)
-            if distance is not None and distance <= job.radius_km:
-                hospital.distance = round(distance, 2)
-                nearby_hospitals.append(hospital)
-        
-        nearby_hospitals.sort(key=lambda h: h.distance)
-        
-        if not nearby_hospitals:
-            job.mark_failed("No hospitals found within specified radius")
-            return {'status': 'failed', 'reason': 'no_hospitals_found'}
-        
-        # Get blood stock information
-        blood_stock = {}
-        stocks = Stock.objects.all()
-        for stock in stocks:
-            blood_stock[stock.bloodgroup] = stock.unit
-        
-        # Prepare notification content
-        context = {
-            'user': job.user,
-            'hospitals': nearby_hospitals[:5],  # Limit to top 5 closest
-            'blood_stock': blood_stock,
-            'search_radius': job.radius_km,
-            'total_hospitals': len(nearby_hospitals)
-        }
-        
-        # Send notifications based on type
-        results = {'sms': None, 'email': None}
-        
-        if job.notification_type in ['SMS', 'BOTH']:
-            results['sms'] = send_sms_notification(job.user, context)
-        
-        if job.notification_type in ['EMAIL', 'BOTH']:
-            results['email'] = send_email_notification(job.user, context)
-        
-        # Check if any notification succeeded
-        success = any(results.values())
-        
-        if success:
-            job.mark_completed()
-            return {
-                'status': 'completed',
-                'results': results,
-                'hospitals_found': len(nearby_hospitals)
-            }
-        else:
-            error_msg = f"All notifications failed. SMS: {results['sms']}, Email: {results['email']}"
-            job.mark_failed(error_msg)
-            return {'status': 'failed', 'reason': 'all_notifications_failed'}
+        return run_notification_job(job)
             
     except NotificationJob.DoesNotExist:
         logger.error(f"NotificationJob {job_id} not found")
@@ -119,11 +60,9 @@ def send_hospital_notifications(self, job_id):
         
         try:
             job = NotificationJob.objects.get(id=job_id)
-            job.increment_retry()
+            countdown = retry_countdown(job)
             
-            if job.can_retry:
-                # Exponential backoff: 2^retry_count minutes
-                countdown = 60 * (2 ** job.retry_count)
+            if countdown is not None:
                 raise self.retry(countdown=countdown, exc=e)
             else:
                 job.mark_failed(str(e))
@@ -133,6 +72,176 @@ def send_hospital_notifications(self, job_id):
         return {'status': 'failed', 'reason': str(e)}
 
 
+def run_notification_job(job):
+    """
+    Send a claimed job's notifications and record the outcome
+    
+    Shared by send_hospital_notifications and the in-process queue
+    (blood.background), so both handle channels the same way.
+    
+    Args:
+        job: NotificationJob in PROCESSING
+    
+    Returns:
+        dict: Task result with status and details
+    
+    Raises:
+        Exception: unexpected errors, for the caller to retry
+    """
+    # Find nearby hospitals
+    nearby_hospitals = fanout.nearby(
+        fanout.partner_hospitals(), job.user_latitude, job.user_longitude, job.radius_km
+    )
+    
+    if not nearby_hospitals:
+        job.mark_failed("No hospitals found within specified radius")
+        return {'status': 'failed', 'reason': 'no_hospitals_found'}
+    
+    results = notify_user(job, nearby_hospitals, stock_service.as_dict())
+    
+    # Check if any notification succeeded
+    if delivered(results):
+        job.mark_completed()
+        return {
+            'status': 'completed',
+            'results': results,
+            'hospitals_found': len(nearby_hospitals)
+        }
+    
+    error_msg = f"All notifications failed. SMS: {results['sms']}, Email: {results['email']}"
+    job.mark_failed(error_msg)
+    follow_late_sms(job)
+    return {'status': 'failed', 'reason': 'all_notifications_failed'}
+
+
+def retry_countdown(job):
+    """
+    Count a failed attempt at a job
+    
+    Returns:
+        int: Seconds to wait before the next attempt (2^retry_count minutes),
+        or None once max_retries attempts have failed
+    """
+    job.increment_retry()
+    if job.retry_count < job.max_retries:
+        return 60 * (2 ** job.retry_count)
+    return None
+
+
+@shared_task
+def send_pending_notifications(batch_size=fanout.DEFAULT_BATCH_SIZE):
+    """
+    Celery task to send every pending notification job in geographic batches
+
+    Scheduled by notify_hospitals at the end of each batching window, and
+    periodically as a sweep for jobs left behind, including those a dead
+    worker left in PROCESSING.
+
+    Args:
+        batch_size: jobs claimed per batch
+
+    Returns:
+        dict: Jobs, groups and outcomes processed, with jobs per second
+    """
+    try:
+        fanout.batch_started()
+        fanout.reset_stale()
+        result = fanout.drain(batch_size=batch_size)
+        return {'status': 'completed', **result.as_dict()}
+    except Exception as e:
+        logger.error(f"Error in send_pending_notifications task: {str(e)}")
+        return {'status': 'failed', 'reason': str(e)}
+
+
+def notify_user(job, nearby_hospitals, blood_stock):
+    """
+    Render and send one job's notifications
+    
+    Args:
+        job: NotificationJob being processed
+        nearby_hospitals: hospitals within the job's radius, closest first, with distance set
+        blood_stock: units per blood group
+    
+    Returns:
+        dict: 'sms' and 'email' results; None for channels not requested.
+        An SMS still sending at its timeout is 'SMS pending: ...' and is
+        left running: it may have reached the provider, and sending it
+        again could deliver it twice. See follow_late_sms().
+    """
+    # Prepare notification content
+    context = {
+        'user': job.user,
+        'hospitals': nearby_hospitals[:5],  # Limit to top 5 closest
+        'blood_stock': blood_stock,
+        'search_radius': job.radius_km,
+        'total_hospitals': len(nearby_hospitals)
+    }
+    
+    # Send notifications based on type
+    results = {'sms': None, 'email': None}
+    sms_future = None
+    
+    if job.notification_type in ['SMS', 'BOTH']:
+        # The SMS goes out on the send pool while the email is sent here,
+        # so a job takes as long as its slower channel, not both together
+        try:
+            prepared = prepare_sms(job.user, context)
+        except Exception as e:
+            logger.error(f"Error sending SMS: {str(e)}")
+            prepared = f"SMS failed: {str(e)}"
+        if isinstance(prepared, str):
+            results['sms'] = prepared
+        else:
+            sms_future = providers.send_pool().submit(deliver_sms, *prepared)
+            sms_deadline = time.monotonic() + providers.timeout('sms')
+    
+    if job.notification_type in ['EMAIL', 'BOTH']:
+        results['email'] = send_email_notification(job.user, context)
+    
+    if sms_future is not None:
+        try:
+            results['sms'] = sms_future.result(timeout=max(0, sms_deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.error(f"SMS for NotificationJob {job.pk} timed out")
+            results['sms'] = f"SMS pending: no answer after {providers.timeout('sms')}s"
+            job.pending_sms = sms_future
+    
+    return results
+
+
+def follow_late_sms(job):
+    """
+    Mark a job COMPLETED if the SMS notify_user stopped waiting for is sent after all
+
+    Call once the job's outcome is saved, so that it does not overwrite this.
+    """
+    future = getattr(job, 'pending_sms', None)
+    if future is not None:
+        future.add_done_callback(partial(_late_sms_done, job.pk, threading.current_thread()))
+
+
+def _late_sms_done(job_id, caller, future):
+    result = future.result()
+    if not result.startswith('SMS sent'):
+        return
+    logger.info(f"SMS for NotificationJob {job_id} was sent late: {result}")
+    try:
+        job = NotificationJob.objects.filter(pk=job_id).exclude(status='COMPLETED').first()
+        if job is not None:
+            job.mark_completed()
+    except Exception as e:
+        logger.error(f"Error recording late SMS for NotificationJob {job_id}: {str(e)}")
+    finally:
+        if threading.current_thread() is not caller:
+            # Send pool threads do not keep database connections
+            connection.close()
+
+
+def delivered(results):
+    """Whether any channel of a notify_user() result reports a message sent"""
+    return any(result and result.startswith(('SMS sent', 'Email sent')) for result in results.values())
+
+
 def send_sms_notification(user, context):
     """
     Send SMS notification using Twilio
@@ -144,49 +253,63 @@ def send_sms_notification(user, context):
     Returns:
         str: Success message or error description
     """
-    if not TWILIO_AVAILABLE:
-        return "Twilio not available"
-    
     try:
-        # Get Twilio credentials from environment
-        account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
-        auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
-        from_number = os.environ.get('TWILIO_FROM_NUMBER')
-        
-        if not all([account_sid, auth_token, from_number]):
-            logger.error("Twilio credentials not configured")
-            return "SMS service not configured"
+        prepared = prepare_sms(user, context)
+        if isinstance(prepared, str):
+            return prepared
+        return deliver_sms(*prepared)
         
-        # Get user phone number (assuming it's stored in profile)
-        user_phone = getattr(user, 'phone', None)
-        if not user_phone:
-            # Try to get from donor or patient profile
+    except Exception as e:
+        logger.error(f"Error sending SMS: {str(e)}")
+        return f"SMS failed: {str(e)}"
+
+
+def prepare_sms(user, context):
+    """
+    Look up the user's phone number and write the SMS, without sending it
+    
+    Returns:
+        tuple: (client, phone number, message body), or a str saying why no SMS can be sent
+    """
+    # Shared client of the configured provider (see blood.providers)
+    sms = providers.get('sms')
+    
+    if sms is None:
+        if not TWILIO_AVAILABLE:
+            return "Twilio not available"
+        logger.error("Twilio credentials not configured")
+        return "SMS service not configured"
+    
+    # Get user phone number (assuming it's stored in profile)
+    user_phone = getattr(user, 'phone', None)
+    if not user_phone:
+        # Try to get from donor or patient profile
+        try:
+            from donor.models import Donor
+            donor = Donor.objects.get(user=user)
+            user_phone = donor.mobile
+        except:
             try:
-                from donor.models import Donor
-                donor = Donor.objects.get(user=user)
-                user_phone = donor.mobile
+                from patient.models import Patient
+                patient = Patient.objects.get(user=user)
+                user_phone = patient.mobile
             except:
-                try:
-                    from patient.models import Patient
-                    patient = Patient.objects.get(user=user)
-                    user_phone = patient.mobile
-                except:
-                    return "User phone number not found"
-        
-        if not user_phone:
-            return "Phone number not available"
-        
-        # Format phone number (add country code if needed)
-        if not user_phone.startswith('+'):
-            user_phone = '+91' + user_phone.lstrip('0')  # Assuming India
-        
-        # Create SMS content
-        hospitals_text = "\n".join([
-            f"{h.name} ({h.distance}km) - {h.contact_phone}"
-            for h in context['hospitals'][:3]
-        ])
-        
-        message_body = f"""🏥 Nearby Hospitals ({context['search_radius']}km radius):
+                return "User phone number not found"
+    
+    if not user_phone:
+        return "Phone number not available"
+    
+    # Format phone number (add country code if needed)
+    if not user_phone.startswith('+'):
+        user_phone = '+91' + user_phone.lstrip('0')  # Assuming India
+    
+    # Create SMS content
+    hospitals_text = "\n".join([
+        f"{h.name} ({h.distance}km) - {h.contact_phone}"
+        for h in context['hospitals'][:3]
+    ])
+    
+    message_body = f"""🏥 Nearby Hospitals ({context['search_radius']}km radius):
 
 {hospitals_text}
 
@@ -195,17 +318,17 @@ Blood Stock Available:
 
 Emergency: Call hospitals directly
 - Blood Bank Management System"""
+    
+    return sms, user_phone, message_body
+
+
+def deliver_sms(sms, user_phone, message_body):
+    """Send a prepared SMS; needs no database access, so it can run on the send pool"""
+    try:
+        sid = sms.send_sms(user_phone, message_body)
         
-        # Send SMS via Twilio
-        client = TwilioClient(account_sid, auth_token)
-        message = client.messages.create(
-            body=message_body,
-            from_=from_number,
-            to=user_phone
-        )
-        
-        logger.info(f"SMS sent successfully to {user_phone}, SID: {message.sid}")
-        return f"SMS sent successfully (SID: {message.sid})"
+        logger.info(f"SMS sent successfully to {user_phone}, SID: {sid}")
+        return f"SMS sent successfully (SID: {sid})"
         
     except Exception as e:
         logger.error(f"Error sending SMS: {str(e)}")
@@ -259,58 +382,43 @@ Best regards,
 Blood Bank Management System
 """
         
-        # Try SendGrid first, fallback to Django email
-        if SENDGRID_AVAILABLE and os.environ.get('SENDGRID_API_KEY'):
-            return send_email_via_sendgrid(user.email, subject, html_content, text_content)
-        else:
-            return send_email_via_django(user.email, subject, html_content, text_content)
+        # SendGrid when configured, otherwise Django email (NOTIFICATION_EMAIL_PROVIDER)
+        email = providers.get('email')
+        if email is None:
+            return "Email service not configured"
+        if email.name == 'sendgrid':
+            return send_email_via_sendgrid(user.email, subject, html_content, text_content, client=email)
+        if email.name == 'django':
+            return send_email_via_django(user.email, subject, html_content, text_content, client=email)
+        email.send_email(user.email, subject, html_content, text_content)
+        return f"Email sent via {email.name}"
             
     except Exception as e:
         logger.error(f"Error preparing email: {str(e)}")
         return f"Email preparation failed: {str(e)}"
 
 
-def send_email_via_sendgrid(to_email, subject, html_content, text_content):
+def send_email_via_sendgrid(to_email, subject, html_content, text_content, client=None):
     """Send email using SendGrid API"""
     try:
-        api_key = os.environ.get('SENDGRID_API_KEY')
-        from_email = os.environ.get('EMAIL_FROM_ADDRESS', 'noreply@bloodbank.com')
-        
-        sg = sendgrid.SendGridAPIClient(api_key=api_key)
+        sendgrid = client or providers.get('email', 'sendgrid')
+        if sendgrid is None:
+            return "SendGrid not configured"
         
-        mail = Mail(
-            from_email=from_email,
-            to_emails=to_email,
-            subject=subject,
-            html_content=html_content,
-            plain_text_content=text_content
-        )
-        
-        response = sg.send(mail)
-        logger.info(f"SendGrid email sent to {to_email}, status: {response.status_code}")
-        return f"Email sent via SendGrid (Status: {response.status_code})"
+        status_code = sendgrid.send_email(to_email, subject, html_content, text_content)
+        logger.info(f"SendGrid email sent to {to_email}, status: {status_code}")
+        return f"Email sent via SendGrid (Status: {status_code})"
         
     except Exception as e:
         logger.error(f"SendGrid email failed: {str(e)}")
         return f"SendGrid failed: {str(e)}"
 
 
-def send_email_via_django(to_email, subject, html_content, text_content):
-    """Send email using Django's email backend"""
+def send_email_via_django(to_email, subject, html_content, text_content, client=None):
+    """Send email using Django's email backend, over the batch's connection inside providers.email_batch()"""
     try:
-        from django.core.mail import EmailMultiAlternatives
-        
-        from_email = os.environ.get('EMAIL_FROM_ADDRESS', settings.DEFAULT_FROM_EMAIL)
-        
-        msg = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=from_email,
-            to=[to_email]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        
-        result = msg.send()
+        django_email = client or providers.get('email', 'django')
+        result = django_email.send_email(to_email, subject, html_content, text_content)
         
         if result:
             logger.info(f"Django email sent to {to_email}")
@@ -323,69 +431,65 @@ def send_email_via_django(to_email, subject, html_content, text_content):
         return f"Django email failed: {str(e)}"
 
 
-def process_notification_sync(job_id):
+@shared_task
+def cleanup_old_notification_jobs():
     """
-    Synchronous version of notification processing for when Celery is not available
-    
+    Hourly task to delete finished notification jobs past retention
+
+    Counts are rolled into NotificationJobSummary first; see blood.retention.
+
+    Returns:
+        dict: Rows deleted, summary rows touched, chunks and rows per second
+    """
+    from .retention import cleanup_notification_jobs
+
+    try:
+        result = cleanup_notification_jobs()
+        return {'status': 'completed', **result.as_dict()}
+    except Exception as e:
+        logger.error(f"Error in cleanup_old_notification_jobs task: {str(e)}")
+        return {'status': 'failed', 'reason': str(e)}
+
+
+@shared_task
+def forecast_stock_demand():
+    """
+    Nightly task to project days-until-stockout per blood group
+
+    Returns:
+        dict: Number of forecasts stored
+    """
+    from .forecasting import refresh_stock_forecasts
+
+    try:
+        count = refresh_stock_forecasts()
+        logger.info(f"Stored {count} stock forecasts")
+        return {'status': 'completed', 'forecasts': count}
+    except Exception as e:
+        logger.error(f"Error in forecast_stock_demand task: {str(e)}")
+        return {'status': 'failed', 'reason': str(e)}
+
+
+@shared_task
+def render_certificates(certificate_ids):
+    """
+    Celery task to render and store certificate PDFs
+
+    Rendering runs inline: Celery's own worker processes provide the
+    parallelism, one batch of certificates per task.
+
     Args:
-        job_id: NotificationJob ID to process
-    
+        certificate_ids: Certificate.certificate_id values
+
     Returns:
-        bool: True if successful, False otherwise
+        dict: Number of PDFs rendered, and of certificates that failed to render
     """
+    from .certificate_pdf import render_ids
+
     try:
-        # This is a simplified synchronous version
-        job = NotificationJob.objects.get(id=job_id)
-        job.status = 'PROCESSING'
-        job.save()
-        
-        # Find nearby hospitals
-        hospitals = Hospital.objects.filter(
-            is_partner=True,
-            latitude__isnull=False,
-            longitude__isnull=False
-        )
-        
-        nearby_hospitals = []
-        for hospital in hospitals:
-            distance = hospital.calculate_distance(job.user_latitude, job.user_longitude)
-            if distance is not None and distance <= job.radius_km:
-                hospital.distance = round(distance, 2)
-                nearby_hospitals.append(hospital)
-        
-        if not nearby_hospitals:
-            job.mark_failed("No hospitals found within specified radius")
-            return False
-        
-        # Get blood stock
-        blood_stock = {}
-        stocks = Stock.objects.all()
-        for stock in stocks:
-            blood_stock[stock.bloodgroup] = stock.unit
-        
-        context = {
-            'user': job.user,
-            'hospitals': nearby_hospitals[:5],
-            'blood_stock': blood_stock,
-            'search_radius': job.radius_km,
-            'total_hospitals': len(nearby_hospitals)
-        }
-        
-        # Send email notification (simplified)
-        email_result = send_email_notification(job.user, context)
-        
-        if "sent" in email_result.lower():
-            job.mark_completed()
-            return True
-        else:
-            job.mark_failed(email_result)
-            return False
-            
+        failed = []
+        rendered = render_ids(certificate_ids, workers=0, on_error=lambda certificate, message: failed.append(certificate))
+        return {'status': 'completed', 'rendered': rendered, 'failed': len(failed)}
     except Exception as e:
-        logger.error(f"Error in process_notification_sync: {str(e)}")
-        try:
-            job = NotificationJob.objects.get(id=job_id)
-            job.mark_failed(str(e))
-        except:
-            pass
-        return False
\ No newline at end of file
+        logger.error(f"Error in render_certificates task: {str(e)}")
+        return {'status': 'failed', 'reason': str(e)}
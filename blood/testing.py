@@ -0,0 +1,76 @@
+"""
+Test helpers
+
+Without Redis the shared cache is a database table (settings.CACHES), so
+every cache read is a query too. Tests that budget the queries of a page
+or service mix in DataQueriesMixin, which runs them with a process-local
+LocMem cache instead: assertNumDataQueries then counts every query, and
+the budgets are those of a deployment with Redis. What the database cache
+adds on top is asserted separately, with assertNumQueries and the
+configured CACHES (e.g. StockQueryCostTest).
+
+API budgets do include the throttle's counter (RATE_LIMIT_STORE
+'database'), THROTTLE_QUERIES per request; steady_throttle() keeps that
+number fixed for the length of a test.
+"""
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import ratelimit
+
+# Queries of one throttle hit in a TestCase: UPDATE and SELECT in a savepoint,
+# plus a nested savepoint and INSERT when the identity's window starts
+THROTTLE_QUERIES = 4
+THROTTLE_NEW_WINDOW_QUERIES = 7
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'query-budgets',
+    }
+}
+
+
+class DataQueriesMixin:
+    """TestCase mixin running tests with a LocMem cache, adding assertNumDataQueries"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Before TestCase.setUpClass, so setUpTestData already writes to this cache
+        caches = override_settings(CACHES=LOCMEM_CACHES)
+        caches.enable()
+        cls.addClassCleanup(caches.disable)
+        super().setUpClass()
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        # Unlike the database cache, this one is not rolled back after each test
+        cache.clear()
+
+    @contextmanager
+    def assertNumDataQueries(self, num, using=DEFAULT_DB_ALIAS, msg=None):
+        """assertNumQueries with a message; with the LocMem cache, every query counted is the application's own"""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(
+            len(queries), num,
+            (f"{msg}: " if msg else "") + f"{len(queries)} queries executed, {num} expected\n" + '\n'.join(queries)
+        )
+
+
+def steady_throttle(test):
+    """Keep the throttle's window from turning over, and expired counters from being culled, during a test"""
+    now = time.time()
+    for patcher in (
+        mock.patch('blood.throttling.time', mock.Mock(time=lambda: now)),
+        mock.patch.object(ratelimit, 'CULL_PROBABILITY', 0),
+    ):
+        patcher.start()
+        test.addCleanup(patcher.stop)
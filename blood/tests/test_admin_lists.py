@@ -0,0 +1,102 @@
+from django.test import TestCase, Client, RequestFactory
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from blood.models import BloodRequest
+from blood.pagination import keyset_paginate
+from blood.testing import DataQueriesMixin
+from donor.models import Donor, BloodDonate
+from patient.models import Patient
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.ids = [
+            BloodRequest.objects.create(patient_name=f'P{i}', patient_age=30, reason='Surgery', bloodgroup='A+', unit=1).id
+            for i in range(7)
+        ]
+
+    def test_pages_walk_forwards_and_back(self):
+        """Cursors cover every row exactly once, newest first"""
+        queryset = BloodRequest.objects.all()
+        first = keyset_paginate(self.factory.get('/'), queryset, per_page=3)
+        self.assertEqual([r.id for r in first], self.ids[:-4:-1])
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+
+        second = keyset_paginate(self.factory.get('/', {'after': first.next_cursor}), queryset, per_page=3)
+        third = keyset_paginate(self.factory.get('/', {'after': second.next_cursor}), queryset, per_page=3)
+        self.assertEqual([r.id for r in third], [self.ids[0]])
+        self.assertFalse(third.has_next)
+
+        back = keyset_paginate(self.factory.get('/', {'before': third.previous_cursor}), queryset, per_page=3)
+        self.assertEqual([r.id for r in back], [r.id for r in second])
+        self.assertTrue(back.has_previous)
+
+    def test_before_the_newest_row_links_nowhere(self):
+        """A stale ``before`` cursor gives an empty page without an ``?after=None`` link"""
+        page = keyset_paginate(self.factory.get('/', {'before': self.ids[-1]}), BloodRequest.objects.all(), per_page=3)
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = keyset_paginate(self.factory.get('/', {'after': 'x'}), BloodRequest.objects.all(), per_page=3)
+        self.assertEqual(list(page)[0].id, self.ids[-1])
+
+
+class AdminListQueryTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.login(username='admin', password='testpass123')
+
+    def create_people(self, count):
+        for _ in range(count):
+            n = User.objects.count()
+            donor = Donor.objects.create(
+                user=User.objects.create_user(username=f'donor{n}', first_name='D', last_name=str(n)),
+                bloodgroup='O+', address='Pune', mobile='9876543210', profile_pic='profile_pic/Donor/d.png'
+            )
+            Patient.objects.create(
+                user=User.objects.create_user(username=f'patient{n}', first_name='P', last_name=str(n)),
+                age=40, bloodgroup='A+', disease='None', doctorname='Dr', address='Pune',
+                mobile='9876543210', profile_pic='profile_pic/Patient/p.png'
+            )
+            BloodDonate.objects.create(donor=donor, age=30, bloodgroup='O+', unit=1)
+            BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='A+', unit=1)
+
+    def assertConstantQueries(self, url):
+        """Rendering a list costs the same number of queries for 1 row or 10"""
+        self.create_people(1)
+        self.client.get(url)  # warm the role cache
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.create_people(9)
+        with self.assertNumDataQueries(len(context.captured_queries)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_admin_donor_view(self):
+        self.assertConstantQueries('/admin-donor')
+
+    def test_admin_patient_view(self):
+        self.assertConstantQueries('/admin-patient')
+
+    def test_admin_request_view(self):
+        self.assertConstantQueries('/admin-request')
+
+    def test_admin_donation_view(self):
+        self.assertConstantQueries('/admin-donation')
+
+    def test_history_links_to_older_page(self):
+        for _ in range(55):
+            BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='A+', unit=1, status='Approved')
+        response = self.client.get('/admin-request-history')
+        page = response.context['requests']
+        self.assertEqual(len(page), 50)
+        self.assertContains(response, f'?after={page.next_cursor}')
+
+        response = self.client.get('/admin-request-history', {'after': page.next_cursor})
+        self.assertEqual(len(response.context['requests']), 5)
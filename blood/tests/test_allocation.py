@@ -0,0 +1,100 @@
+from django.test import SimpleTestCase, TestCase
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from datetime import date
+from io import StringIO
+
+from blood import allocation, forecasting, stock
+from blood.allocation import (
+    DONATION, REQUEST, Simulator, get_policy, history_events,
+)
+from blood.models import BLOOD_GROUPS, GROUP_INDEX, BloodRequest
+from donor.models import Donor, BloodDonate
+
+
+def event(day, kind, group, units):
+    return (day, kind, GROUP_INDEX[group], units)
+
+
+class AllocationSimulatorTest(SimpleTestCase):
+    def test_group_index_is_shared(self):
+        """Simulator, forecasts and the stock snapshot index blood groups with one table"""
+        for module in (allocation, forecasting, stock):
+            with self.subTest(module.__name__):
+                self.assertIs(module.GROUP_INDEX, GROUP_INDEX)
+        self.assertEqual([GROUP_INDEX[group] for group in BLOOD_GROUPS], list(range(len(BLOOD_GROUPS))))
+
+    def test_exact_policy_rejects_when_short(self):
+        """Exact-match policy fills only from the same group, all-or-nothing"""
+        events = [
+            event(1, DONATION, 'A+', 3),
+            event(1, REQUEST, 'A+', 2),
+            event(2, REQUEST, 'A+', 2),
+        ]
+        result = Simulator(get_policy('exact')).run(events)
+
+        self.assertEqual(result.filled_requests, 1)
+        self.assertEqual(result.unfilled_requests, 1)
+        self.assertEqual(result.filled_units, 2)
+        self.assertAlmostEqual(result.fill_rate, 0.5)
+
+    def test_compatible_policy_substitutes(self):
+        """Compatible policy draws O- for an A+ request"""
+        events = [
+            event(1, DONATION, 'O-', 2),
+            event(1, REQUEST, 'A+', 2),
+        ]
+        result = Simulator(get_policy('compatible')).run(events)
+
+        self.assertEqual(result.filled_requests, 1)
+        self.assertEqual(result.fill_rate, 1.0)
+
+    def test_backorder_policy_records_wait(self):
+        """Backordered requests are filled when stock arrives"""
+        events = [
+            event(1, REQUEST, 'B+', 2),
+            event(4, DONATION, 'B+', 2),
+        ]
+        result = Simulator(get_policy('backorder')).run(events)
+
+        self.assertEqual(result.filled_requests, 1)
+        self.assertEqual(result.max_wait_days, 3)
+        self.assertEqual(result.still_waiting, 0)
+
+    def test_expired_units_count_as_wastage(self):
+        """Units older than the shelf life are discarded"""
+        events = [
+            event(1, DONATION, 'O+', 5),
+            event(20, REQUEST, 'O+', 2),
+        ]
+        result = Simulator(get_policy('exact'), shelf_life_days=10).run(events)
+
+        self.assertEqual(result.wasted_units, 5)
+        self.assertEqual(result.filled_requests, 0)
+
+
+class AllocationHistoryTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='donor', password='testpass123')
+        self.donor = Donor.objects.create(user=user, bloodgroup='A+', address='Pune', mobile='9876543210')
+
+    def test_history_events_merges_tables(self):
+        """Donations and requests are streamed as one ordered event list"""
+        BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='A+', unit=2, status='Approved')
+        BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='A+', unit=1, status='Rejected')
+        BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='A+', unit=1)
+
+        events = list(history_events())
+        today = date.today().toordinal()
+
+        self.assertEqual(events, [
+            (today, DONATION, GROUP_INDEX['A+'], 2),
+            (today, REQUEST, GROUP_INDEX['A+'], 1),
+        ])
+
+    def test_simulate_allocation_command(self):
+        """Management command reports each policy"""
+        out = StringIO()
+        call_command('simulate_allocation', '--policy', 'exact', stdout=out)
+        self.assertIn('Policy: exact', out.getvalue())
+        self.assertIn('Fill rate', out.getvalue())
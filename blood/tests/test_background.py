@@ -0,0 +1,135 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+import time
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from blood import background, fanout, providers
+from blood import stock as stock_service
+from blood.models import Hospital, NotificationJob
+from donor.models import Donor
+
+
+def make_job(user, **fields):
+    return NotificationJob.objects.create(
+        user=user, user_latitude=Decimal('19.0760'), user_longitude=Decimal('72.8777'), radius_km=10, **fields
+    )
+
+
+class LocalQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ravi', email='ravi@example.com')
+        Donor.objects.create(user=self.user, bloodgroup='O+', address='Mumbai', mobile='9876543210')
+        Hospital.objects.create(
+            name='City Hospital', address='-', city='Mumbai', state='MH', contact_phone='022-1',
+            contact_email='h@example.com', emergency_contact='022-2', is_partner=True,
+            latitude=Decimal('19.0760'), longitude=Decimal('72.8777')
+        )
+        self.queue = background.LocalQueue(workers=1, maxsize=10)
+
+    def test_sends_every_channel_like_the_celery_task(self):
+        job = make_job(self.user, notification_type='BOTH')
+        fake = providers.FakeProvider()
+        with providers.override(sms=fake, email=fake):
+            result = self.queue.process(job.pk)
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual((len(fake.sms), len(fake.emails)), (1, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'COMPLETED')
+
+    def test_job_is_claimed_once(self):
+        job = make_job(self.user)
+        with patch('blood.tasks.notify_user', return_value={'sms': None, 'email': 'Email sent via fake'}) as notify:
+            self.queue.process(job.pk)
+            # Queued twice, e.g. by a request and a sweep
+            self.assertIsNone(self.queue.process(job.pk))
+        self.assertEqual(notify.call_count, 1)
+
+    def test_errors_are_retried_with_backoff(self):
+        job = make_job(self.user, max_retries=2)
+        with patch('blood.tasks.notify_user', side_effect=RuntimeError('SMTP down')), \
+                patch.object(self.queue, 'retry_later') as retry_later:
+            self.queue.process(job.pk)
+            retry_later.assert_called_once_with(job.pk, 120)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.retry_count), ('PROCESSING', 1))
+
+            # The retry runs on the job it still holds, and is the last one
+            self.queue.process(job.pk, retry=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.retry_count, job.error_message), ('FAILED', 2, 'SMTP down'))
+
+    def test_recover_queues_pending_and_abandoned_jobs(self):
+        pending = make_job(self.user)
+        abandoned = make_job(self.user, status='PROCESSING')
+        busy = make_job(self.user, status='PROCESSING')
+        make_job(self.user, status='COMPLETED')
+        NotificationJob.objects.filter(pk=abandoned.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(self.queue.recover(), 2)
+        queued = [self.queue.queue.get_nowait()[0] for _ in range(2)]
+        self.assertCountEqual(queued, [pending.pk, abandoned.pk])
+        busy.refresh_from_db()
+        self.assertEqual(busy.status, 'PROCESSING')
+
+    def test_full_queue_leaves_jobs_for_the_sweep(self):
+        small = background.LocalQueue(workers=1, maxsize=1)
+        self.assertTrue(small.put(1))
+        self.assertFalse(small.put(2))
+
+    @override_settings(NOTIFICATION_USE_CELERY=False)
+    def test_schedule_without_celery_queues_locally(self):
+        job = make_job(self.user)
+        with patch('blood.tasks.send_hospital_notifications.delay') as delay, \
+                self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(fanout.schedule(job.pk), 'local')
+        delay.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+    @override_settings(NOTIFICATION_USE_CELERY=True, NOTIFICATION_BATCH_WINDOW=0)
+    def test_schedule_falls_back_when_broker_refuses(self):
+        job = make_job(self.user)
+        with patch('blood.tasks.send_hospital_notifications.delay', side_effect=ConnectionError('no broker')), \
+                self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(fanout.schedule(job.pk), 'local')
+        self.assertEqual(len(callbacks), 1)
+
+
+class LocalQueueThreadsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ravi', email='ravi@example.com')
+        Hospital.objects.create(
+            name='City Hospital', address='-', city='Mumbai', state='MH', contact_phone='022-1',
+            contact_email='h@example.com', emergency_contact='022-2', is_partner=True,
+            latitude=Decimal('19.0760'), longitude=Decimal('72.8777')
+        )
+        # The flush emptied the cache table; as on a running site, the stock version
+        # exists before the threads read it (in-memory SQLite fails concurrent writes)
+        stock_service.get_version()
+
+    def test_restart_sends_leftovers_and_stop_drains(self):
+        # Left PENDING by a previous process
+        leftovers = [make_job(self.user, notification_type='EMAIL') for _ in range(3)]
+        local_queue = background.LocalQueue(workers=2, maxsize=10)
+        with patch('blood.tasks.notify_user', return_value={'sms': None, 'email': 'Email sent via fake'}):
+            local_queue.start()
+            local_queue.put(make_job(self.user, notification_type='EMAIL').pk)
+            local_queue.stop(timeout=5)
+        self.assertEqual(NotificationJob.objects.filter(status='COMPLETED').count(), len(leftovers) + 1)
+        self.assertFalse(local_queue.put(leftovers[0].pk))
+        self.assertFalse(any(thread.is_alive() for thread in local_queue.threads))
+
+    def test_stop_returns_jobs_waiting_to_retry(self):
+        job = make_job(self.user, notification_type='EMAIL')
+        local_queue = background.LocalQueue(workers=1, maxsize=10)
+        with patch('blood.tasks.notify_user', side_effect=RuntimeError('SMTP down')):
+            local_queue.start()
+            deadline = time.monotonic() + 5
+            while not local_queue.retrying and time.monotonic() < deadline:
+                time.sleep(0.01)
+            local_queue.stop(timeout=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.retry_count), ('PENDING', 1))
@@ -0,0 +1,240 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from datetime import date
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
+from blood import certificate_pdf, certificates
+from blood.models import Certificate
+from donor.models import Donor
+
+
+class CertificatePdfTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+
+        user = User.objects.create_user(username='ravi', password='testpass123', first_name='Ravi', last_name='Kumar')
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(user)
+        self.donor = Donor.objects.create(user=user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        self.certificate = Certificate.objects.create(donor=self.donor, certificate_type='FIRST_DONATION', donation_count=1)
+        self.url = f'/download-certificate/{self.certificate.certificate_id}'
+        self.client = Client()
+        self.client.login(username='ravi', password='testpass123')
+
+    def test_rendered_once_then_served_from_storage(self):
+        with mock.patch.object(certificate_pdf, 'render_pdf', wraps=certificate_pdf.render_pdf) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+        self.assertEqual(render.call_count, 1)
+
+        body = b''.join(first.streaming_content)
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertEqual(b''.join(second.streaming_content), body)
+        self.assertIn('immutable', first['Cache-Control'])
+        self.assertIn('private', first['Cache-Control'])
+
+        self.certificate.refresh_from_db()
+        self.assertEqual(self.certificate.pdf_sha256, hashlib.sha256(body).hexdigest())
+        self.assertTrue(self.certificate.pdf.name.startswith(f'certificates/{self.certificate.certificate_id}-'))
+        self.assertEqual(first['ETag'], f'"{self.certificate.pdf_sha256}"')
+
+    def test_conditional_download(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_lost_file_is_rendered_again(self):
+        self.client.get(self.url)
+        self.certificate.refresh_from_db()
+        default_storage.delete(self.certificate.pdf.name)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_other_users_cannot_download(self):
+        User.objects.create_user(username='other', password='testpass123')
+        client = Client()
+        client.login(username='other', password='testpass123')
+        self.assertEqual(client.get(self.url).status_code, 302)
+
+    def test_render_command(self):
+        Certificate.objects.create(donor=self.donor, certificate_type='REGULAR_DONOR', donation_count=5)
+        out = StringIO()
+        call_command('render_certificates', '--workers', '0', stdout=out)
+        self.assertIn('Rendered 2 certificates', out.getvalue())
+        self.assertFalse(Certificate.objects.filter(pdf='').exists())
+
+        call_command('render_certificates', '--workers', '0', stdout=out)
+        self.assertIn('Rendered 0 certificates', out.getvalue())
+
+    def test_render_command_skips_failures(self):
+        broken = Certificate.objects.create(donor=self.donor, certificate_type='REGULAR_DONOR', donation_count=5)
+        render_pdf = certificate_pdf.render_pdf
+
+        def render(certificate):
+            if certificate.pk == broken.pk:
+                raise ValueError('bad font')
+            return render_pdf(certificate)
+
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(certificate_pdf, 'render_pdf', side_effect=render):
+            call_command('render_certificates', '--workers', '0', stdout=out, stderr=err)
+        self.assertIn('Rendered 1 certificates', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn(f'{broken.certificate_id}: bad font', err.getvalue())
+        self.assertEqual(list(Certificate.objects.filter(pdf='')), [broken])
+
+
+class BulkRenderingTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.donor = Donor.objects.create(
+            user=User.objects.create_user(username='ravi', first_name='Ravi', last_name='Kumar'),
+            bloodgroup='O+', address='Pune', mobile='9876543210'
+        )
+        self.certificates = [
+            Certificate.objects.create(donor=self.donor, certificate_type=certificate_type, donation_count=count)
+            for certificate_type, count in (('FIRST_DONATION', 1), ('REGULAR_DONOR', 5), ('HERO_DONOR', 10))
+        ]
+
+    def test_render_many_in_process_pool(self):
+        self.assertEqual(certificate_pdf.render_many(self.certificates, workers=2), 3)
+        for certificate in Certificate.objects.all():
+            with certificate.pdf.open('rb') as f:
+                self.assertEqual(hashlib.sha256(f.read()).hexdigest(), certificate.pdf_sha256)
+        self.assertEqual(certificate_pdf.render_many(Certificate.objects.all(), workers=2), 0)
+
+    def test_render_many_skips_failures_in_pool(self):
+        broken = self.certificates[1]
+        pdf_fields = certificate_pdf.pdf_fields
+
+        def fields(certificate):
+            values = pdf_fields(certificate)
+            if certificate.pk == broken.pk:
+                # Fails in the worker, at strftime
+                values['issued_date'] = None
+            return values
+
+        errors = []
+        with mock.patch.object(certificate_pdf, 'pdf_fields', side_effect=fields):
+            rendered = certificate_pdf.render_many(
+                self.certificates, workers=2, on_error=lambda certificate, message: errors.append(certificate)
+            )
+        self.assertEqual(rendered, 2)
+        self.assertEqual(errors, [broken])
+        self.assertEqual(list(Certificate.objects.filter(pdf='')), [broken])
+
+    @override_settings(CERTIFICATE_RENDER_USE_CELERY=True)
+    def test_queue_rendering_on_celery(self):
+        ids = [f'CERT{i}' for i in range(45)]
+        with mock.patch('blood.tasks.render_certificates.delay') as delay:
+            self.assertEqual(certificate_pdf.queue_rendering(ids), 'celery')
+        self.assertEqual(delay.call_count, 3)
+        self.assertEqual(sum(len(call.args[0]) for call in delay.call_args_list), 45)
+
+    @override_settings(CERTIFICATE_RENDER_USE_CELERY=True)
+    def test_queue_rendering_falls_back_to_local_pool(self):
+        with mock.patch('blood.tasks.render_certificates.delay', side_effect=OSError('no broker')), \
+                mock.patch.object(certificate_pdf.threading, 'Thread') as thread:
+            self.assertEqual(certificate_pdf.queue_rendering(['CERT1']), 'local')
+        thread.return_value.start.assert_called_once()
+
+    def test_new_certificates_are_queued_after_commit(self):
+        with mock.patch.object(certificate_pdf, 'queue_rendering') as queue, \
+                self.captureOnCommitCallbacks(execute=True):
+            Certificate.objects.all().delete()
+            certificates.record_approval(self.donor)
+        queue.assert_called_once_with([Certificate.objects.get().certificate_id])
+
+    def test_admin_zip_action(self):
+        User.objects.create_superuser(username='admin', password='testpass123', email='admin@example.com')
+        client = Client()
+        client.login(username='admin', password='testpass123')
+        with mock.patch.object(certificate_pdf, 'default_workers', return_value=0):
+            response = client.post('/admin/blood/certificate/', {
+                'action': 'download_zip',
+                '_selected_action': [certificate.pk for certificate in self.certificates],
+            })
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as bundle:
+            self.assertIsNone(bundle.testzip())
+            names = bundle.namelist()
+            self.assertEqual(len(names), 3)
+            self.assertTrue(bundle.read(names[0]).startswith(b'%PDF'))
+
+    def test_zip_leaves_out_certificates_that_fail_to_render(self):
+        broken = self.certificates[1]
+        render_pdf = certificate_pdf.render_pdf
+
+        def render(certificate):
+            if certificate.pk == broken.pk:
+                raise ValueError('bad font')
+            return render_pdf(certificate)
+
+        with mock.patch.object(certificate_pdf, 'render_pdf', side_effect=render):
+            archive, skipped = certificate_pdf.write_zip(self.certificates, workers=0)
+        self.assertEqual(skipped, 1)
+        with archive, zipfile.ZipFile(archive) as bundle:
+            self.assertEqual(
+                sorted(bundle.namelist()),
+                sorted(f'certificate_{c.certificate_id}.pdf' for c in self.certificates if c.pk != broken.pk)
+            )
+
+    def test_names_with_markup_characters_render(self):
+        user = self.donor.user
+        user.first_name, user.last_name = 'Tom &', '<Jerry'
+        user.save()
+        certificate = Certificate.objects.select_related('donor__user').get(pk=self.certificates[0].pk)
+        self.assertTrue(certificate_pdf.render_pdf(certificate).startswith(b'%PDF'))
+
+
+class RenderTemplateTest(TestCase):
+    def test_background_prepared_once_per_process(self):
+        certificate_pdf._background.clear()
+        fields = {
+            'certificate_id': 'CERT1202601010', 'donor_name': 'Ravi Kumar', 'title': 'First Time Donor',
+            'donation_count': 1, 'issued_date': date(2026, 1, 1),
+        }
+        with mock.patch.object(certificate_pdf, '_rasterize_background',
+                               wraps=certificate_pdf._rasterize_background) as rasterize:
+            first = certificate_pdf.render_fields(fields)
+            certificate_pdf.render_fields(fields)
+        self.assertEqual(rasterize.call_count, 1)
+
+        template = certificate_pdf.background_template()
+        with Image.open(template) as image:
+            self.assertEqual(image.size, (1240, 1754))
+        self.assertLess(len(first), os.path.getsize(certificate_pdf.pattern_path()) // 4)
+
+    def test_missing_pattern_falls_back_to_fill(self):
+        with mock.patch.object(certificate_pdf, 'pattern_path', return_value='/nonexistent/pattern.jpg'):
+            self.assertIsNone(certificate_pdf.background_template())
+            pdf = certificate_pdf.render_fields({
+                'certificate_id': 'CERT1', 'donor_name': 'A B', 'title': 'T', 'donation_count': 2,
+                'issued_date': date(2026, 1, 1),
+            })
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_certificates', '--count', '1', stdout=out)
+        self.assertIn('Before:', out.getvalue())
+        self.assertIn('x faster', out.getvalue())
@@ -0,0 +1,131 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.apps import apps
+from io import StringIO
+import importlib
+
+from blood import certificates
+from blood import stock as stock_service
+from blood.models import Certificate, Stock
+from blood.testing import DataQueriesMixin
+from donor.models import Donor, BloodDonate
+
+
+class TierTest(TestCase):
+    def test_masks(self):
+        self.assertEqual(certificates.due_mask(0), 0)
+        self.assertEqual(certificates.due_mask(5), certificates.tier_mask(['FIRST_DONATION', 'REGULAR_DONOR']))
+        self.assertEqual(certificates.due_mask(50), 0b11111)
+        self.assertEqual(certificates.next_tier(7), ('HERO_DONOR', 10))
+        self.assertIsNone(certificates.next_tier(50))
+
+
+class DonationCounterTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client = Client()
+        self.client.login(username='admin', password='testpass123')
+        self.donor = Donor.objects.create(
+            user=User.objects.create_user(username='ravi', password='testpass123', first_name='Ravi'),
+            bloodgroup='O+', address='Pune', mobile='9876543210'
+        )
+
+    def donate(self, status='Pending'):
+        return BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='O+', unit=1, status=status)
+
+    def test_approval_counts_and_awards_once(self):
+        for _ in range(5):
+            self.client.get(f'/approve-donation/{self.donate().id}')
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 5)
+        self.assertEqual(self.donor.certificate_tiers, certificates.due_mask(5))
+        self.assertEqual(
+            sorted(Certificate.objects.filter(donor=self.donor).values_list('certificate_type', flat=True)),
+            ['FIRST_DONATION', 'REGULAR_DONOR']
+        )
+
+        # Approving the same donation again does not count it, nor add its units, twice
+        donation = BloodDonate.objects.filter(donor=self.donor).first()
+        units = Stock.objects.get(bloodgroup='O+').unit
+        self.client.get(f'/approve-donation/{donation.id}')
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 5)
+        self.assertEqual(Stock.objects.get(bloodgroup='O+').unit, units)
+
+        self.client.get(f'/reject-donation/{donation.id}')
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 4)
+        self.assertEqual(Certificate.objects.filter(donor=self.donor).count(), 2)
+
+    def test_concurrent_approvals_count_once(self):
+        """A second approval that read the donation before the first committed changes nothing"""
+        donation = self.donate()
+        stale = BloodDonate.objects.get(pk=donation.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(certificates.approve_donation(donation), ['FIRST_DONATION'])
+            self.assertIsNone(certificates.approve_donation(stale))
+
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 1)
+        self.assertEqual(Certificate.objects.filter(donor=self.donor).count(), 1)
+        self.assertEqual(stock_service.get_units('O+'), 1)
+
+    def test_award_is_single_insert(self):
+        with self.assertNumDataQueries(6):
+            # savepoint, counter update, counter read, tier update, one certificate insert, release
+            self.assertEqual(certificates.record_approval(self.donor), ['FIRST_DONATION'])
+        with self.assertNumDataQueries(4):
+            self.assertEqual(certificates.record_approval(self.donor), [])
+        with self.assertNumDataQueries(0):
+            self.assertEqual(certificates.award_due(self.donor), [])
+
+    def test_several_tiers_on_one_day(self):
+        self.donor.approved_donations = 9
+        self.donor.save()
+        self.assertEqual(certificates.record_approval(self.donor), ['FIRST_DONATION', 'REGULAR_DONOR', 'HERO_DONOR'])
+        self.assertEqual(len(set(Certificate.objects.values_list('certificate_id', flat=True))), 3)
+
+    def test_certificates_page_uses_counters(self):
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(self.donor.user)
+        certificates.record_approval(self.donor)
+        client = Client()
+        client.login(username='ravi', password='testpass123')
+        response = client.get('/donor/certificates')
+        self.assertEqual(response.context['donation_count'], 1)
+        self.assertEqual(response.context['potential_certificates'], [])
+        self.assertEqual(len(response.context['certificates']), 1)
+
+    def test_backfill_command(self):
+        for status in ('Approved',) * 6 + ('Pending', 'Rejected'):
+            self.donate(status)
+        Certificate.objects.create(donor=self.donor, certificate_type='FIRST_DONATION', donation_count=1)
+
+        out = StringIO()
+        call_command('backfill_donation_counters', stdout=out)
+        self.assertIn('Updated 1 donors and issued 0 certificates', out.getvalue())
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 6)
+        self.assertEqual(self.donor.certificate_tiers, certificates.tier_mask(['FIRST_DONATION']))
+
+        call_command('backfill_donation_counters', '--award', stdout=out)
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.certificate_tiers, certificates.due_mask(6))
+        self.assertTrue(Certificate.objects.filter(donor=self.donor, certificate_type='REGULAR_DONOR').exists())
+
+    def test_migration_fills_counters_without_awarding(self):
+        """Donors from before the counters keep their tiers, so the next approval issues nothing twice"""
+        for status in ('Approved',) * 4 + ('Pending',):
+            self.donate(status)
+        Certificate.objects.create(donor=self.donor, certificate_type='FIRST_DONATION', donation_count=1)
+
+        migration = importlib.import_module('donor.migrations.0005_donor_donation_counters')
+        migration.fill_counters(apps, None)
+        self.donor.refresh_from_db()
+        self.assertEqual(self.donor.approved_donations, 4)
+        self.assertEqual(self.donor.certificate_tiers, certificates.tier_mask(['FIRST_DONATION']))
+
+        self.assertEqual(certificates.record_approval(self.donor), ['REGULAR_DONOR'])
+        self.assertEqual(Certificate.objects.filter(donor=self.donor, certificate_type='FIRST_DONATION').count(), 1)
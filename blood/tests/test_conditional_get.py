@@ -0,0 +1,111 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from decimal import Decimal
+
+from blood.models import Hospital, NotificationJob
+from blood import conditional
+from blood import stock as stock_service
+from blood.testing import THROTTLE_QUERIES, DataQueriesMixin, steady_throttle
+
+
+class ConditionalGetTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+        self.hospital = Hospital.objects.create(
+            name='Test Hospital', address='123 Test Street', city='Mumbai', state='Maharashtra',
+            contact_phone='+91-22-12345678', contact_email='test@hospital.com',
+            latitude=Decimal('19.0760'), longitude=Decimal('72.8777'), is_partner=True
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.set_units('A+', 10)
+        steady_throttle(self)
+
+    def assertRevalidates(self, url, params=None):
+        """First response carries an ETag that yields an empty 304 on the next poll"""
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get(url, params or {}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_blood_stock_summary_not_modified(self):
+        url = reverse('blood_api:blood_stock_summary')
+        etag = self.assertRevalidates(url)
+
+        # Unchanged body is also byte-identical now that it has no request timestamp
+        self.assertEqual(self.client.get(url).content, self.client.get(url).content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.add_units('A+', 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['blood_stock']['A+']['units'], 11)
+
+    def test_not_modified_skips_the_view(self):
+        """A matching ETag costs no stock or hospital queries"""
+        url = reverse('blood_api:nearby_hospitals')
+        params = {'lat': '19.0760', 'lng': '72.8777', 'radius_km': '10'}
+        etag = self.assertRevalidates(url, params)
+
+        # Session and user lookups, then the throttle's counter
+        with self.assertNumDataQueries(2 + THROTTLE_QUERIES):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_nearby_hospitals_etag_follows_hospital_table(self):
+        url = reverse('blood_api:nearby_hospitals')
+        params = {'lat': '19.0760', 'lng': '72.8777', 'radius_km': '10'}
+        etag = self.assertRevalidates(url, params)
+
+        self.hospital.name = 'Renamed Hospital'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hospital.save()
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['hospitals'][0]['name'], 'Renamed Hospital')
+
+        # A different search never shares the ETag
+        response = self.client.get(url, dict(params, radius_km='20'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_shared_by_workers_and_never_reused(self):
+        """Another worker answers the same ETag; an evicted version does not bring an old one back"""
+        url = reverse('blood_api:blood_stock_summary')
+        etag = self.client.get(url)['ETag']
+        # A worker with nothing in process memory: its ETag comes from the shared versions alone
+        stock_service._snapshot = None
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        cache.delete(stock_service.STOCK_VERSION_KEY)
+        cache.delete(conditional.HOSPITAL_VERSION_KEY)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_notification_status_follows_job_updates(self):
+        job = NotificationJob.objects.create(
+            user=self.user, user_latitude=Decimal('19.0760'), user_longitude=Decimal('72.8777')
+        )
+        url = reverse('blood_api:notification_status', args=[job.id])
+        etag = self.assertRevalidates(url)
+
+        job.status = 'COMPLETED'
+        job.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'COMPLETED')
+
+    def test_missing_job_has_no_etag(self):
+        url = reverse('blood_api:notification_status', args=[999])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,177 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db.models.query import QuerySet
+from django.core.cache import cache
+from unittest.mock import patch
+from datetime import timedelta
+from decimal import Decimal
+import random
+
+from django.utils import timezone
+
+from blood import fanout
+from blood import stock as stock_service
+from blood.models import Hospital, NotificationJob
+from blood.tasks import send_pending_notifications
+from blood.testing import DataQueriesMixin
+
+
+def make_hospital(name, latitude, longitude, is_partner=True):
+    return Hospital.objects.create(
+        name=name, address='-', city='Mumbai', state='Maharashtra', contact_phone='-',
+        contact_email='h@example.com', emergency_contact='-', is_partner=is_partner,
+        latitude=Decimal(f'{latitude:.6f}'), longitude=Decimal(f'{longitude:.6f}')
+    )
+
+
+class FanoutTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='caller', email='caller@example.com')
+        rng = random.Random(7)
+        for i in range(40):
+            make_hospital(f'H{i}', 19.0 + rng.uniform(-0.2, 0.2), 72.9 + rng.uniform(-0.2, 0.2))
+        make_hospital('Not a partner', 19.0, 72.9, is_partner=False)
+        self.rng = rng
+
+    def add_jobs(self, count, radius_km=10):
+        return NotificationJob.objects.bulk_create([
+            NotificationJob(
+                user=self.user, radius_km=radius_km, notification_type='EMAIL',
+                user_latitude=Decimal(f'{19.0 + self.rng.uniform(-0.03, 0.03):.6f}'),
+                user_longitude=Decimal(f'{72.9 + self.rng.uniform(-0.03, 0.03):.6f}'),
+            )
+            for _ in range(count)
+        ])
+
+    def test_each_job_gets_exactly_its_own_hospitals(self):
+        self.add_jobs(60)
+        self.add_jobs(20, radius_km=3)
+        sent = {}
+
+        def deliver(job, nearby_hospitals, blood_stock):
+            sent[job.pk] = [(h.pk, h.distance) for h in nearby_hospitals]
+            return {'sms': None, 'email': 'Email sent'}
+
+        result = fanout.drain(deliver=deliver)
+        self.assertEqual(result.jobs, 80)
+        self.assertLess(result.groups, result.jobs)
+
+        hospitals = fanout.partner_hospitals()
+        for job in NotificationJob.objects.all():
+            expected = fanout.nearby(hospitals, job.user_latitude, job.user_longitude, job.radius_km)
+            self.assertEqual(sent.get(job.pk, []), [(h.pk, h.distance) for h in expected])
+
+    def test_queries_do_not_grow_with_jobs(self):
+        self.add_jobs(30)
+        jobs = fanout.claim_pending()
+
+        def deliver(job, nearby_hospitals, blood_stock):
+            return {'sms': None, 'email': 'Email sent'}
+
+        groups = len({fanout.cell_key(j.user_latitude, j.user_longitude, j.radius_km) for j in jobs})
+        stock_service.as_dict()
+        # hospitals, then one bulk update per group; the stock snapshot is shared
+        with self.assertNumDataQueries(1 + groups):
+            fanout.process_jobs(jobs, deliver=deliver)
+
+    def test_outcomes_are_recorded(self):
+        near, far = self.add_jobs(2)
+        far.user_latitude, far.user_longitude = Decimal('28.6'), Decimal('77.2')
+        far.save()
+
+        def deliver(job, nearby_hospitals, blood_stock):
+            return {'sms': None, 'email': None}
+
+        result = fanout.drain(deliver=deliver)
+        self.assertEqual((result.completed, result.failed), (0, 2))
+        near.refresh_from_db()
+        far.refresh_from_db()
+        self.assertTrue(near.error_message.startswith('All notifications failed'))
+        self.assertEqual(far.error_message, 'No hospitals found within specified radius')
+        self.assertEqual(fanout.claim_pending(), [])
+
+    def test_task_sends_pending_jobs(self):
+        self.add_jobs(3)
+        with patch('blood.tasks.send_email_notification', return_value='Email sent via Django') as send:
+            result = send_pending_notifications()
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(result['completed'], 3)
+        self.assertEqual(send.call_count, 3)
+        self.assertFalse(NotificationJob.objects.exclude(status='COMPLETED').exists())
+
+    @override_settings(NOTIFICATION_BATCH_WINDOW=2, NOTIFICATION_USE_CELERY=True)
+    def test_requests_in_a_window_share_one_run(self):
+        with patch('blood.tasks.send_pending_notifications.apply_async') as apply_async:
+            for job in self.add_jobs(3):
+                fanout.schedule(job.pk)
+            self.assertEqual(apply_async.call_count, 1)
+
+            fanout.batch_started()
+            fanout.schedule(job.pk)
+            self.assertEqual(apply_async.call_count, 2)
+
+    @override_settings(NOTIFICATION_BATCH_WINDOW=0, NOTIFICATION_USE_CELERY=True)
+    def test_without_window_each_job_is_sent_alone(self):
+        with patch('blood.tasks.send_hospital_notifications.delay') as delay:
+            fanout.schedule(42)
+        delay.assert_called_once_with(42)
+
+    def test_claim_skips_jobs_another_worker_took(self):
+        jobs = self.add_jobs(3)
+        taken = NotificationJob.objects.filter(pk=jobs[0].pk)
+        real_update = QuerySet.update
+
+        def claim_first(queryset, **kwargs):
+            # Another worker claims the first job between our read and our update
+            if kwargs.get('status') == 'PROCESSING' and not taken.filter(status='PROCESSING').exists():
+                real_update(taken, status='PROCESSING')
+            return real_update(queryset, **kwargs)
+
+        with patch.object(QuerySet, 'update', claim_first):
+            claimed = fanout.claim_pending()
+        self.assertEqual(sorted(job.pk for job in claimed), sorted(job.pk for job in jobs[1:]))
+        self.assertTrue(all(job.status == 'PROCESSING' for job in claimed))
+
+    def test_errors_are_retried_with_backoff(self):
+        job, = self.add_jobs(1)
+
+        def deliver(job, nearby_hospitals, blood_stock):
+            raise ConnectionError('SMTP down')
+
+        with patch('blood.background.get_queue') as get_queue:
+            result = fanout.drain(deliver=deliver)
+        self.assertEqual((result.failed, result.retried), (0, 1))
+        get_queue.return_value.retry_later.assert_called_once_with(job.pk, 120)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.retry_count), ('PROCESSING', 1))
+        self.assertEqual(job.error_message, 'SMTP down')
+
+        # The last attempt fails the job
+        NotificationJob.objects.filter(pk=job.pk).update(status='PENDING', retry_count=job.max_retries - 1)
+        with patch('blood.background.get_queue') as get_queue:
+            result = fanout.drain(deliver=deliver)
+        self.assertEqual((result.failed, result.retried), (1, 0))
+        get_queue.return_value.retry_later.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+
+    @override_settings(NOTIFICATION_USE_CELERY=True)
+    def test_retries_go_to_celery(self):
+        job, = self.add_jobs(1)
+        with patch('blood.tasks.send_hospital_notifications.apply_async') as apply_async:
+            fanout.drain(deliver=lambda *args: 1 / 0)
+        apply_async.assert_called_once_with(args=[job.pk], countdown=120)
+
+    def test_sweep_resets_abandoned_jobs(self):
+        stale, recent = self.add_jobs(2)
+        NotificationJob.objects.filter(pk=stale.pk).update(
+            status='PROCESSING', updated_at=timezone.now() - timedelta(hours=1)
+        )
+        NotificationJob.objects.filter(pk=recent.pk).update(status='PROCESSING', updated_at=timezone.now())
+        with patch('blood.tasks.send_email_notification', return_value='Email sent via Django'):
+            result = send_pending_notifications()
+        self.assertEqual(result['completed'], 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, recent.status), ('COMPLETED', 'PROCESSING'))
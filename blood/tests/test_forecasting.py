@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth.models import User
+import numpy as np
+
+from blood.forecasting import (
+    daily_series, days_until_stockout, forecast_levels, refresh_stock_forecasts,
+)
+from blood.models import BloodRequest, StockForecast
+from blood import stock as stock_service
+from blood.tasks import forecast_stock_demand
+from donor.models import Donor, BloodDonate
+
+
+class ForecastMathTest(SimpleTestCase):
+    def test_forecast_matches_recursive_smoothing(self):
+        """Vectorised weights reproduce the recursive smoothing formula"""
+        series = np.array([[4.0, 2.0, 6.0, 1.0, 3.0], [0.0, 0.0, 5.0, 5.0, 0.0]])
+        alpha = 0.3
+
+        expected = series[:, 0].copy()
+        for t in range(1, series.shape[1]):
+            expected = alpha * series[:, t] + (1 - alpha) * expected
+
+        np.testing.assert_allclose(forecast_levels(series, alpha), expected)
+
+    def test_days_until_stockout(self):
+        """Stockout is only projected when demand outpaces supply"""
+        result = days_until_stockout(
+            np.array([10.0, 10.0]), np.array([2.0, 1.0]), np.array([0.0, 3.0])
+        )
+        self.assertEqual(result, [5.0, None])
+
+
+class StockForecastTaskTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='donor', password='testpass123')
+        self.donor = Donor.objects.create(user=user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.set_units('A+', 6)
+
+    def test_daily_series_groups_by_day_and_group(self):
+        """Requests and approved donations land in separate series"""
+        BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='A+', unit=2)
+        BloodRequest.objects.create(patient_name='Q', patient_age=50, reason='Accident', bloodgroup='A+', unit=3)
+        BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='O+', unit=1, status='Approved')
+        BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='O+', unit=4, status='Pending')
+
+        series = daily_series(history_days=7)
+
+        self.assertEqual(series.shape, (2, 8, 7))
+        self.assertEqual(series[0, 0, -1], 5)
+        self.assertEqual(series[1, 6, -1], 1)
+        self.assertEqual(series.sum(), 6)
+
+    def test_forecast_task_stores_projections(self):
+        """Nightly task writes one forecast per blood group"""
+        BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='A+', unit=10)
+
+        result = forecast_stock_demand()
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(StockForecast.objects.count(), 8)
+
+        forecast = StockForecast.objects.get(bloodgroup='A+')
+        self.assertEqual(forecast.current_units, 6)
+        self.assertIsNotNone(forecast.days_until_stockout)
+
+        # Re-running updates rows in place
+        refresh_stock_forecasts()
+        self.assertEqual(StockForecast.objects.count(), 8)
@@ -0,0 +1,139 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from unittest import mock
+import os
+import tempfile
+
+from blood import importer, search
+from blood.hashing import PasswordHasherPool
+from donor.models import Donor
+from patient.models import Patient
+
+DONOR_HEADER = 'username,first_name,last_name,bloodgroup,mobile,address,password,email,aadhaar_number\n'
+
+
+class ImportRosterTest(TestCase):
+    def test_imports_donors_into_group(self):
+        stream = StringIO(
+            DONOR_HEADER
+            + 'ravi,Ravi,Kumar,O+,9876543210,Pune,secret123,ravi@example.com,1234 5678 9012\n'
+            + 'sita,Sita,Joshi,AB-,9123456789,Nashik,,,\n'
+        )
+        result = importer.import_roster('donors', stream, chunk_size=1, workers=0)
+
+        self.assertEqual((result.rows, result.created, result.error_count), (2, 2, 0))
+        ravi = Donor.objects.get(user__username='ravi')
+        self.assertEqual(ravi.aadhaar_number, '123456789012')
+        self.assertTrue(ravi.user.check_password('secret123'))
+        self.assertTrue(ravi.user.groups.filter(name='DONOR').exists())
+        self.assertFalse(User.objects.get(username='sita').has_usable_password())
+        if search.get_backend():
+            self.assertEqual([hit.object for hit in search.search('nashik')], [Donor.objects.get(user__username='sita')])
+
+    def test_reports_row_errors_by_line(self):
+        User.objects.create_user(username='taken')
+        stream = StringIO(
+            DONOR_HEADER
+            + 'ok,A,B,A+,9876543210,Pune,,,\n'
+            + 'bad,A,B,Z+,9876543210,Pune,,,\n'
+            + 'ok,A,B,A+,9876543210,Pune,,,\n'
+            + 'taken,A,B,A+,9876543210,Pune,,,\n'
+            + 'short,A,B,A+,9876543210,Pune,,,123\n'
+            + 'nomobile,A,B,A+,,Pune,,,\n'
+        )
+        result = importer.import_roster('donors', stream, workers=0)
+
+        self.assertEqual(result.created, 1)
+        messages = dict(result.errors)
+        self.assertEqual(sorted(messages), [3, 4, 5, 6, 7])
+        self.assertIn('bloodgroup', messages[3])
+        self.assertIn('already exists', messages[4])
+        self.assertIn('already exists', messages[5])
+        self.assertIn('12 digits', messages[6])
+        self.assertIn('missing mobile', messages[7])
+
+    def test_rows_taken_during_the_import_are_reported(self):
+        stream = StringIO(
+            DONOR_HEADER
+            + 'ravi,Ravi,Kumar,O+,9876543210,Pune,,,\n'
+            + 'late,A,B,A+,9876543210,Pune,,,\n'
+            + 'sita,Sita,Joshi,AB-,9123456789,Nashik,,,\n'
+        )
+        hash_passwords = PasswordHasherPool.hash
+
+        def register_meanwhile(pool, passwords):
+            # Someone signs up as 'late' after the chunk was checked
+            User.objects.create_user(username='late')
+            return hash_passwords(pool, passwords)
+
+        with mock.patch.object(PasswordHasherPool, 'hash', autospec=True, side_effect=register_meanwhile):
+            result = importer.import_roster('donors', stream, workers=0)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, [(3, 'username late already exists')])
+        self.assertEqual(sorted(Donor.objects.values_list('user__username', flat=True)), ['ravi', 'sita'])
+
+    def test_imports_patients(self):
+        stream = StringIO(
+            'username,first_name,last_name,bloodgroup,mobile,address,age,disease,doctorname\n'
+            'meera,Meera,Rao,O-,9123456789,Mumbai,40,Anaemia,Dr Shah\n'
+            'old,Old,Man,O-,9123456789,Mumbai,200,Anaemia,Dr Shah\n'
+        )
+        result = importer.import_roster('patients', stream, workers=0)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Patient.objects.get().age, 40)
+        self.assertTrue(User.objects.get(username='meera').groups.filter(name='PATIENT').exists())
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            importer.import_roster('patients', StringIO(DONOR_HEADER), workers=0)
+
+    def test_hasher_pool(self):
+        with PasswordHasherPool(workers=2) as hasher:
+            hashed = hasher.hash(['one', 'two', 'three'])
+        user = User(username='x')
+        for password, encoded in zip(['one', 'two', 'three'], hashed):
+            user.password = encoded
+            self.assertTrue(user.check_password(password))
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8-sig') as f:
+            f.write(DONOR_HEADER + 'ravi,Ravi,Kumar,O+,9876543210,Pune,,,\n' + 'bad,A,B,Z+,9876543210,Pune,,,\n')
+        self.addCleanup(os.unlink, f.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_roster', 'donors', f.name, '--workers', '0', stdout=out, stderr=err)
+        self.assertIn('Imported 1 of 2 donors', out.getvalue())
+        self.assertIn('line 3:', err.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('import_roster', 'patients', f.name, '--workers', '0', stdout=out)
+
+
+class AdminImportViewTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.login(username='admin', password='testpass123')
+
+    def test_upload(self):
+        upload = SimpleUploadedFile('donors.csv', (DONOR_HEADER + 'ravi,Ravi,Kumar,O+,9876543210,Pune,,,\n').encode('utf-8'))
+        response = self.client.post('/admin-import', {'kind': 'donors', 'roster': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Imported 1 of 1 rows')
+        self.assertTrue(Donor.objects.filter(user__username='ravi').exists())
+
+    def test_upload_hashes_inline(self):
+        upload = SimpleUploadedFile('donors.csv', (DONOR_HEADER + 'ravi,Ravi,Kumar,O+,9876543210,Pune,,,\n').encode('utf-8'))
+        with mock.patch('blood.importer.import_roster', wraps=importer.import_roster) as import_roster:
+            self.client.post('/admin-import', {'kind': 'donors', 'roster': upload})
+        self.assertEqual(import_roster.call_args.kwargs['workers'], 0)
+
+    def test_bad_header(self):
+        upload = SimpleUploadedFile('donors.csv', b'name,group\nravi,O+\n')
+        response = self.client.post('/admin-import', {'kind': 'donors', 'roster': upload})
+        self.assertContains(response, 'missing columns')
@@ -0,0 +1,93 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+import unittest
+
+from blood.models import BloodRequest, NotificationJob
+from chatbot.models import ChatSession, ChatMessage
+from donor.models import Donor, BloodDonate
+from patient.models import Patient
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Plans are read with EXPLAIN QUERY PLAN')
+class QueryPlanTest(TestCase):
+    """The hot filter paths are answered from the composite indexes, not table scans"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+
+        self.donor = Donor.objects.create(
+            user=User.objects.create_user(username='donor', password='testpass123'),
+            bloodgroup='O+', address='Pune', mobile='9876543210'
+        )
+        self.patient = Patient.objects.create(
+            user=User.objects.create_user(username='patient', password='testpass123'),
+            age=40, bloodgroup='A+', disease='None', doctorname='Dr', address='Pune', mobile='9876543210'
+        )
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(self.donor.user)
+        Group.objects.get_or_create(name='PATIENT')[0].user_set.add(self.patient.user)
+        for status in ('Pending', 'Approved', 'Rejected'):
+            BloodRequest.objects.create(
+                request_by_donor=self.donor, patient_name='P', patient_age=40,
+                reason='Surgery', bloodgroup='O+', unit=1, status=status
+            )
+            BloodRequest.objects.create(
+                request_by_patient=self.patient, patient_name='P', patient_age=40,
+                reason='Surgery', bloodgroup='A+', unit=1, status=status
+            )
+
+    def view_plans(self, url, username):
+        """Run EXPLAIN QUERY PLAN on every SELECT the view issues"""
+        self.client.login(username=username, password='testpass123')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.extend(row[-1] for row in cursor.fetchall())
+        return '\n'.join(plans)
+
+    def test_admin_request_queue(self):
+        plans = self.view_plans('/admin-request', 'admin')
+        self.assertIn('bloodreq_status_id_idx', plans)
+
+    def test_donor_dashboard(self):
+        plans = self.view_plans('/donor/donor-dashboard', 'donor')
+        self.assertIn('bloodreq_donor_status_idx', plans)
+
+    def test_patient_dashboard(self):
+        plans = self.view_plans('/patient/patient-dashboard', 'patient')
+        self.assertIn('bloodreq_patient_status_idx', plans)
+
+    def test_donation_approval_certificate_checks(self):
+        """Approval reads the donor's counters instead of counting donations or certificates"""
+        donation = BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='O+', unit=1)
+        plans = self.view_plans(f'/approve-donation/{donation.id}', 'admin')
+        self.assertNotIn('blood_certificate', plans)
+        self.assertNotIn('donor_blooddonate', plans.replace('SEARCH donor_blooddonate USING INTEGER PRIMARY KEY', ''))
+
+    def test_counter_backfill(self):
+        plan = (BloodDonate.objects.filter(status='Approved').values('donor')
+                .annotate(total=Count('id')).values_list('donor', 'total').explain())
+        self.assertIn('blooddonate_donor_status_idx', plan)
+
+    def test_notification_jobs_by_user(self):
+        NotificationJob.objects.create(
+            user=self.admin, user_latitude=Decimal('19.0760'), user_longitude=Decimal('72.8777')
+        )
+        plan = NotificationJob.objects.filter(user=self.admin).explain()
+        self.assertIn('notifjob_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_chat_history(self):
+        session = ChatSession.objects.create(session_id='abc')
+        ChatMessage.objects.create(session=session, message_type='user', content='hi')
+        plan = ChatMessage.objects.filter(session=session).order_by('-created_at')[:10].explain()
+        self.assertIn('chatmsg_session_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
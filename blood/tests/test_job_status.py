@@ -0,0 +1,120 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from decimal import Decimal
+from unittest.mock import patch
+import asyncio
+import json
+
+from blood import job_status
+from blood.models import NotificationJob
+
+
+def parse_event(message):
+    lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return lines['event'], json.loads(lines['data'])
+
+
+class JobStatusTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='caller', password='testpass123')
+        self.job = NotificationJob.objects.create(
+            user=self.user, user_latitude=Decimal('19.0760'), user_longitude=Decimal('72.8777')
+        )
+        self.stream_url = f'/api/notification-status/{self.job.pk}/stream/'
+        self.wait_url = f'/api/notification-status/{self.job.pk}/wait/'
+
+    def finish(self):
+        # Commit hooks are what push the change
+        with self.captureOnCommitCallbacks(execute=True):
+            self.job.mark_completed()
+
+    async def test_stream_pushes_the_transition_and_ends(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.stream_url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = response.streaming_content
+        self.assertTrue((await content.__anext__()).startswith(b'retry:'))
+        event, state = parse_event((await content.__anext__()).decode())
+        self.assertEqual((event, state['status']), ('status', 'PENDING'))
+
+        await sync_to_async(self.finish)()
+        event, state = parse_event((await asyncio.wait_for(content.__anext__(), timeout=1)).decode())
+        self.assertEqual((event, state['status']), ('status', 'COMPLETED'))
+        self.assertIsNotNone(state['completed_at'])
+        # Finished jobs end the stream
+        with self.assertRaises(StopAsyncIteration):
+            await content.__anext__()
+        self.assertFalse(job_status.notifier.watching(self.job.pk))
+
+    async def test_stream_of_another_users_job_is_not_found(self):
+        other = await sync_to_async(User.objects.create_user)(username='other')
+        await sync_to_async(self.async_client.force_login)(other)
+        response = await self.async_client.get(self.stream_url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['code'], 'JOB_NOT_FOUND')
+
+    async def test_stream_requires_login(self):
+        response = await self.async_client.get(self.stream_url)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_long_poll(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.wait_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        etag = response['ETag']
+
+        # Nothing changes within the timeout
+        response = await self.async_client.get(self.wait_url, {'timeout': '0.05'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # The waiting request answers as soon as the job changes
+        waiting = asyncio.ensure_future(
+            self.async_client.get(self.wait_url, {'timeout': '5'}, headers={'If-None-Match': etag})
+        )
+        while not job_status.notifier.watching(self.job.pk):
+            await asyncio.sleep(0.01)
+        # Pushed directly: saving here would contend with the request's own connection on SQLite
+        self.job.status = 'COMPLETED'
+        self.job.updated_at = timezone.now()
+        job_status.notifier.publish(job_status.job_state(self.job))
+        response = await asyncio.wait_for(waiting, timeout=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'COMPLETED')
+        self.assertNotEqual(response['ETag'], etag)
+
+    async def test_long_poll_etag_matches_status_endpoint(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.wait_url)
+        status_response = await self.async_client.get(f'/api/notification-status/{self.job.pk}/')
+        self.assertEqual(status_response['ETag'], response['ETag'])
+
+    async def test_long_poll_rejects_bad_timeout(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.wait_url, {'timeout': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_changes_from_other_processes_are_polled(self):
+        notifier = job_status.JobNotifier(poll_interval=60)
+        queue = notifier.subscribe(self.job.pk)
+        # As a Celery worker would: no signal reaches this process
+        await sync_to_async(NotificationJob.objects.filter(pk=self.job.pk).update)(status='FAILED')
+
+        await notifier.refresh()
+        state = await asyncio.wait_for(queue.get(), timeout=1)
+        self.assertEqual(state['status'], 'FAILED')
+        # Unchanged jobs are not sent again
+        await notifier.refresh()
+        await asyncio.sleep(0)
+        self.assertTrue(queue.empty())
+        notifier.unsubscribe(self.job.pk, queue)
+
+    def test_unwatched_jobs_cost_nothing(self):
+        with patch.object(job_status.notifier, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.job.mark_completed()
+        self.assertEqual(callbacks, [])
+        publish.assert_not_called()
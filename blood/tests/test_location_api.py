@@ -5,6 +5,7 @@ from decimal import Decimal
 import json
 
 from blood.models import Hospital, Stock, NotificationJob
+from blood import stock as stock_service
 
 
 class HospitalLocationAPITest(TestCase):
@@ -49,9 +50,10 @@ class HospitalLocationAPITest(TestCase):
         )
         
         # Create test blood stock
-        Stock.objects.create(bloodgroup='A+', unit=50)
-        Stock.objects.create(bloodgroup='O-', unit=25)
-        Stock.objects.create(bloodgroup='B+', unit=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.set_units('A+', 50)
+            stock_service.set_units('O-', 25)
+            stock_service.set_units('B+', 0)
         
         # Login user
         self.client.login(username='testuser', password='testpass123')
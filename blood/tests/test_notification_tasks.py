@@ -4,6 +4,7 @@ from unittest.mock import patch, MagicMock
 from decimal import Decimal
 
 from blood.models import Hospital, Stock, NotificationJob
+from blood import stock as stock_service
 from blood.tasks import send_hospital_notifications, send_sms_notification, send_email_notification
 
 
@@ -34,8 +35,9 @@ class NotificationTaskTest(TestCase):
         )
         
         # Create blood stock
-        Stock.objects.create(bloodgroup='A+', unit=50)
-        Stock.objects.create(bloodgroup='O-', unit=25)
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.set_units('A+', 50)
+            stock_service.set_units('O-', 25)
         
         # Create notification job
         self.job = NotificationJob.objects.create(
@@ -0,0 +1,123 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+
+from blood import profiles
+from blood.models import BloodRequest
+from blood.testing import DataQueriesMixin
+from donor.models import Donor, BloodDonate
+from patient.models import Patient
+
+# Page -> queries on a warm cache: session, user, then the page's own queries
+DONOR_PAGES = {
+    '/donor/donor-dashboard': 3,
+    '/donor/donate-blood': 2,
+    '/donor/donation-history': 3,
+    '/donor/make-request': 2,
+    '/donor/request-history': 3,
+}
+PATIENT_PAGES = {
+    '/patient/patient-dashboard': 3,
+    '/patient/make-request': 2,
+    '/patient/my-request': 3,
+}
+
+
+class SelfServiceQueryBudgetTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ravi', password='testpass123', first_name='Ravi')
+        self.donor = Donor.objects.create(user=user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(user)
+        user = User.objects.create_user(username='meera', password='testpass123')
+        self.patient = Patient.objects.create(
+            user=user, age=40, bloodgroup='O-', disease='Anaemia', doctorname='Dr Shah',
+            address='Mumbai', mobile='9123456789'
+        )
+        Group.objects.get_or_create(name='PATIENT')[0].user_set.add(user)
+
+        for status in ('Pending', 'Approved', 'Rejected', 'Pending'):
+            BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='O+',
+                                        unit=1, status=status, request_by_donor=self.donor)
+            BloodRequest.objects.create(patient_name='P', patient_age=40, reason='Surgery', bloodgroup='O-',
+                                        unit=1, status=status, request_by_patient=self.patient)
+            BloodDonate.objects.create(donor=self.donor, age=30, bloodgroup='O+', unit=1, status=status)
+
+    def assertBudget(self, username, pages):
+        client = Client()
+        client.login(username=username, password='testpass123')
+        for url, budget in pages.items():
+            client.get(url)  # warm the role and profile caches
+            with self.assertNumDataQueries(budget, msg=url):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_donor_pages(self):
+        self.assertBudget('ravi', DONOR_PAGES)
+
+    def test_patient_pages(self):
+        self.assertBudget('meera', PATIENT_PAGES)
+
+    def test_dashboard_counts(self):
+        client = Client()
+        client.login(username='ravi', password='testpass123')
+        response = client.get('/donor/donor-dashboard')
+        self.assertEqual(
+            [response.context[name] for name in ('requestpending', 'requestapproved', 'requestmade', 'requestrejected')],
+            [2, 1, 4, 1]
+        )
+
+    def test_anonymous_redirected(self):
+        self.assertRedirects(Client().get('/donor/donor-dashboard'), '/donor/donorlogin', fetch_redirect_response=False)
+        self.assertRedirects(Client().get('/patient/my-request'), '/patient/patientlogin', fetch_redirect_response=False)
+
+
+class ProfileCacheTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ravi', password='testpass123', first_name='Ravi')
+        self.donor = Donor.objects.create(user=self.user, bloodgroup='O+', address='Pune', mobile='9876543210',
+                                          aadhaar_number='123412341234')
+
+    def test_cached_with_user(self):
+        self.assertEqual(profiles.get_donor(self.user.id), self.donor)
+        with self.assertNumDataQueries(0):
+            self.assertEqual(profiles.get_donor(self.user.id).get_name, 'Ravi ')
+
+    def test_cache_holds_no_secrets(self):
+        """Only the page fields are cached; the rest is loaded from the database on access"""
+        profiles.get_donor(self.user.id)
+        cached = repr(cache.get(profiles._cache_key('donor', self.user.id)))
+        self.assertNotIn(self.user.password, cached)
+        self.assertNotIn('123412341234', cached)
+
+        donor = profiles.get_donor(self.user.id)
+        with self.assertNumDataQueries(1):
+            self.assertEqual(donor.aadhaar_number, '123412341234')
+        with self.assertNumDataQueries(1):
+            self.assertTrue(donor.user.check_password('testpass123'))
+
+    def test_invalidated_again_on_commit(self):
+        """Another worker may cache the old profile before the change commits"""
+        key = profiles._cache_key('donor', self.user.id)
+        profiles.get_donor(self.user.id)
+        stale = cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donor.address = 'Nashik'
+            self.donor.save()
+            cache.set(key, stale)
+        self.assertEqual(profiles.get_donor(self.user.id).address, 'Nashik')
+
+    def test_invalidated_on_save(self):
+        profiles.get_donor(self.user.id)
+        self.user.last_name = 'Kumar'
+        self.user.save()
+        self.assertEqual(profiles.get_donor(self.user.id).get_name, 'Ravi Kumar')
+
+        self.donor.address = 'Nashik'
+        self.donor.save()
+        self.assertEqual(profiles.get_donor(self.user.id).address, 'Nashik')
+
+        self.donor.delete()
+        with self.assertRaises(Donor.DoesNotExist):
+            profiles.get_donor(self.user.id)
@@ -0,0 +1,165 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core import mail
+from unittest.mock import patch
+from decimal import Decimal
+import time
+
+from blood import fanout, providers
+from blood.models import Hospital, NotificationJob
+from blood.tasks import notify_user, run_notification_job, send_email_notification, send_sms_notification
+from donor.models import Donor
+
+
+@override_settings(NOTIFICATION_SMS_PROVIDER='fake', NOTIFICATION_EMAIL_PROVIDER='fake')
+class ProviderRegistryTest(TestCase):
+    def setUp(self):
+        providers.reset()
+        self.addCleanup(providers.reset)
+        self.user = User.objects.create_user(username='ravi', email='ravi@example.com')
+        Donor.objects.create(user=self.user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        hospital = Hospital(name='City Hospital', address='-', city='Pune', state='MH', contact_phone='020-1',
+                            contact_email='h@example.com', emergency_contact='020-2')
+        hospital.distance = 1.5
+        self.context = {
+            'user': self.user, 'hospitals': [hospital], 'blood_stock': {'A+': 5},
+            'search_radius': 10, 'total_hospitals': 1,
+        }
+
+    def test_clients_are_built_once_per_process(self):
+        self.assertIs(providers.get('sms'), providers.get('sms'))
+        self.assertIs(providers.get('sms'), providers.get('email'))
+
+        with patch('blood.providers.TwilioClient') as client, patch.dict('os.environ', {
+            'TWILIO_ACCOUNT_SID': 'sid', 'TWILIO_AUTH_TOKEN': 'token', 'TWILIO_FROM_NUMBER': '+10000000000',
+        }):
+            client.return_value.messages.create.return_value.sid = 'SM1'
+            twilio = providers.get('sms', 'twilio')
+            self.assertIs(providers.get('sms', 'twilio'), twilio)
+            self.assertEqual(twilio.send_sms('+919876543210', 'hi'), 'SM1')
+            self.assertEqual(twilio.send_sms('+919876543210', 'hi'), 'SM1')
+        client.assert_called_once()
+
+    def test_settings_change_rebuilds(self):
+        fake = providers.get('email')
+        with self.settings(NOTIFICATION_EMAIL_PROVIDER='django'):
+            self.assertEqual(providers.get('email').name, 'django')
+        self.assertIsNot(providers.get('email'), fake)
+
+    def test_fake_provider_records_messages(self):
+        self.assertIn('SMS sent successfully', send_sms_notification(self.user, self.context))
+        self.assertEqual(send_email_notification(self.user, self.context), 'Email sent via fake')
+        fake = providers.fake()
+        self.assertEqual(fake.sms[0][0], '+919876543210')
+        self.assertIn('City Hospital (1.5km)', fake.sms[0][1])
+        self.assertEqual(fake.emails[0][0], 'ravi@example.com')
+
+    def test_sendgrid_reuses_one_session(self):
+        with patch.dict('os.environ', {'SENDGRID_API_KEY': 'key'}):
+            sendgrid = providers.get('email', 'sendgrid')
+        with patch.object(sendgrid.session, 'post') as post:
+            post.return_value.status_code = 202
+            for _ in range(2):
+                self.assertEqual(sendgrid.send_email('a@example.com', 'Subject', '<p>x</p>', 'x'), 202)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args.kwargs['json']['personalizations'], [{'to': [{'email': 'a@example.com'}]}])
+        self.assertEqual(sendgrid.session.headers['Authorization'], 'Bearer key')
+
+    @override_settings(NOTIFICATION_EMAIL_PROVIDER='django')
+    def test_batch_shares_one_smtp_connection(self):
+        with patch('blood.providers.get_connection', wraps=providers.get_connection) as get_connection:
+            with providers.email_batch():
+                for _ in range(3):
+                    self.assertEqual(send_email_notification(self.user, self.context), 'Email sent via Django')
+            # No Django email, no connection
+            with providers.email_batch():
+                pass
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_fanout_sends_through_providers(self):
+        Hospital.objects.create(name='City Hospital', address='-', city='Pune', state='MH', contact_phone='020-1',
+                                contact_email='h@example.com', emergency_contact='020-2', is_partner=True,
+                                latitude=Decimal('18.52'), longitude=Decimal('73.85'))
+        for _ in range(3):
+            NotificationJob.objects.create(user=self.user, user_latitude=Decimal('18.521'),
+                                           user_longitude=Decimal('73.851'), notification_type='BOTH')
+        result = fanout.drain()
+        self.assertEqual(result.completed, 3)
+        self.assertEqual((len(providers.fake().sms), len(providers.fake().emails)), (3, 3))
+
+
+class ConcurrentChannelsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ravi', email='ravi@example.com')
+        Donor.objects.create(user=self.user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        hospital = Hospital(name='City Hospital', address='-', city='Pune', state='MH', contact_phone='020-1',
+                            contact_email='h@example.com', emergency_contact='020-2')
+        hospital.distance = 1.5
+        self.hospitals = [hospital]
+        self.job = NotificationJob(user=self.user, user_latitude=Decimal('18.52'), user_longitude=Decimal('73.85'),
+                                   notification_type='BOTH')
+
+    def test_channels_are_sent_concurrently(self):
+        slow = providers.FakeProvider(latency=0.3)
+        with providers.override(sms=slow, email=slow):
+            started = time.monotonic()
+            results = notify_user(self.job, self.hospitals, {'A+': 5})
+            elapsed = time.monotonic() - started
+        self.assertIn('SMS sent successfully', results['sms'])
+        self.assertEqual(results['email'], 'Email sent via fake')
+        # One provider delay, not two back to back
+        self.assertLess(elapsed, 0.55)
+
+    @override_settings(NOTIFICATION_SMS_TIMEOUT=0.1)
+    def test_slow_channel_times_out_alone(self):
+        with providers.override(sms=providers.FakeProvider(latency=0.5), email=providers.FakeProvider()):
+            results = notify_user(self.job, self.hospitals, {'A+': 5})
+        self.assertEqual(results['sms'], 'SMS pending: no answer after 0.1s')
+        self.assertEqual(results['email'], 'Email sent via fake')
+
+    def test_single_channel_jobs(self):
+        fake = providers.FakeProvider()
+        self.job.notification_type = 'SMS'
+        with providers.override(sms=fake, email=fake):
+            results = notify_user(self.job, self.hospitals, {'A+': 5})
+        self.assertIsNone(results['email'])
+        self.assertEqual((len(fake.sms), len(fake.emails)), (1, 0))
+
+    @override_settings(NOTIFICATION_SMS_TIMEOUT=10, NOTIFICATION_HTTP_READ_TIMEOUT=5)
+    def test_http_attempts_fit_in_the_channel_timeout(self):
+        attempts = 1 + providers.HTTP_RETRIES
+        backoff = sum(providers.HTTP_BACKOFF_FACTOR * 2 ** n for n in range(1, providers.HTTP_RETRIES))
+        connect, read = providers.http_timeout('sms')
+        # Every connection attempt, then one read: replies are not retried
+        self.assertLessEqual(attempts * connect + backoff + read, 10)
+        self.assertEqual(read, 5)
+        self.assertGreater(connect, 1)
+
+
+class LateSmsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ravi', email='ravi@example.com')
+        Donor.objects.create(user=self.user, bloodgroup='O+', address='Pune', mobile='9876543210')
+        Hospital.objects.create(name='City Hospital', address='-', city='Pune', state='MH', contact_phone='020-1',
+                                contact_email='h@example.com', emergency_contact='020-2', is_partner=True,
+                                latitude=Decimal('18.52'), longitude=Decimal('73.85'))
+        self.job = NotificationJob.objects.create(user=self.user, user_latitude=Decimal('18.521'),
+                                                  user_longitude=Decimal('73.851'), notification_type='SMS')
+
+    @override_settings(NOTIFICATION_SMS_TIMEOUT=0.1)
+    def test_late_sms_completes_the_job_without_resending(self):
+        slow = providers.FakeProvider(latency=0.3)
+        with providers.override(sms=slow):
+            result = run_notification_job(self.job)
+            self.assertEqual(result['status'], 'failed')
+            self.job.refresh_from_db()
+            self.assertIn('SMS pending', self.job.error_message)
+
+            self.job.pending_sms.result(timeout=1)
+            deadline = time.monotonic() + 2
+            while self.job.status != 'COMPLETED' and time.monotonic() < deadline:
+                time.sleep(0.02)
+                self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'COMPLETED')
+        self.assertEqual(len(slow.sms), 1)
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from decimal import Decimal
+
+from blood import retention
+from blood.models import NotificationJob, NotificationJobSummary
+from blood.tasks import cleanup_old_notification_jobs
+
+
+class RetentionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='caller', email='caller@example.com')
+
+    def add_jobs(self, count, days_ago, status='COMPLETED', notification_type='EMAIL', retry_count=0):
+        jobs = NotificationJob.objects.bulk_create([
+            NotificationJob(
+                user=self.user, radius_km=10, notification_type=notification_type, status=status,
+                retry_count=retry_count, user_latitude=Decimal('19.000000'), user_longitude=Decimal('72.900000'),
+            )
+            for _ in range(count)
+        ])
+        ids = [job.pk for job in jobs] if jobs and jobs[0].pk else list(
+            NotificationJob.objects.order_by('-pk').values_list('pk', flat=True)[:count]
+        )
+        # created_at is auto_now_add; backdate it afterwards
+        NotificationJob.objects.filter(pk__in=ids).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return ids
+
+    def test_deletes_only_finished_jobs_past_retention(self):
+        old_done = self.add_jobs(5, days_ago=40)
+        old_failed = self.add_jobs(2, days_ago=40, status='FAILED')
+        old_pending = self.add_jobs(1, days_ago=40, status='PENDING')
+        old_processing = self.add_jobs(1, days_ago=40, status='PROCESSING')
+        recent = self.add_jobs(3, days_ago=5)
+
+        result = retention.cleanup_notification_jobs(days=30)
+
+        self.assertEqual(result.deleted, 7)
+        remaining = set(NotificationJob.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, set(old_pending + old_processing + recent))
+        self.assertFalse(remaining & set(old_done + old_failed))
+
+    def test_walks_id_range_in_chunks(self):
+        self.add_jobs(25, days_ago=40)
+
+        result = retention.cleanup_notification_jobs(days=30, chunk_size=10)
+
+        self.assertEqual(result.deleted, 25)
+        self.assertEqual(result.chunks, 3)
+        self.assertEqual(NotificationJob.objects.count(), 0)
+
+    def test_rolls_counts_into_summaries(self):
+        self.add_jobs(4, days_ago=40, retry_count=1)
+        self.add_jobs(2, days_ago=40, status='FAILED', notification_type='SMS', retry_count=3)
+
+        # Small chunks add to the same summary rows across transactions
+        retention.cleanup_notification_jobs(days=30, chunk_size=2)
+
+        day = (timezone.now() - timedelta(days=40)).date()
+        completed = NotificationJobSummary.objects.get(notification_type='EMAIL', status='COMPLETED')
+        failed = NotificationJobSummary.objects.get(notification_type='SMS', status='FAILED')
+        self.assertEqual((completed.jobs, completed.retries), (4, 4))
+        self.assertEqual((failed.jobs, failed.retries), (2, 6))
+        self.assertLessEqual(abs((completed.day - day).days), 1)
+
+        # A later run adds to the existing rows
+        self.add_jobs(3, days_ago=40, retry_count=0)
+        retention.cleanup_notification_jobs(days=30)
+        completed.refresh_from_db()
+        self.assertEqual(completed.jobs, 7)
+
+    def test_summaries_can_be_skipped(self):
+        self.add_jobs(3, days_ago=40)
+
+        result = retention.cleanup_notification_jobs(days=30, summarize=False)
+
+        self.assertEqual(result.deleted, 3)
+        self.assertEqual(result.summarized, 0)
+        self.assertFalse(NotificationJobSummary.objects.exists())
+
+    @override_settings(NOTIFICATION_JOB_RETENTION_DAYS=7)
+    def test_task_uses_configured_retention(self):
+        self.add_jobs(2, days_ago=10)
+        self.add_jobs(1, days_ago=3)
+
+        result = cleanup_old_notification_jobs()
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(result['deleted'], 2)
+        self.assertIn('rows_per_second', result)
+        self.assertEqual(NotificationJob.objects.count(), 1)
+
+    def test_nothing_to_clean(self):
+        self.add_jobs(2, days_ago=1)
+
+        result = retention.cleanup_notification_jobs(days=30)
+
+        self.assertEqual((result.deleted, result.chunks), (0, 0))
@@ -0,0 +1,112 @@
+from asgiref.sync import sync_to_async
+from django.test import TestCase, Client, AsyncClient
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+
+from blood import roles
+from blood.testing import DataQueriesMixin
+from donor.models import Donor
+from patient.models import Patient
+
+
+class RoleResolutionTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ravi', password='testpass123')
+        self.donor = Donor.objects.create(user=self.user, bloodgroup='O+', address='Kothrud, Pune', mobile='9876543210')
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(self.user)
+
+    def test_resolved_once(self):
+        self.assertEqual(roles.resolve(self.user), (roles.ROLE_DONOR, self.donor.id, None))
+        with self.assertNumDataQueries(0):
+            self.assertEqual(roles.get_role(self.user), roles.ROLE_DONOR)
+
+    def test_group_and_profile_changes_invalidate(self):
+        roles.resolve(self.user)
+        patient_group = Group.objects.get_or_create(name='PATIENT')[0]
+        self.user.groups.clear()
+        patient_group.user_set.add(self.user)
+        self.assertEqual(roles.resolve(self.user), (roles.ROLE_PATIENT, None, None))
+
+        patient = Patient.objects.create(
+            user=self.user, age=40, bloodgroup='O+', disease='None', doctorname='Dr Shah',
+            address='Pune', mobile='9123456789'
+        )
+        self.assertEqual(roles.resolve(self.user), (roles.ROLE_PATIENT, None, patient.id))
+
+        patient_group.user_set.clear()
+        self.assertEqual(roles.get_role(self.user), None)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(roles.get_role(self.user), roles.ROLE_ADMIN)
+
+    def test_donor_group_comes_before_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(roles.resolve(self.user), (roles.ROLE_DONOR, self.donor.id, None))
+
+    def test_invalidated_again_on_commit(self):
+        """Another worker may cache the old role before the change commits"""
+        roles.resolve(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.clear()
+            roles.resolve(self.user)  # as another worker would, from rows not yet committed
+            cache.set(roles._cache_key(self.user.id), (roles.ROLE_DONOR, self.donor.id, None))
+        self.assertEqual(roles.resolve(self.user), (None, None, None))
+
+
+class RoleMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ravi', password='testpass123')
+        self.donor = Donor.objects.create(user=user, bloodgroup='O+', address='Kothrud, Pune', mobile='9876543210')
+        Group.objects.get_or_create(name='DONOR')[0].user_set.add(user)
+        self.client = Client()
+        self.client.login(username='ravi', password='testpass123')
+
+    def test_afterlogin_uses_cached_role(self):
+        self.assertRedirects(self.client.get('/afterlogin'), '/donor/donor-dashboard', fetch_redirect_response=False)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/afterlogin')
+        self.assertFalse([q for q in queries.captured_queries if 'auth_user_groups' in q['sql']])
+
+    def test_request_attributes(self):
+        response = self.client.get('/sponsors')
+        request = response.wsgi_request
+        self.assertEqual(request.role, roles.ROLE_DONOR)
+        self.assertEqual(request.donor, self.donor)
+        self.assertIsNone(request.patient)
+        self.assertEqual(response.context['user_city'], 'Pune')
+
+        response = Client().get('/sponsors')
+        self.assertIsNone(response.wsgi_request.role)
+        self.assertIsNone(response.wsgi_request.donor)
+
+    def test_deleted_profile_is_none(self):
+        """A donor_id cached before the profile was deleted does not break the request"""
+        self.client.get('/sponsors')
+        cached = cache.get(roles._cache_key(self.donor.user_id))
+        Donor.objects.filter(pk=self.donor.pk).delete()
+        cache.set(roles._cache_key(self.donor.user_id), cached)
+
+        response = self.client.get('/donor/donor-dashboard')
+        self.assertFalse(response.wsgi_request.donor)
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(cache.get(roles._cache_key(self.donor.user_id)))
+
+    async def test_async_requests(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.donor.user)
+        response = await client.get('/sponsors')
+        self.assertEqual(response.asgi_request.role, roles.ROLE_DONOR)
+
+    def test_every_middleware_is_async_capable(self):
+        """A sync-only middleware would make Django run the rest of the chain in a thread under ASGI"""
+        for path in settings.MIDDLEWARE:
+            with self.subTest(path):
+                self.assertTrue(getattr(import_string(path), 'async_capable', False))
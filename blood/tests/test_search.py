@@ -0,0 +1,176 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.apps import apps
+from django.db import connection
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+import importlib
+import unittest
+
+from blood import search
+from blood.models import BloodRequest
+from donor.models import Donor
+from patient.models import Patient
+
+
+class QueryTermsTest(TestCase):
+    def test_blood_groups_become_tokens(self):
+        self.assertEqual(search.query_terms('AB+ donors in Pune'), ['abpos', 'donors', 'in', 'pune'])
+        self.assertEqual(search.query_terms('o- "quoted" OR'), ['oneg', 'quoted', 'or'])
+
+
+@unittest.skipUnless(connection.vendor in search.BACKENDS, 'No full-text backend for this database')
+class SearchTest(TestCase):
+    def setUp(self):
+        self.donor = Donor.objects.create(
+            user=User.objects.create_user(username='ravi', first_name='Ravi', last_name='Kumar'),
+            bloodgroup='AB+', address='Kothrud, Pune', mobile='9876543210'
+        )
+        self.patient = Patient.objects.create(
+            user=User.objects.create_user(username='meera', first_name='Meera', last_name='Rao'),
+            age=40, bloodgroup='O-', disease='Anaemia', doctorname='Dr Shah',
+            address='Andheri, Mumbai', mobile='9123456789'
+        )
+        self.request = BloodRequest.objects.create(
+            patient_name='Arjun Kumar', patient_age=52, reason='Bypass surgery', bloodgroup='AB+', unit=2
+        )
+
+    def assertHits(self, query, expected, **kwargs):
+        hits = search.search(query, **kwargs)
+        self.assertEqual([(hit.kind, hit.object.id) for hit in hits], expected)
+
+    def test_matches_each_field(self):
+        self.assertHits('ravi', [('donor', self.donor.id)])
+        self.assertHits('98765', [('donor', self.donor.id)])
+        self.assertHits('mumbai', [('patient', self.patient.id)])
+        self.assertHits('bypass', [('request', self.request.id)])
+        self.assertHits('o-', [('patient', self.patient.id)])
+
+    def test_all_terms_must_match_and_kinds_filter(self):
+        self.assertHits('kumar pune', [('donor', self.donor.id)])
+        self.assertHits('kumar', [('request', self.request.id)], kinds=['request'])
+        self.assertEqual(len(search.search('AB+')), 2)
+
+    def test_names_outrank_other_fields(self):
+        Donor.objects.create(
+            user=User.objects.create_user(username='other', first_name='Sita', last_name='Joshi'),
+            bloodgroup='A+', address='Ravi Nagar', mobile='9000000000'
+        )
+        hits = search.search('ravi')
+        self.assertEqual(hits.hits[0].object, self.donor)
+        self.assertEqual(len(hits), 2)
+
+    def test_index_follows_updates_and_deletes(self):
+        user = self.donor.user
+        user.first_name = 'Raghav'
+        user.save()
+        self.assertHits('ravi', [])
+        self.assertHits('raghav', [('donor', self.donor.id)])
+
+        self.request.reason = 'Dengue'
+        self.request.save()
+        self.assertHits('bypass', [])
+
+        self.patient.delete()
+        self.assertHits('meera', [])
+
+    def test_pages(self):
+        for i in range(5):
+            BloodRequest.objects.create(patient_name=f'Case {i}', patient_age=30, reason='Trauma', bloodgroup='B+', unit=1)
+        first = search.search('trauma', per_page=3)
+        second = search.search('trauma', page=2, per_page=3)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        ids = [hit.object.id for hit in first] + [hit.object.id for hit in second]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            search.get_backend().clear(cursor)
+        self.assertHits('ravi', [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 documents', out.getvalue())
+        self.assertHits('ravi', [('donor', self.donor.id)])
+
+    def test_migration_indexes_existing_rows(self):
+        with connection.cursor() as cursor:
+            search.get_backend().clear(cursor)
+        migration = importlib.import_module('blood.migrations.0010_search_index')
+        migration.populate_search_table(apps, SimpleNamespace(connection=connection))
+        self.assertHits('ravi', [('donor', self.donor.id)])
+        self.assertHits('meera', [('patient', self.patient.id)])
+        self.assertHits('bypass', [('request', self.request.id)])
+
+    def test_migration_writes_the_same_documents_as_a_rebuild(self):
+        """The SQL frozen in migration 0010 indexes rows as blood.search does today"""
+        def documents():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT * FROM {search.SEARCH_TABLE} ORDER BY kind, object_id")
+                return cursor.fetchall()
+
+        search.rebuild_index()
+        rebuilt = documents()
+        with connection.cursor() as cursor:
+            search.get_backend().clear(cursor)
+        migration = importlib.import_module('blood.migrations.0010_search_index')
+        migration.populate_search_table(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(documents(), rebuilt)
+        self.assertHits('AB+ kumar', [('request', self.request.id), ('donor', self.donor.id)])
+
+    def test_table_lookup_is_remembered(self):
+        search.get_backend()
+        with mock.patch.object(connection.introspection, 'table_names') as table_names:
+            self.assertIsNotNone(search.get_backend())
+            # A missing table is remembered too, until the next migrate
+            with mock.patch.object(search, '_table_ready', False):
+                BloodRequest.objects.create(patient_name='Asha', patient_age=30, reason='Trauma', bloodgroup='B+', unit=1)
+                self.assertIsNone(search.get_backend())
+        table_names.assert_not_called()
+
+        search.tables_changed()
+        self.assertIsNotNone(search.get_backend())
+
+    def test_admin_lists_every_match_best_first(self):
+        BloodRequest.objects.bulk_create([
+            BloodRequest(patient_name=f'Case {i}', patient_age=30, reason='Trauma', bloodgroup='B+', unit=1)
+            for i in range(1100)
+        ])
+        best = BloodRequest.objects.create(patient_name='Trauma Ward', patient_age=30, reason='Trauma', bloodgroup='B+', unit=1)
+        search.rebuild_index()
+        User.objects.create_superuser(username='admin', password='testpass123')
+        client = Client()
+        client.login(username='admin', password='testpass123')
+
+        response = client.get('/admin/blood/bloodrequest/', {'q': 'trauma'})
+        self.assertEqual(response.status_code, 200)
+        changelist = response.context['cl']
+        self.assertEqual(changelist.result_count, 1101)
+        self.assertEqual(changelist.result_list[0], best)
+
+        # Sorting by a column still wins over rank
+        response = client.get('/admin/blood/bloodrequest/', {'q': 'trauma', 'o': '1'})
+        self.assertEqual(response.context['cl'].result_list[0].patient_name, 'Case 0')
+
+    def test_admin_search_page(self):
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        client = Client()
+        client.login(username='admin', password='testpass123')
+
+        response = client.get('/admin-search', {'q': 'kumar', 'kind': 'donor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ravi Kumar')
+        self.assertNotContains(response, 'Arjun Kumar')
+
+    def test_admin_search_page_is_for_admins_only(self):
+        self.donor.user.set_password('testpass123')
+        self.donor.user.save()
+        client = Client()
+        client.login(username='ravi', password='testpass123')
+
+        response = client.get('/admin-search', {'q': 'rao'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('adminlogin', response['Location'])
@@ -0,0 +1,78 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from io import StringIO
+from unittest.mock import patch
+import requests
+import time
+
+from blood import providers
+from blood.models import Hospital, NotificationJob
+from blood.simulator import ProviderSimulator
+
+
+class ProviderSimulatorTest(TestCase):
+    def setUp(self):
+        self.simulator = ProviderSimulator(latency=0, seed=1).start()
+        self.addCleanup(self.simulator.stop)
+
+    def twilio(self):
+        return providers.TwilioSms('ACtest', 'token', '+15005550006', base_url=self.simulator.url)
+
+    def sendgrid(self):
+        return providers.SendGridEmail('key', 'noreply@example.com', send_url=self.simulator.sendgrid_url)
+
+    def test_real_clients_talk_to_the_stand_ins(self):
+        self.assertTrue(self.twilio().send_sms('+919876543210', 'hello').startswith('SM'))
+        self.assertEqual(self.sendgrid().send_email('a@example.com', 'Subject', '<p>x</p>', 'x'), 202)
+        self.assertEqual(self.simulator.requests('twilio', 201), 1)
+        self.assertEqual(self.simulator.requests('sendgrid', 202), 1)
+
+    def test_errors_are_reported_not_retried(self):
+        self.simulator.error_rate = 1.0
+        with self.assertRaises(providers.ProviderError):
+            self.sendgrid().send_email('a@example.com', 'Subject', '<p>x</p>', 'x')
+        self.assertEqual(self.simulator.requests('sendgrid'), 1)
+
+    def test_throttled_requests_are_retried(self):
+        self.simulator.throttle = 1
+        sendgrid = self.sendgrid()
+        with patch('urllib3.util.retry.Retry.sleep'):
+            sendgrid.send_email('a@example.com', 'Subject', '<p>x</p>', 'x')
+            with self.assertRaises(providers.ProviderError):
+                sendgrid.send_email('a@example.com', 'Subject', '<p>x</p>', 'x')
+        # The second message was tried 1 + HTTP_RETRIES times
+        self.assertEqual(self.simulator.requests('sendgrid', 429), 1 + providers.HTTP_RETRIES)
+
+    @override_settings(NOTIFICATION_EMAIL_TIMEOUT=0.6, NOTIFICATION_SMS_TIMEOUT=0.6, NOTIFICATION_HTTP_READ_TIMEOUT=1)
+    def test_slow_replies_get_the_read_timeout(self):
+        """The wait for a reply is not cut down to a share of the channel timeout"""
+        self.simulator.latency = 0.3
+        self.assertEqual(self.sendgrid().send_email('a@example.com', 'Subject', '<p>x</p>', 'x'), 202)
+        self.assertTrue(self.twilio().send_sms('+919876543210', 'hello').startswith('SM'))
+
+    @override_settings(NOTIFICATION_HTTP_READ_TIMEOUT=0.1)
+    def test_timed_out_requests_are_sent_once(self):
+        self.simulator.latency = 0.3
+        with self.assertRaises(requests.RequestException):
+            self.sendgrid().send_email('a@example.com', 'Subject', '<p>x</p>', 'x')
+        with self.assertRaises(requests.RequestException):
+            self.twilio().send_sms('+919876543210', 'hello')
+        # The stand-in counts a request once it has answered it
+        time.sleep(0.5)
+        # The provider may have accepted the message; a second request would send it twice
+        self.assertEqual(self.simulator.requests('sendgrid'), 1)
+        self.assertEqual(self.simulator.requests('twilio'), 1)
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    def test_runs_jobs_end_to_end_and_cleans_up(self):
+        out = StringIO()
+        call_command('load_test_notifications', jobs=6, workers=2, latency_ms=1, jitter_ms=0, stdout=out)
+        output = out.getvalue()
+        self.assertIn('6 jobs in', output)
+        self.assertIn('Job status: COMPLETED 6', output)
+        self.assertIn('twilio: 6 requests for 6 messages (0 retries), 6 accepted', output)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(NotificationJob.objects.exists())
+        self.assertFalse(Hospital.objects.exists())
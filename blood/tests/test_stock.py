@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, Client
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+import unittest
+
+from blood.models import BLOOD_GROUPS, Stock
+from blood import stock as stock_service
+from blood.testing import DataQueriesMixin
+
+
+class StockServiceTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.invalidate()
+
+    def set_units(self, bloodgroup, units):
+        # Versions move when the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return stock_service.set_units(bloodgroup, units)
+
+    def test_groups_seeded_after_migrate(self):
+        """post_migrate seeds exactly one row per blood group"""
+        self.assertEqual(
+            sorted(Stock.objects.values_list('bloodgroup', flat=True)),
+            sorted(BLOOD_GROUPS)
+        )
+        stock_service.seed_stock()
+        self.assertEqual(Stock.objects.count(), len(BLOOD_GROUPS))
+
+    def test_bloodgroup_is_unique(self):
+        """Duplicate blood group rows are rejected"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Stock.objects.create(bloodgroup='A+', unit=1)
+
+    def test_snapshot_served_without_queries(self):
+        """Repeated reads hit the in-process snapshot"""
+        self.set_units('O+', 12)
+        self.assertEqual(stock_service.get_units('O+'), 12)
+
+        with self.assertNumDataQueries(0):
+            self.assertEqual(stock_service.as_dict()['O+'], 12)
+            self.assertEqual(stock_service.total_units(), 12)
+
+    def test_writes_invalidate_snapshot(self):
+        """Service writes and direct model saves both refresh the snapshot"""
+        self.set_units('B-', 5)
+        self.assertEqual(stock_service.get_units('B-'), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.add_units('B-', 3)
+        self.assertEqual(stock_service.get_units('B-'), 8)
+
+        stock = Stock.objects.get(bloodgroup='B-')
+        stock.unit = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.save()
+        self.assertEqual(stock_service.get_units('B-'), 1)
+
+    def test_version_moves_on_commit(self):
+        """Nothing is invalidated while the write's transaction is still open"""
+        version = stock_service.get_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            stock_service.set_units('A-', 4)
+            self.assertEqual(stock_service.get_version(), version)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEqual(stock_service.get_version(), version)
+
+    def test_write_in_another_process_reloads_snapshot(self):
+        """A process that never saw the write still reloads once the shared version moves"""
+        self.assertEqual(stock_service.get_units('O-'), 0)
+        # This process's snapshot, as another process would hold it
+        held = stock_service._snapshot, stock_service._snapshot_version
+
+        self.set_units('O-', 9)
+        stock_service._snapshot, stock_service._snapshot_version = held
+        self.assertEqual(stock_service.get_units('O-'), 9)
+
+    def test_lost_version_is_not_reused(self):
+        """An evicted version restarts from a number not handed out before"""
+        version = stock_service.get_version()
+        cache.delete(stock_service.STOCK_VERSION_KEY)
+        self.assertNotEqual(stock_service.get_version(), version)
+
+    def test_take_units_refuses_when_short(self):
+        """Conditional decrement never drives stock negative"""
+        self.set_units('AB-', 2)
+
+        self.assertFalse(stock_service.take_units('AB-', 3))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(stock_service.take_units('AB-', 2))
+        self.assertEqual(stock_service.get_units('AB-'), 0)
+
+    def test_landing_page_issues_no_queries(self):
+        """Anonymous home page no longer touches Stock"""
+        with self.assertNumDataQueries(0):
+            response = Client().get('/')
+        self.assertEqual(response.status_code, 200)
+
+
+@unittest.skipUnless(
+    settings.CACHES['default']['BACKEND'].endswith('DatabaseCache'), 'Costs of the database cache (no REDIS_URL)'
+)
+class StockQueryCostTest(TestCase):
+    """Totals with the configured database cache, where every shared-version read is a query"""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.invalidate()
+        stock_service.as_dict()
+
+    def test_snapshot_read_checks_the_shared_version(self):
+        with self.assertNumQueries(1):
+            stock_service.as_dict()
+
+    def test_admin_blood_page(self):
+        User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        client = Client()
+        client.login(username='admin', password='testpass123')
+        client.get('/admin-blood')
+        # Session and user, then the cached role and stock version
+        with self.assertNumQueries(4):
+            self.assertEqual(client.get('/admin-blood').status_code, 200)
@@ -0,0 +1,94 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
+import asyncio
+import json
+import threading
+
+from blood.broadcast import StockBroadcaster, format_event
+from blood.models import Stock
+from blood import stock as stock_service
+from blood import versions
+
+
+def parse_event(message):
+    lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return lines['event'], json.loads(lines['data'])
+
+
+class StockBroadcasterTest(TestCase):
+    async def test_delta_contains_only_changed_groups(self):
+        """Writes from another thread arrive as compact deltas"""
+        broadcaster = StockBroadcaster(poll_interval=60)
+        queue = broadcaster.subscribe()
+        broadcaster.publish(1, [5, 0, 0, 0, 0, 0, 0, 0])
+
+        thread = threading.Thread(target=broadcaster.publish, args=(2, [5, 0, 3, 0, 0, 0, 0, 0]))
+        thread.start()
+        thread.join()
+
+        message = await asyncio.wait_for(queue.get(), timeout=1)
+        self.assertEqual(parse_event(message), ('delta', {'v': 2, 'd': {'B+': 3}}))
+        broadcaster.unsubscribe(queue)
+
+    async def test_slow_subscriber_is_resynced(self):
+        """A full queue is replaced by one snapshot event"""
+        broadcaster = StockBroadcaster(poll_interval=60)
+        queue = broadcaster.subscribe()
+        broadcaster.publish(1, [0] * 8)
+        for version in range(2, 60):
+            broadcaster.publish(version, [version] + [0] * 7)
+        await asyncio.sleep(0)
+
+        self.assertLess(queue.qsize(), 32)
+        events = [parse_event(queue.get_nowait())[0] for _ in range(queue.qsize())]
+        self.assertIn('snapshot', events)
+        broadcaster.unsubscribe(queue)
+
+    async def test_poll_picks_up_other_processes(self):
+        """A write that only moved the shared version, as another worker's does, reaches subscribers"""
+        broadcaster = StockBroadcaster(poll_interval=60)
+        queue = broadcaster.subscribe()
+        await broadcaster._refresh()
+
+        # No listener runs in this process for another worker's write
+        await sync_to_async(Stock.objects.filter(bloodgroup='O-').update)(unit=4)
+        await sync_to_async(versions.bump)(stock_service.STOCK_VERSION_KEY)
+        await broadcaster._refresh()
+
+        event, payload = parse_event(await asyncio.wait_for(queue.get(), timeout=1))
+        self.assertEqual((event, payload['d']), ('delta', {'O-': 4}))
+        broadcaster.unsubscribe(queue)
+
+    def test_format_event(self):
+        self.assertEqual(
+            format_event('delta', {'v': 1, 'd': {'A+': 2}}),
+            'event: delta\ndata: {"v":1,"d":{"A+":2}}\n\n'
+        )
+
+
+class StockStreamViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.set_units('A+', 7)
+
+    async def test_stream_starts_with_snapshot(self):
+        """Authenticated clients receive the full stock first"""
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get('/api/blood-stock/stream/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = response.streaming_content
+        retry = await content.__anext__()
+        self.assertTrue(retry.startswith(b'retry:'))
+        event, payload = parse_event((await content.__anext__()).decode())
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual(payload['stock']['A+'], 7)
+        await content.aclose()
+
+    async def test_stream_requires_login(self):
+        response = await self.async_client.get('/api/blood-stock/stream/')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,150 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from unittest import mock
+import json
+
+from blood import ratelimit
+from blood.models import RateLimitCounter
+from blood.throttling import AnonThrottle, SlidingWindowThrottle, UserThrottle
+
+WINDOW = 60
+START = 1_000_020.0  # The start of a 60-second window
+
+
+class SlidingWindowLimiterTest(TestCase):
+    def limiter(self, limit=3):
+        return ratelimit.SlidingWindowLimiter('test', limit, WINDOW, store=ratelimit.DatabaseStore())
+
+    def test_refuses_past_limit_without_counting_refusals(self):
+        limiter = self.limiter()
+        allowed = [limiter.hit('u1', now=START + i).allowed for i in range(5)]
+        self.assertEqual(allowed, [True, True, True, False, False])
+        self.assertEqual(RateLimitCounter.objects.get().count, 3)
+        # Other identities have their own count
+        self.assertTrue(limiter.hit('u2', now=START + 5).allowed)
+
+    def test_counts_are_shared_between_store_instances(self):
+        # As two worker processes would each build their own store
+        self.assertTrue(self.limiter(limit=2).hit('u1', now=START).allowed)
+        self.assertTrue(self.limiter(limit=2).hit('u1', now=START + 1).allowed)
+        self.assertFalse(self.limiter(limit=2).hit('u1', now=START + 2).allowed)
+
+    def test_previous_window_slides_out(self):
+        limiter = self.limiter(limit=4)
+        for i in range(4):
+            self.assertTrue(limiter.hit('u1', now=START + 50 + i).allowed)
+
+        # A quarter into the next window, 3 of the previous 4 still count
+        decision = limiter.hit('u1', now=START + WINDOW + 15)
+        self.assertTrue(decision.allowed)
+        self.assertAlmostEqual(decision.rate, 4.0)
+        refused = limiter.hit('u1', now=START + WINDOW + 16)
+        self.assertFalse(refused.allowed)
+        # One more fits once half the previous window has slid out
+        self.assertAlmostEqual(refused.retry_after, 30 - 16, places=5)
+        self.assertTrue(limiter.hit('u1', now=START + WINDOW + 31).allowed)
+
+    def test_retry_after_in_next_window(self):
+        limiter = self.limiter(limit=2)
+        limiter.hit('u1', now=START)
+        limiter.hit('u1', now=START)
+        decision = limiter.hit('u1', now=START + 40)
+        self.assertFalse(decision.allowed)
+        # 20s to the next window, then half of it until 2 * (1 - f) + 1 <= 2
+        self.assertAlmostEqual(decision.retry_after, 20 + 30)
+
+    def test_expired_counters_are_culled(self):
+        limiter = self.limiter()
+        limiter.hit('u1', now=START)
+        RateLimitCounter.objects.update(expires_at='2000-01-01T00:00Z')
+        ratelimit.DatabaseStore().cull()
+        self.assertFalse(RateLimitCounter.objects.exists())
+
+
+class NotificationThrottleTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='caller', password='testpass123')
+        self.client.login(username='caller', password='testpass123')
+        self.url = reverse('blood_api:notify_hospitals')
+
+        patcher = mock.patch('blood.fanout.schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, latitude='19.07'):
+        data = {'user_latitude': latitude, 'user_longitude': '72.87'}
+        return self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+
+    def counts(self):
+        """Hits counted per throttle scope"""
+        counts = {}
+        for key, count in RateLimitCounter.objects.values_list('key', 'count'):
+            scope = key.split(':')[2]
+            counts[scope] = counts.get(scope, 0) + count
+        return counts
+
+    @override_settings(NOTIFICATION_RATE_LIMIT_PER_HOUR=2)
+    def test_hourly_limit(self):
+        codes = [self.post().status_code for _ in range(3)]
+        self.assertEqual(codes, [201, 201, 429])
+        response = self.post()
+        self.assertEqual(response.json()['code'], 'RATE_LIMIT_EXCEEDED')
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    @override_settings(NOTIFICATION_RATE_LIMIT_PER_HOUR=10, NOTIFICATION_RATE_LIMIT_PER_DAY=3)
+    def test_daily_limit(self):
+        codes = [self.post().status_code for _ in range(4)]
+        self.assertEqual(codes, [201, 201, 201, 429])
+
+    @override_settings(NOTIFICATION_RATE_LIMIT_PER_HOUR=1)
+    def test_invalid_requests_use_no_notification_quota(self):
+        self.assertEqual(self.post(latitude='95').status_code, 400)
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.counts(), {'user': 2, 'notifications_hour': 1, 'notifications_day': 1})
+
+    @override_settings(NOTIFICATION_RATE_LIMIT_PER_HOUR=1)
+    def test_refused_requests_count_nowhere(self):
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.post().status_code, 429)
+        self.assertEqual(self.counts(), {'user': 1, 'notifications_hour': 1, 'notifications_day': 1})
+
+    def test_refusal_takes_back_other_throttles_hits(self):
+        rates = {'anon': '5/minute', 'user': '1/minute'}
+        allowed = []
+        with mock.patch.object(SlidingWindowThrottle, 'THROTTLE_RATES', rates):
+            for _ in range(3):
+                # As DRF asks a view's throttles: every one of them, in order
+                request = Request(APIRequestFactory().get('/api/'))
+                results = [throttle().allow_request(request, None) for throttle in (AnonThrottle, UserThrottle)]
+                allowed.append(all(results))
+        self.assertEqual(allowed, [True, False, False])
+        # The anonymous limit counted only the request that was let through
+        self.assertEqual(self.counts(), {'anon': 1, 'user': 1})
+
+    def test_default_api_throttle(self):
+        url = reverse('blood_api:blood_stock_summary')
+        with mock.patch.object(UserThrottle, 'THROTTLE_RATES', {'user': '2/minute'}):
+            codes = [self.client.get(url).status_code for _ in range(3)]
+        self.assertEqual(codes[2], 429)
+
+    @override_settings(NOTIFICATION_RATE_LIMIT_PER_HOUR=1)
+    def test_store_failure_lets_requests_through(self):
+        with mock.patch.object(ratelimit.DatabaseStore, 'incr', side_effect=RuntimeError('down')):
+            codes = [self.post().status_code for _ in range(3)]
+        self.assertEqual(codes, [201, 201, 201])
+
+
+class CacheStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_in_default_cache(self):
+        limiter = ratelimit.SlidingWindowLimiter('test', 2, WINDOW, store=ratelimit.CacheStore())
+        allowed = [limiter.hit('u1', now=START + i).allowed for i in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+        self.assertFalse(RateLimitCounter.objects.exists())
@@ -0,0 +1,100 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from unittest import mock
+import re
+
+from blood import certificate_pdf, certificates, verification
+from blood.api_views import CertificateVerifyThrottle
+from blood.models import Certificate
+from blood.testing import THROTTLE_NEW_WINDOW_QUERIES, THROTTLE_QUERIES, DataQueriesMixin, steady_throttle
+from donor.models import Donor
+
+
+class VerifyCertificateTest(DataQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.donor = Donor.objects.create(
+            user=User.objects.create_user(username='ravi', first_name='Ravi', last_name='Kumar'),
+            bloodgroup='O+', address='Pune', mobile='9876543210'
+        )
+        self.certificate = Certificate.objects.create(donor=self.donor, certificate_type='FIRST_DONATION', donation_count=1)
+        self.url = f'/api/certificates/{self.certificate.certificate_id}/verify/'
+        steady_throttle(self)
+
+    def test_valid_certificate_is_signed_and_cached(self):
+        # The certificate, after the throttle's counter for a new window
+        with self.assertNumDataQueries(1 + THROTTLE_NEW_WINDOW_QUERIES):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['valid'])
+        self.assertEqual(data['certificate']['donor'], 'Ravi K.')
+        self.assertEqual(data['certificate']['type'], 'FIRST_DONATION')
+        self.assertEqual(verification.unsign(data['signature']), data['certificate'])
+        self.assertIn('public', response['Cache-Control'])
+
+        # Repeat scans reach the database for the throttle only
+        with self.assertNumDataQueries(THROTTLE_QUERIES):
+            self.assertEqual(self.client.get(self.url).json(), data)
+
+    def test_legacy_ids_without_tier_verify(self):
+        legacy = Certificate.objects.create(
+            donor=self.donor, certificate_type='FIRST_DONATION', donation_count=1, certificate_id='CERT120240315'
+        )
+        response = self.client.get(f'/api/certificates/{legacy.certificate_id}/verify/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['valid'])
+
+    def test_tampered_signature_is_rejected(self):
+        token = self.client.get(self.url).json()['signature']
+        with self.assertRaises(signing.BadSignature):
+            verification.unsign(token[:-2] + ('AA' if not token.endswith('AA') else 'BB'))
+
+    def test_unknown_ids_are_negatively_cached(self):
+        url = '/api/certificates/CERT99999202601010/verify/'
+        with self.assertNumDataQueries(1 + THROTTLE_NEW_WINDOW_QUERIES):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumDataQueries(THROTTLE_QUERIES):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['code'], 'CERTIFICATE_NOT_FOUND')
+
+    def test_malformed_ids_need_no_lookup(self):
+        with self.assertNumDataQueries(THROTTLE_NEW_WINDOW_QUERIES):
+            self.assertEqual(self.client.get('/api/certificates/not-a-certificate/verify/').status_code, 404)
+
+    def test_issuing_clears_negative_cache(self):
+        certificate_id = Certificate.make_certificate_id(self.donor.pk, 'REGULAR_DONOR')
+        self.assertIsNone(verification.verify(certificate_id))
+
+        self.donor.approved_donations, self.donor.certificate_tiers = 4, certificates.tier_mask(['FIRST_DONATION'])
+        self.donor.save()
+        with self.captureOnCommitCallbacks() as callbacks:
+            certificates.record_approval(self.donor)
+        # Run the cache invalidation only; PDF rendering is covered elsewhere
+        for callback in callbacks:
+            if callback.func is verification.invalidate:
+                callback()
+        self.assertTrue(verification.verify(certificate_id)['valid'])
+
+    def test_deleting_revokes(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.certificate.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_rate_limited_per_client(self):
+        with mock.patch.object(CertificateVerifyThrottle, 'THROTTLE_RATES', {'certificate_verify': '2/minute'}):
+            codes = [self.client.get(self.url).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(SITE_URL='https://blood.example.org/')
+    def test_pdf_carries_verification_qr(self):
+        fields = certificate_pdf.pdf_fields(Certificate.objects.select_related('donor__user').get(pk=self.certificate.pk))
+        self.assertEqual(fields['verify_url'], f'https://blood.example.org{self.url}')
+        with mock.patch.object(certificate_pdf, 'verification_qr', wraps=certificate_pdf.verification_qr) as qr:
+            pdf = certificate_pdf.render_fields(fields)
+        qr.assert_called_once_with(fields['verify_url'])
+        # Still a single page
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', pdf)), 1)
@@ -0,0 +1,145 @@
+"""
+DRF throttles on the shared sliding-window limiter
+
+DRF's own throttles keep request histories in the default cache with a
+non-atomic read-modify-write; on a per-process cache each worker enforces
+its own copy of the limit. These count in blood.ratelimit's shared store
+instead. Rates use DRF's "<count>/<period>" format and scopes, and
+DEFAULT_THROTTLE_CLASSES applies UserThrottle and AnonThrottle to every
+/api/ endpoint.
+
+DRF asks every throttle of a view even after one refuses. A request is
+counted by all of them or by none: the first refusal takes back the hits
+the request already counted, and later throttles let it through
+uncounted. Views that only count requests once they are valid call
+check() themselves, and a refusal there takes back the view's throttles'
+hits as well.
+
+If the store cannot be reached the request is let through and the error
+logged, rather than taking the API down with it.
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .ratelimit import SlidingWindowLimiter
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/hour' -> (5, 3600)"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Throttle by REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope]"""
+    scope = None
+    THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+
+    def get_rate(self):
+        return self.THROTTLE_RATES.get(self.scope)
+
+    def get_ident_key(self, request, view):
+        """Who is counted, or None to skip the request"""
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.decision = None
+        if getattr(request, '_throttle_refused', False):
+            # Refused already; count it nowhere else
+            return True
+        rate = self.get_rate()
+        ident = self.get_ident_key(request, view)
+        if rate is None or ident is None:
+            return True
+        limit, window = parse_rate(rate)
+        limiter = SlidingWindowLimiter(self.scope, limit, window)
+        now = time.time()
+        counted = request.__dict__.setdefault('_throttle_hits', [])
+        try:
+            self.decision = limiter.hit(ident, now=now)
+            if self.decision.allowed:
+                counted.append((limiter, ident, now))
+                return True
+            request._throttle_refused = True
+            while counted:
+                limiter, ident, now = counted.pop()
+                limiter.undo(ident, now)
+        except Exception as e:
+            logger.error(f"Rate limit store unavailable for {self.scope}: {str(e)}")
+            return True
+        return False
+
+    def wait(self):
+        return self.decision.retry_after if self.decision else None
+
+
+class UserThrottle(SlidingWindowThrottle):
+    """Per signed-in user, or per client IP for anonymous requests"""
+    scope = 'user'
+
+
+class AnonThrottle(SlidingWindowThrottle):
+    """Per client IP, anonymous requests only"""
+    scope = 'anon'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return super().get_ident_key(request, view)
+
+
+class NotificationHourThrottle(UserThrottle):
+    """NOTIFICATION_RATE_LIMIT_PER_HOUR notification requests per user"""
+    scope = 'notifications_hour'
+
+    def get_rate(self):
+        return f"{getattr(settings, 'NOTIFICATION_RATE_LIMIT_PER_HOUR', 5)}/hour"
+
+
+class NotificationDayThrottle(UserThrottle):
+    """NOTIFICATION_RATE_LIMIT_PER_DAY notification requests per user"""
+    scope = 'notifications_day'
+
+    def get_rate(self):
+        return f"{getattr(settings, 'NOTIFICATION_RATE_LIMIT_PER_DAY', 20)}/day"
+
+
+def check(request, throttle_classes):
+    """
+    Apply throttles from inside a view, e.g. once the request is known to be valid
+
+    Raises:
+        Throttled: when one of them refuses the request
+    """
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            raise Throttled(throttle.wait())
+
+
+def exception_handler(exc, context):
+    """DRF's handler, with throttled responses in the API's error format"""
+    # rest_framework.views imports the throttle classes, and so this module
+    from rest_framework.views import exception_handler as drf_exception_handler
+
+    response = drf_exception_handler(exc, context)
+    if isinstance(exc, Throttled) and response is not None:
+        retry_after = math.ceil(exc.wait) if exc.wait is not None else None
+        response.data = {
+            'error': 'Rate limit exceeded.' + (f' Try again in {retry_after} seconds.' if retry_after else ''),
+            'code': 'RATE_LIMIT_EXCEEDED',
+            'retry_after': retry_after,
+        }
+    return response
@@ -0,0 +1,126 @@
+"""
+Public certificate verification
+
+Anyone holding a certificate ID (printed on the PDF and encoded in its QR
+code) can check it at /api/certificates/<certificate_id>/verify/. The
+answer is a small JSON document signed with the site's secret key, so a
+stored copy can later be shown to be genuine.
+
+Verification is built to absorb bursts of scans at donation camps:
+
+- IDs that cannot be certificate IDs are rejected before any lookup.
+- A lookup is one indexed query on the unique certificate_id column.
+- Found certificates are cached for an hour and unknown IDs for a few
+  minutes (the negative cache), so repeated scans, including scans of
+  forged IDs, never reach the database.
+- Responses carry public Cache-Control headers so proxies can answer too.
+
+Issuing or deleting a certificate drops its cache entry, so a certificate
+verifies as soon as it exists. Only the donor's first name and last
+initial are disclosed.
+"""
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+
+# CERT<donor id><YYYYMMDD><tier>, within the column's 20 characters; certificates
+# issued before the tier digit was added have none (CERT<donor id><YYYYMMDD>)
+CERTIFICATE_ID_PATTERN = re.compile(r'^CERT\d{9,16}$')
+
+VERIFIED_CACHE_TIMEOUT = 3600
+UNKNOWN_CACHE_TIMEOUT = 300
+
+# Cache value recorded for IDs with no certificate
+UNKNOWN = 'unknown'
+
+SIGNING_SALT = 'blood.certificate.verify'
+
+
+def _cache_key(certificate_id):
+    return f'blood:certificate:verify:{certificate_id}'
+
+
+def verify_url(certificate_id):
+    """Absolute verification URL of a certificate, as encoded in its QR code"""
+    path = reverse('blood_api:verify_certificate', args=[certificate_id])
+    return settings.SITE_URL.rstrip('/') + path
+
+
+def _donor_display_name(first_name, last_name):
+    """First name and last initial, e.g. 'Ravi K.'"""
+    if last_name:
+        return f'{first_name} {last_name[0]}.'.strip()
+    return first_name
+
+
+def _load(certificate_id):
+    """Public fields of a certificate, or None"""
+    from .models import Certificate
+
+    row = Certificate.objects.filter(certificate_id=certificate_id).values(
+        'certificate_type', 'donation_count', 'issued_date',
+        'donor__user__first_name', 'donor__user__last_name',
+    ).first()
+    if row is None:
+        return None
+    titles = dict(Certificate.CERTIFICATE_TYPES)
+    certificate = {
+        'id': certificate_id,
+        'type': row['certificate_type'],
+        'title': titles.get(row['certificate_type'], row['certificate_type']),
+        'donor': _donor_display_name(row['donor__user__first_name'], row['donor__user__last_name']),
+        'donations': row['donation_count'],
+        'issued': row['issued_date'].isoformat(),
+    }
+    return {'valid': True, 'certificate': certificate, 'signature': sign(certificate)}
+
+
+def sign(certificate):
+    """Compact signed token of the public certificate fields"""
+    return signing.dumps(certificate, salt=SIGNING_SALT, compress=True)
+
+
+def unsign(token):
+    """
+    Certificate fields of a token produced by sign()
+
+    Raises:
+        signing.BadSignature: the token was altered or not issued by this site
+    """
+    return signing.loads(token, salt=SIGNING_SALT)
+
+
+def verify(certificate_id):
+    """
+    Verification result of a certificate ID
+
+    Args:
+        certificate_id: the ID as printed on the certificate
+
+    Returns:
+        dict: {'valid': True, 'certificate': {...}, 'signature': str} for an
+        issued certificate, or None if the ID is malformed or unknown
+    """
+    if not CERTIFICATE_ID_PATTERN.match(certificate_id or ''):
+        return None
+    key = _cache_key(certificate_id)
+    result = cache.get(key)
+    if result is None:
+        result = _load(certificate_id)
+        if result is None:
+            cache.set(key, UNKNOWN, UNKNOWN_CACHE_TIMEOUT)
+            return None
+        cache.set(key, result, VERIFIED_CACHE_TIMEOUT)
+    return None if result == UNKNOWN else result
+
+
+def invalidate(certificate_ids):
+    """Forget cached results, e.g. once a certificate is issued or deleted"""
+    cache.delete_many([_cache_key(certificate_id) for certificate_id in certificate_ids])
+
+
+def certificate_changed(sender, instance, **kwargs):
+    invalidate([instance.certificate_id])
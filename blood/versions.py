@@ -0,0 +1,49 @@
+"""
+Shared data versions
+
+A version is a counter in the default cache, which settings.CACHES makes
+common to every process: Redis when REDIS_URL is set, the database
+otherwise. Whatever a process derives from the data (the stock snapshot,
+ETags, SSE deltas) is kept until the counter moves on.
+
+Writers bump a version only once their transaction commits, through
+transaction.on_commit, so no process can reload rows that are not
+committed yet and keep them under the new number.
+
+A counter that is missing (never set, evicted or flushed) restarts from
+the current time in microseconds rather than from 1, so the same number is
+never handed out again for different data, e.g. in an ETag.
+"""
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+
+
+def _fresh():
+    return time.time_ns() // 1000
+
+
+def get(key):
+    """Current value of a shared version"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh(), timeout=None)
+        version = cache.get(key)
+    # Only None if the cache keeps nothing (DummyCache)
+    return version if version is not None else _fresh()
+
+
+def bump(key):
+    """Move a shared version on; returns the new value"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _fresh()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def create_cache_table(using='default', **kwargs):
+    """post_migrate hook: create the database cache table when no Redis is configured"""
+    call_command('createcachetable', database=using, verbosity=0)
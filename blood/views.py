@@ -1,8 +1,16 @@
 from django.shortcuts import render,redirect,reverse
 from . import forms,models
+from . import exports, importer, roles, search
+from . import certificate_pdf
+from . import certificates as certificate_service
+from . import stock as stock_service
+from .pagination import keyset_paginate
 from django.db.models import Sum,Q
 from django.contrib.auth.models import Group
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, StreamingHttpResponse, FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required,user_passes_test
 from django.conf import settings
 from datetime import date, timedelta
@@ -14,22 +22,9 @@ from donor import forms as dforms
 from patient import forms as pforms
 from django.template.loader import render_to_string
 from django.contrib import messages
-from io import BytesIO
-
-# Optional imports for PDF generation
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.units import inch
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from django.conf import settings
-    import os
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+
+# Certificate PDFs are immutable once stored
+CERTIFICATE_MAX_AGE = 60 * 60 * 24 * 365
 
 # Terms and Privacy Policy Views
 def terms_view(request):
@@ -41,40 +36,7 @@ def privacy_view(request):
     return render(request, 'blood/privacy.html')
 
 def home_view(request):
-    x=models.Stock.objects.all()
-    if len(x)==0:
-        blood1=models.Stock()
-        blood1.bloodgroup="A+"
-        blood1.save()
-
-        blood2=models.Stock()
-        blood2.bloodgroup="A-"
-        blood2.save()
-
-        blood3=models.Stock()
-        blood3.bloodgroup="B+"
-        blood3.save()        
-
-        blood4=models.Stock()
-        blood4.bloodgroup="B-"
-        blood4.save()
-
-        blood5=models.Stock()
-        blood5.bloodgroup="AB+"
-        blood5.save()
-
-        blood6=models.Stock()
-        blood6.bloodgroup="AB-"
-        blood6.save()
-
-        blood7=models.Stock()
-        blood7.bloodgroup="O+"
-        blood7.save()
-
-        blood8=models.Stock()
-        blood8.bloodgroup="O-"
-        blood8.save()
-
+    # Stock rows are seeded by the post_migrate hook in blood.apps
     if request.user.is_authenticated:
         return HttpResponseRedirect('afterlogin')  
     return render(request,'blood/index.html')
@@ -88,77 +50,65 @@ def loginregister_view(request):
     return render(request, 'blood/loginregister.html', context)
 
 def is_donor(user):
-    return user.groups.filter(name='DONOR').exists()
+    return roles.get_role(user)==roles.ROLE_DONOR
 
 def is_patient(user):
-    return user.groups.filter(name='PATIENT').exists()
+    return roles.get_role(user)==roles.ROLE_PATIENT
+
+def is_admin(user):
+    return user.is_staff
 
 
 def afterlogin_view(request):
-    if is_donor(request.user):      
+    if request.role==roles.ROLE_DONOR:
         return redirect('donor/donor-dashboard')
                 
-    elif is_patient(request.user):
+    elif request.role==roles.ROLE_PATIENT:
         return redirect('patient/patient-dashboard')
     else:
         return redirect('admin-dashboard')
 
 @login_required(login_url='adminlogin')
 def admin_dashboard_view(request):
-    totalunit=models.Stock.objects.aggregate(Sum('unit'))
-    
     # Get recent certificates for notifications
     recent_certificates = models.Certificate.objects.filter(
         issued_date__gte=date.today() - timedelta(days=7)
     ).order_by('-issued_date')[:5]
     
     dict={
-        'A1':models.Stock.objects.get(bloodgroup="A+"),
-        'A2':models.Stock.objects.get(bloodgroup="A-"),
-        'B1':models.Stock.objects.get(bloodgroup="B+"),
-        'B2':models.Stock.objects.get(bloodgroup="B-"),
-        'AB1':models.Stock.objects.get(bloodgroup="AB+"),
-        'AB2':models.Stock.objects.get(bloodgroup="AB-"),
-        'O1':models.Stock.objects.get(bloodgroup="O+"),
-        'O2':models.Stock.objects.get(bloodgroup="O-"),
+        **stock_service.template_context(),
         'totaldonors':dmodels.Donor.objects.all().count(),
-        'totalbloodunit':totalunit['unit__sum'],
+        'totalbloodunit':stock_service.total_units(),
         'totalrequest':models.BloodRequest.objects.all().count(),
         'totalapprovedrequest':models.BloodRequest.objects.all().filter(status='Approved').count(),
         'recent_certificates': recent_certificates,
         'total_certificates': models.Certificate.objects.count(),
         'blood_camps_count': models.BloodCamp.objects.filter(status='PLANNED').count(),
         'sponsors_count': models.Sponsor.objects.filter(is_active=True).count(),
+        # Projections are precomputed nightly by blood.tasks.forecast_stock_demand
+        'forecasts': models.StockForecast.objects.all(),
     }
     return render(request,'blood/admin_dashboard.html',context=dict)
 
 @login_required(login_url='adminlogin')
 def admin_blood_view(request):
-    dict={
-        'bloodForm':forms.BloodForm(),
-        'A1':models.Stock.objects.get(bloodgroup="A+"),
-        'A2':models.Stock.objects.get(bloodgroup="A-"),
-        'B1':models.Stock.objects.get(bloodgroup="B+"),
-        'B2':models.Stock.objects.get(bloodgroup="B-"),
-        'AB1':models.Stock.objects.get(bloodgroup="AB+"),
-        'AB2':models.Stock.objects.get(bloodgroup="AB-"),
-        'O1':models.Stock.objects.get(bloodgroup="O+"),
-        'O2':models.Stock.objects.get(bloodgroup="O-"),
-    }
     if request.method=='POST':
         bloodForm=forms.BloodForm(request.POST)
         if bloodForm.is_valid() :        
             bloodgroup=bloodForm.cleaned_data['bloodgroup']
-            stock=models.Stock.objects.get(bloodgroup=bloodgroup)
-            stock.unit=bloodForm.cleaned_data['unit']
-            stock.save()
+            stock_service.set_units(bloodgroup,bloodForm.cleaned_data['unit'])
         return HttpResponseRedirect('admin-blood')
+    dict={
+        'bloodForm':forms.BloodForm(),
+        **stock_service.template_context(),
+    }
     return render(request,'blood/admin_blood.html',context=dict)
 
 
 @login_required(login_url='adminlogin')
 def admin_donor_view(request):
-    donors=dmodels.Donor.objects.all()
+    donors=keyset_paginate(request,dmodels.Donor.objects.select_related('user').only(
+        'profile_pic','bloodgroup','address','mobile','user__first_name','user__last_name'))
     return render(request,'blood/admin_donor.html',{'donors':donors})
 
 @login_required(login_url='adminlogin')
@@ -195,7 +145,8 @@ def delete_donor_view(request,pk):
 
 @login_required(login_url='adminlogin')
 def admin_patient_view(request):
-    patients=pmodels.Patient.objects.all()
+    patients=keyset_paginate(request,pmodels.Patient.objects.select_related('user').only(
+        'profile_pic','bloodgroup','age','disease','mobile','user__first_name','user__last_name'))
     return render(request,'blood/admin_patient.html',{'patients':patients})
 
 
@@ -231,19 +182,67 @@ def delete_patient_view(request,pk):
     patient.delete()
     return HttpResponseRedirect('/admin-patient')
 
+@login_required(login_url='adminlogin')
+@user_passes_test(is_admin, login_url='adminlogin')
+def admin_export_view(request,dataset,fmt):
+    try:
+        chunks=exports.export_chunks(dataset,fmt,request.GET)
+    except exports.ExportError as e:
+        return HttpResponse(str(e),status=400)
+    if isinstance(request,ASGIRequest):
+        chunks=exports.aiter_chunks(chunks)
+    response=StreamingHttpResponse(chunks,content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition']=f'attachment; filename="{dataset}-{date.today().isoformat()}.{fmt}"'
+    return response
+
+@login_required(login_url='adminlogin')
+@user_passes_test(is_admin, login_url='adminlogin')
+def admin_import_view(request):
+    result=None
+    error=None
+    if request.method=='POST':
+        kind=request.POST.get('kind')
+        upload=request.FILES.get('roster')
+        if kind not in importer.ROSTERS or upload is None:
+            error='Choose a roster type and a CSV file'
+        else:
+            try:
+                # Hash inline: a spawn pool per request would cost more than it saves and tie up the server's cores
+                result=importer.import_roster(kind,importer.open_upload(upload),workers=0)
+            except (ValueError, UnicodeDecodeError) as e:
+                error=str(e)
+    return render(request,'blood/admin_import.html',{'result':result,'error':error,'rosters':importer.ROSTERS})
+
+@login_required(login_url='adminlogin')
+@user_passes_test(is_admin, login_url='adminlogin')
+def admin_search_view(request):
+    query=request.GET.get('q','').strip()
+    kind=request.GET.get('kind','')
+    try:
+        page=int(request.GET.get('page',1))
+    except ValueError:
+        page=1
+    results=search.search(query,kinds=[kind] if kind in search.KINDS else None,page=page) if query else None
+    return render(request,'blood/admin_search.html',{'query':query,'kind':kind,'results':results})
+
+def pending_requests():
+    # The request templates never touch the requesting patient or donor
+    return models.BloodRequest.objects.filter(status='Pending').defer('request_by_patient','request_by_donor')
+
 @login_required(login_url='adminlogin')
 def admin_request_view(request):
-    requests=models.BloodRequest.objects.all().filter(status='Pending')
+    requests=keyset_paginate(request,pending_requests())
     return render(request,'blood/admin_request.html',{'requests':requests})
 
 @login_required(login_url='adminlogin')
 def admin_request_history_view(request):
-    requests=models.BloodRequest.objects.all().exclude(status='Pending')
+    requests=keyset_paginate(request,models.BloodRequest.objects.exclude(status='Pending').defer('request_by_patient','request_by_donor'))
     return render(request,'blood/admin_request_history.html',{'requests':requests})
 
 @login_required(login_url='adminlogin')
 def admin_donation_view(request):
-    donations=dmodels.BloodDonate.objects.all()
+    donations=keyset_paginate(request,dmodels.BloodDonate.objects.select_related('donor__user').only(
+        'disease','age','bloodgroup','unit','status','date','donor__user__first_name'))
     return render(request,'blood/admin_donation.html',{'donations':donations})
 
 @login_required(login_url='adminlogin')
@@ -252,17 +251,14 @@ def update_approve_status_view(request,pk):
     message=None
     bloodgroup=req.bloodgroup
     unit=req.unit
-    stock=models.Stock.objects.get(bloodgroup=bloodgroup)
-    if stock.unit >= unit:
-        stock.unit=stock.unit-unit
-        stock.save()
+    if stock_service.take_units(bloodgroup,unit):
         req.status="Approved"
+        req.save()
         messages.success(request, f'Blood request approved! {unit} units of {bloodgroup} blood allocated.')
     else:
-        message="Stock Does Not Have Enough Blood To Approve This Request, Only "+str(stock.unit)+" Unit Available"
-    req.save()
+        message="Stock Does Not Have Enough Blood To Approve This Request, Only "+str(stock_service.get_units(bloodgroup))+" Unit Available"
 
-    requests=models.BloodRequest.objects.all().filter(status='Pending')
+    requests=keyset_paginate(request,pending_requests())
     return render(request,'blood/admin_request.html',{'requests':requests,'message':message})
 
 @login_required(login_url='adminlogin')
@@ -275,129 +271,42 @@ def update_reject_status_view(request,pk):
 @login_required(login_url='adminlogin')
 @login_required(login_url='adminlogin')
 def approve_donation_view(request,pk):
-    donation=dmodels.BloodDonate.objects.get(id=pk)
-    donation_blood_group=donation.bloodgroup
-    donation_blood_unit=donation.unit
-
-    stock=models.Stock.objects.get(bloodgroup=donation_blood_group)
-    stock.unit=stock.unit+donation_blood_unit
-    stock.save()
+    donation=dmodels.BloodDonate.objects.select_related('donor__user').get(id=pk)
 
-    donation.status='Approved'
-    donation.save()
-    
-    # Check for new certificates and show detailed feedback
+    # Stock, status and certificates change together or not at all
     try:
-        new_certificates = check_and_award_certificates(donation.donor)
+        new_certificates = certificate_service.approve_donation(donation)
         
-        if new_certificates:
+        if new_certificates is None:
+            messages.info(request, 'This donation was already approved.')
+        elif new_certificates:
             cert_names = [cert.replace("_", " ").title() for cert in new_certificates]
             messages.success(request, f'Donation approved! 🎉 {donation.donor.get_name} earned new certificates: {", ".join(cert_names)}')
         else:
-            # Check current donation count for feedback
-            donation_count = dmodels.BloodDonate.objects.filter(
-                donor=donation.donor, status='Approved'
-            ).count()
-            messages.success(request, f'Donation approved! Total donations for {donation.donor.get_name}: {donation_count}')
+            messages.success(request, f'Donation approved! Total donations for {donation.donor.get_name}: {donation.donor.approved_donations}')
             
     except Exception as e:
-        # Log the error but don't fail the approval  
-        messages.success(request, 'Donation approved successfully!')
+        messages.error(request, f'Donation could not be approved: {str(e)}')
     
     return HttpResponseRedirect('/admin-donation')
 
 
 @login_required(login_url='adminlogin')
 def reject_donation_view(request,pk):
-    donation=dmodels.BloodDonate.objects.get(id=pk)
-    donation.status='Rejected'
-    donation.save()
+    donation=dmodels.BloodDonate.objects.select_related('donor').get(id=pk)
+    certificate_service.reject_donation(donation)
     return HttpResponseRedirect('/admin-donation')
 
 # Certificate and Gamification Views
-def check_and_award_certificates(donor):
-    """Check if donor qualifies for any certificates and award them"""
-    # Count approved donations
-    approved_donations = dmodels.BloodDonate.objects.filter(
-        donor=donor, status='Approved'
-    ).count()
-    
-    certificates_to_award = []
-    
-    # Define certificate thresholds
-    if approved_donations == 1 and not models.Certificate.objects.filter(
-        donor=donor, certificate_type='FIRST_DONATION'
-    ).exists():
-        certificates_to_award.append('FIRST_DONATION')
-    
-    if approved_donations >= 5 and not models.Certificate.objects.filter(
-        donor=donor, certificate_type='REGULAR_DONOR'
-    ).exists():
-        certificates_to_award.append('REGULAR_DONOR')
-    
-    if approved_donations >= 10 and not models.Certificate.objects.filter(
-        donor=donor, certificate_type='HERO_DONOR'
-    ).exists():
-        certificates_to_award.append('HERO_DONOR')
-    
-    if approved_donations >= 20 and not models.Certificate.objects.filter(
-        donor=donor, certificate_type='LIFE_SAVER'
-    ).exists():
-        certificates_to_award.append('LIFE_SAVER')
-    
-    if approved_donations >= 50 and not models.Certificate.objects.filter(
-        donor=donor, certificate_type='BLOOD_CHAMPION'
-    ).exists():
-        certificates_to_award.append('BLOOD_CHAMPION')
-    
-    # Award certificates
-    for cert_type in certificates_to_award:
-        models.Certificate.objects.create(
-            donor=donor,
-            certificate_type=cert_type,
-            donation_count=approved_donations
-        )
-    
-    return certificates_to_award
-
-def draw_certificate_background(canv, doc):
-    """Custom background drawer for certificate PDF"""
-    width, height = A4
-    
-    # Path to background pattern
-    pattern_path = os.path.join(settings.STATICFILES_DIRS[0], 'images', 'certificates', 'pattern.jpg')
-    
-    # Check if background image exists
-    if os.path.exists(pattern_path):
-        try:
-            canv.drawImage(pattern_path, 0, 0, width=width, height=height, mask='auto')
-        except Exception:
-            # Fallback to gradient background if image fails
-            canv.setFillColor(colors.HexColor("#fef2f2"))
-            canv.rect(0, 0, width, height, fill=1)
-    else:
-        # Fallback gradient background
-        canv.setFillColor(colors.HexColor("#fef2f2"))
-        canv.rect(0, 0, width, height, fill=1)
-
 @login_required(login_url='adminlogin')
 def approve_donation_view_enhanced(request, pk):
     """Enhanced donation approval with certificate checking"""
-    donation = dmodels.BloodDonate.objects.get(id=pk)
-    donation_blood_group = donation.bloodgroup
-    donation_blood_unit = donation.unit
-
-    stock = models.Stock.objects.get(bloodgroup=donation_blood_group)
-    stock.unit = stock.unit + donation_blood_unit
-    stock.save()
-
-    donation.status = 'Approved'
-    donation.save()
-    
-    # Check for new certificates
-    new_certificates = check_and_award_certificates(donation.donor)
+    donation = dmodels.BloodDonate.objects.select_related('donor__user').get(id=pk)
+    new_certificates = certificate_service.approve_donation(donation)
     
-    if new_certificates:
+    if new_certificates is None:
+        messages.info(request, 'This donation was already approved.')
+    elif new_certificates:
         messages.success(request, f'Donation approved! {donation.donor.get_name} earned new certificates: {", ".join([cert.replace("_", " ").title() for cert in new_certificates])}')
     else:
         messages.success(request, 'Donation approved successfully!')
@@ -407,17 +316,15 @@ def approve_donation_view_enhanced(request, pk):
 @login_required
 def donor_certificates_view(request):
     """View for donors to see their certificates"""
-    if not is_donor(request.user):
+    if request.role != roles.ROLE_DONOR or not request.donor:
         return redirect('/')
     
     try:
-        donor = dmodels.Donor.objects.get(user_id=request.user.id)
+        donor = request.donor
         certificates = models.Certificate.objects.filter(donor=donor).order_by('-issued_date')
         
         # Get donation count
-        donation_count = dmodels.BloodDonate.objects.filter(
-            donor=donor, status='Approved'
-        ).count()
+        donation_count = donor.approved_donations
         
         # Calculate progress to next milestone
         next_milestone_info = None
@@ -443,22 +350,16 @@ def donor_certificates_view(request):
         # Calculate lives potentially saved (approximate: 1 donation can save 3 lives)
         lives_saved = donation_count * 3
         
-        # Debug: Check for potential certificates
-        potential_certificates = []
-        if donation_count >= 1 and not certificates.filter(certificate_type='FIRST_DONATION').exists():
-            potential_certificates.append('First Donation')
-        if donation_count >= 5 and not certificates.filter(certificate_type='REGULAR_DONOR').exists():
-            potential_certificates.append('Regular Donor')
-        if donation_count >= 10 and not certificates.filter(certificate_type='HERO_DONOR').exists():
-            potential_certificates.append('Hero Donor')
-        if donation_count >= 20 and not certificates.filter(certificate_type='LIFE_SAVER').exists():
-            potential_certificates.append('Life Saver')
-        if donation_count >= 50 and not certificates.filter(certificate_type='BLOOD_CHAMPION').exists():
-            potential_certificates.append('Blood Champion')
+        # Tiers reached but not yet awarded, from the donor's counters
+        missing = certificate_service.due_mask(donation_count) & ~donor.certificate_tiers
+        potential_certificates = [
+            cert_type.replace("_", " ").title()
+            for cert_type, _, bit in certificate_service.TIERS if missing & bit
+        ]
         
         # Automatically award missing certificates
         if potential_certificates:
-            new_certificates = check_and_award_certificates(donor)
+            new_certificates = certificate_service.award_due(donor)
             if new_certificates:
                 messages.success(request, f'Congratulations! You earned new certificates: {", ".join([cert.replace("_", " ").title() for cert in new_certificates])}')
                 # Refresh certificates after awarding
@@ -481,102 +382,32 @@ def donor_certificates_view(request):
 
 @login_required
 def download_certificate_view(request, certificate_id):
-    """Generate and download certificate PDF with improved design"""
+    """Download a certificate PDF, rendered on first request and served from storage afterwards"""
     try:
-        certificate = models.Certificate.objects.get(certificate_id=certificate_id)
+        certificate = models.Certificate.objects.select_related('donor__user').get(certificate_id=certificate_id)
         
         # Check if user owns this certificate
-        if not (is_donor(request.user) and certificate.donor.user == request.user):
+        if not (request.role == roles.ROLE_DONOR and request.donor and certificate.donor_id == request.donor.id):
             messages.error(request, 'You are not authorized to download this certificate.')
             return redirect('/')
         
-        if not REPORTLAB_AVAILABLE:
+        if certificate.pdf_sha256:
+            # Stored certificates never change, so the browser copy is always good
+            not_modified = get_conditional_response(request, etag=quote_etag(certificate.pdf_sha256))
+            if not_modified is not None:
+                return not_modified
+        
+        if not certificate.pdf and not certificate_pdf.REPORTLAB_AVAILABLE:
             messages.error(request, 'PDF generation is not available. Please contact admin.')
             return redirect('/donor/certificates')
         
-        # Create PDF response
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="certificate_{certificate_id}.pdf"'
-        
-        # Create PDF content
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        
-        # Custom styles based on your cer.py design
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle(
-            'title',
-            parent=styles['Title'],
-            alignment=TA_CENTER,
-            fontSize=34,
-            textColor=colors.HexColor("#002366"),  # Navy Blue
-            spaceAfter=30
-        )
-        
-        name_style = ParagraphStyle(
-            'name',
-            parent=styles['Title'],
-            alignment=TA_CENTER,
-            fontSize=26,
-            textColor=colors.HexColor("#B22222"),  # Blood Red
-            spaceAfter=25
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'subtitle',
-            parent=styles['Normal'],
-            alignment=TA_CENTER,
-            fontSize=16,
-            textColor=colors.black,
-            spaceAfter=15
-        )
-        
-        footer_style = ParagraphStyle(
-            'footer',
-            parent=styles['Normal'],
-            alignment=TA_CENTER,
-            fontSize=12,
-            textColor=colors.HexColor("#072204"),
-            spaceAfter=10
-        )
-        
-        certificate_info_style = ParagraphStyle(
-            'certificate_info',
-            parent=styles['Normal'],
-            alignment=TA_CENTER,
-            fontSize=8,
-            textColor=colors.HexColor("#5E4E1B"),
-            spaceAfter=10
+        certificate_pdf.ensure_pdf(certificate)
+        response = FileResponse(
+            certificate.pdf.open('rb'), as_attachment=True,
+            filename=f'certificate_{certificate_id}.pdf', content_type='application/pdf'
         )
-        
-        # Certificate content
-        elements = []
-        elements.append(Spacer(1, 100))
-        elements.append(Paragraph("BLOOD DONATION", title_style))
-        elements.append(Paragraph("CERTIFICATE", title_style))
-        elements.append(Spacer(1, 40))
-        
-        elements.append(Paragraph("This is to certify that", subtitle_style))
-        elements.append(Paragraph(f"<b>{certificate.donor.get_name}</b>", name_style))
-        elements.append(Paragraph("has been recognized as a", subtitle_style))
-        elements.append(Paragraph(f"<b>{certificate.get_certificate_type_display()}</b>", subtitle_style))
-        elements.append(Paragraph(f"for <b>{certificate.donation_count} successful blood donation{'s' if certificate.donation_count > 1 else ''}</b>", subtitle_style))
-        
-        elements.append(Spacer(1, 60))
-        elements.append(Paragraph(f"Certificate ID: {certificate.certificate_id}", certificate_info_style))
-        elements.append(Paragraph(f"Issued Date: {certificate.issued_date.strftime('%B %d, %Y')}", certificate_info_style))
-        
-        elements.append(Spacer(1, 80))
-        elements.append(Paragraph("<b>Thank you for saving lives through blood donation!</b>", subtitle_style))
-        
-        # Build PDF with custom background
-        doc.build(elements, onFirstPage=draw_certificate_background, onLaterPages=draw_certificate_background)
-        
-        pdf = buffer.getvalue()
-        buffer.close()
-        response.write(pdf)
-        
+        response['ETag'] = quote_etag(certificate.pdf_sha256)
+        patch_cache_control(response, private=True, max_age=CERTIFICATE_MAX_AGE, immutable=True)
         return response
         
     except models.Certificate.DoesNotExist:
@@ -621,13 +452,13 @@ def blood_camps_list_view(request):
 @login_required
 def register_for_camp_view(request, camp_id):
     """Register donor for blood camp"""
-    if not is_donor(request.user):
+    if request.role != roles.ROLE_DONOR or not request.donor:
         messages.error(request, 'Only donors can register for blood camps.')
         return redirect('/')
     
     try:
         camp = models.BloodCamp.objects.get(id=camp_id)
-        donor = dmodels.Donor.objects.get(user_id=request.user.id)
+        donor = request.donor
         
         # Check if already registered
         if models.CampRegistration.objects.filter(camp=camp, donor=donor).exists():
@@ -656,26 +487,20 @@ def admin_hospitals_view(request):
     hospitals = models.Hospital.objects.all()
     return render(request, 'blood/admin_hospitals.html', {'hospitals': hospitals})
 
+def profile_city(request):
+    """City of a logged-in donor or patient, taken from the end of their address"""
+    profile = request.donor or request.patient
+    if profile and profile.address:
+        # Extract city from address (simple approach)
+        return profile.address.split(',')[-1].strip()
+    return None
+
 def sponsors_list_view(request):
     """Public view for sponsors"""
     sponsors = models.Sponsor.objects.filter(is_active=True)
     
     # If user is logged in, try to filter by location
-    user_city = None
-    if request.user.is_authenticated:
-        if is_donor(request.user):
-            try:
-                donor = dmodels.Donor.objects.get(user=request.user)
-                # Extract city from address (simple approach)
-                user_city = donor.address.split(',')[-1].strip() if donor.address else None
-            except dmodels.Donor.DoesNotExist:
-                pass
-        elif is_patient(request.user):
-            try:
-                patient = pmodels.Patient.objects.get(user=request.user)
-                user_city = patient.address.split(',')[-1].strip() if patient.address else None
-            except pmodels.Patient.DoesNotExist:
-                pass
+    user_city = profile_city(request)
     
     # Filter sponsors by city if available
     if user_city:
@@ -697,20 +522,7 @@ def hospitals_list_view(request):
     hospitals = models.Hospital.objects.filter(is_partner=True)
     
     # Similar location-based filtering as sponsors
-    user_city = None
-    if request.user.is_authenticated:
-        if is_donor(request.user):
-            try:
-                donor = dmodels.Donor.objects.get(user=request.user)
-                user_city = donor.address.split(',')[-1].strip() if donor.address else None
-            except dmodels.Donor.DoesNotExist:
-                pass
-        elif is_patient(request.user):
-            try:
-                patient = pmodels.Patient.objects.get(user=request.user)
-                user_city = patient.address.split(',')[-1].strip() if patient.address else None
-            except pmodels.Patient.DoesNotExist:
-                pass
+    user_city = profile_city(request)
     
     if user_city:
         local_hospitals = hospitals.filter(city__icontains=user_city)
@@ -0,0 +1,39 @@
+"""
+Process pools for CPU-bound work (password hashing, PDF rendering)
+
+Workers are spawned rather than forked so a pool is safe to start from a
+threaded web server, and each one runs ``django.setup()`` before taking
+tasks. Task functions must live in modules that can be imported once
+Django is set up; this module itself imports nothing from the apps.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _init_worker(settings_module):
+    # Spawned workers start without Django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def default_workers():
+    """One worker per CPU"""
+    return os.cpu_count() or 1
+
+
+def process_pool(workers):
+    """Spawn-context ProcessPoolExecutor whose workers have Django set up"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings'),),
+    )
+
+
+def split(items, parts):
+    """Split a list into at most ``parts`` contiguous slices of near-equal size"""
+    size = -(-len(items) // max(parts, 1)) or 1
+    return [items[start:start + size] for start in range(0, len(items), size)]
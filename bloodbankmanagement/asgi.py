@@ -3,6 +3,10 @@ ASGI config for bloodbankmanagement project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``gunicorn -k uvicorn.workers.UvicornWorker``)
+so the async Server-Sent Events views in ``blood.stream_views`` hold idle
+connections on the event loop instead of occupying a worker thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
@@ -14,3 +18,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
 
 application = get_asgi_application()
+
+# Without a Celery broker, this process sends notifications itself; pick up
+# jobs queued before a restart
+from blood import background  # noqa: E402
+
+background.start_if_local()
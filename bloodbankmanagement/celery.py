@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
@@ -19,6 +20,14 @@ app.conf.beat_schedule = {
         'task': 'blood.tasks.cleanup_old_notification_jobs',
         'schedule': 3600.0,  # Run every hour
     },
+    'send-pending-notifications': {
+        'task': 'blood.tasks.send_pending_notifications',
+        'schedule': 60.0,  # Sweep up jobs whose batch was never scheduled
+    },
+    'forecast-stock-demand': {
+        'task': 'blood.tasks.forecast_stock_demand',
+        'schedule': crontab(hour=2, minute=0),  # Run nightly
+    },
 }
 
 app.conf.timezone = 'UTC'
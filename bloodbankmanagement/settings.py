@@ -50,11 +50,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # For serving static files in production
+    'blood.middleware.StaticFilesMiddleware',  # WhiteNoise, for serving static files in production; async-capable
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blood.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -196,9 +197,44 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 50
+    'PAGE_SIZE': 50,
+    # Counted in a shared store (see blood.throttling); notify-hospitals also has
+    # NOTIFICATION_RATE_LIMIT_PER_HOUR and NOTIFICATION_RATE_LIMIT_PER_DAY
+    'DEFAULT_THROTTLE_CLASSES': [
+        'blood.throttling.AnonThrottle',
+        'blood.throttling.UserThrottle',
+    ],
+    'EXCEPTION_HANDLER': 'blood.throttling.exception_handler',
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/minute',
+        'user': '300/minute',
+        # Per client IP; a whole camp may scan from behind one address
+        'certificate_verify': '120/minute',
+    },
 }
 
+# Cache shared by every worker process: stock and hospital versions, roles, profiles and
+# verification results must agree across workers. Redis when available, else a database
+# table (created by migrate)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'blood_cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Public address of the site, used in links that leave it (certificate QR codes)
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
@@ -207,6 +243,32 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Notification providers: 'twilio' or 'fake' for SMS; 'auto' (SendGrid if
+# SENDGRID_API_KEY is set, else Django email), 'sendgrid', 'django' or 'fake' for email
+NOTIFICATION_SMS_PROVIDER = os.environ.get('NOTIFICATION_SMS_PROVIDER', 'twilio')
+NOTIFICATION_EMAIL_PROVIDER = os.environ.get('NOTIFICATION_EMAIL_PROVIDER', 'auto')
+# Seconds each channel may take per message; a job's SMS and email are sent concurrently
+NOTIFICATION_SMS_TIMEOUT = 10
+NOTIFICATION_EMAIL_TIMEOUT = 10
+# Seconds Twilio and SendGrid may take to answer one request; not retried, as the message may have gone out
+NOTIFICATION_HTTP_READ_TIMEOUT = 5
+
+# Seconds notify_hospitals waits to batch nearby requests into one send (0: one task per request)
+NOTIFICATION_BATCH_WINDOW = int(os.environ.get('NOTIFICATION_BATCH_WINDOW', 2))
+
+# Send notifications on Celery workers; without a broker each web process sends them from a
+# small background queue of its own (blood.background)
+NOTIFICATION_USE_CELERY = bool(os.environ.get('REDIS_URL'))
+NOTIFICATION_LOCAL_WORKERS = 2
+NOTIFICATION_LOCAL_QUEUE_SIZE = 1000
+
+# Days finished notification jobs are kept; their counts live on in NotificationJobSummary
+NOTIFICATION_JOB_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_JOB_RETENTION_DAYS', 30))
+NOTIFICATION_JOB_SUMMARIES = True
+
+# Render certificate PDFs on Celery workers; without a broker they are rendered in a local process pool
+CERTIFICATE_RENDER_USE_CELERY = bool(os.environ.get('REDIS_URL'))
+
 # External Service Configuration
 # Twilio SMS Configuration
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
@@ -220,6 +282,10 @@ EMAIL_FROM_ADDRESS = os.environ.get('EMAIL_FROM_ADDRESS', 'noreply@bloodbank.com
 # Rate Limiting Configuration
 NOTIFICATION_RATE_LIMIT_PER_HOUR = 5
 NOTIFICATION_RATE_LIMIT_PER_DAY = 20
+# Where API rate-limit counters are shared between workers: 'redis', or 'database' without Redis,
+# which costs every /api/ request a write and a read ('cache' uses the default cache, atomic only on Redis)
+RATE_LIMIT_STORE = 'redis' if os.environ.get('REDIS_URL') else 'database'
+RATE_LIMIT_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
 # Logging Configuration for Production
 LOGGING = {
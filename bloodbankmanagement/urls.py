@@ -47,6 +47,9 @@ urlpatterns = [
     path('approve-donation/<int:pk>', views.approve_donation_view,name='approve-donation'),
     path('reject-donation/<int:pk>', views.reject_donation_view,name='reject-donation'),
     path('admin-request-history', views.admin_request_history_view,name='admin-request-history'),
+    path('admin-search', views.admin_search_view,name='admin-search'),
+    path('admin-import', views.admin_import_view,name='admin-import'),
+    path('admin-export/<str:dataset>.<str:fmt>', views.admin_export_view,name='admin-export'),
     path('update-approve-status/<int:pk>', views.update_approve_status_view,name='update-approve-status'),
     path('update-reject-status/<int:pk>', views.update_reject_status_view,name='update-reject-status'),
     
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbankmanagement.settings')
 
 application = get_wsgi_application()
+
+# Without a Celery broker, this process sends notifications itself; pick up
+# jobs queued before a restart
+from blood import background  # noqa: E402
+
+background.start_if_local()
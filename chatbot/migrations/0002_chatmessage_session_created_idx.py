@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'created_at'], name='chatmsg_session_created_idx'),
+        ),
+    ]
@@ -35,6 +35,9 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='chatmsg_session_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_message_type_display()}: {self.content[:50]}..."
\ No newline at end of file
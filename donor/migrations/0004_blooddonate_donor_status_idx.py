@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donor', '0003_donor_aadhaar_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blooddonate',
+            index=models.Index(fields=['donor', 'status'], name='blooddonate_donor_status_idx'),
+        ),
+    ]
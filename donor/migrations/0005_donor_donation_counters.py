@@ -0,0 +1,52 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Certificate.CERTIFICATE_TYPES as of this migration; bit i of certificate_tiers is entry i
+CERTIFICATE_TYPES = ['FIRST_DONATION', 'REGULAR_DONOR', 'HERO_DONOR', 'LIFE_SAVER', 'BLOOD_CHAMPION']
+
+
+def fill_counters(apps, schema_editor):
+    """Count each donor's approved donations and the tiers already held; issues no certificates"""
+    Donor = apps.get_model('donor', 'Donor')
+    BloodDonate = apps.get_model('donor', 'BloodDonate')
+    Certificate = apps.get_model('blood', 'Certificate')
+
+    counts = dict(
+        BloodDonate.objects.filter(status='Approved').values('donor')
+        .annotate(total=Count('id')).values_list('donor', 'total')
+    )
+    bits = {certificate_type: 1 << bit for bit, certificate_type in enumerate(CERTIFICATE_TYPES)}
+    held = {}
+    for donor_id, certificate_type in Certificate.objects.values_list('donor_id', 'certificate_type').iterator():
+        held[donor_id] = held.get(donor_id, 0) | bits.get(certificate_type, 0)
+
+    changed = []
+    for donor in Donor.objects.filter(pk__in=set(counts) | set(held)).only('id').iterator():
+        donor.approved_donations = counts.get(donor.id, 0)
+        donor.certificate_tiers = held.get(donor.id, 0)
+        changed.append(donor)
+    Donor.objects.bulk_update(changed, ['approved_donations', 'certificate_tiers'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donor', '0004_blooddonate_donor_status_idx'),
+        ('blood', '0005_hospital_sponsor_certificate_bloodcamp_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='approved_donations',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='certificate_tiers',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Bitmask of certificate tiers awarded'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
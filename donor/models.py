@@ -12,6 +12,10 @@ class Donor(models.Model):
 
     address = models.CharField(max_length=40)
     mobile = models.CharField(max_length=20,null=False)
+
+    # Kept up to date by blood.certificates on approval; see backfill_donation_counters
+    approved_donations = models.PositiveIntegerField(default=0)
+    certificate_tiers = models.PositiveSmallIntegerField(default=0, help_text='Bitmask of certificate tiers awarded')
    
     @property
     def get_name(self):
@@ -30,5 +34,12 @@ class BloodDonate(models.Model):
     unit=models.PositiveIntegerField(default=0)
     status=models.CharField(max_length=20,default="Pending")
     date=models.DateField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Certificate checks count a donor's approved donations
+            models.Index(fields=['donor', 'status'], name='blooddonate_donor_status_idx'),
+        ]
+
     def __str__(self):
-        return self.donor
\ No newline at end of file
+        return self.donor
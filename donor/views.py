@@ -10,6 +10,7 @@ from django.core.mail import send_mail
 from django.contrib.auth.models import User
 from blood import forms as bforms
 from blood import models as bmodels
+from blood.profiles import donor_required, request_counts
 from django.contrib.auth import authenticate, login
 
 def donor_signup_view(request):
@@ -38,17 +39,13 @@ def donor_signup_view(request):
     return render(request,'donor/donorsignup.html',context=mydict)
 
 
+@donor_required
 def donor_dashboard_view(request):
-    donor= models.Donor.objects.get(user_id=request.user.id)
-    dict={
-        'requestpending': bmodels.BloodRequest.objects.all().filter(request_by_donor=donor).filter(status='Pending').count(),
-        'requestapproved': bmodels.BloodRequest.objects.all().filter(request_by_donor=donor).filter(status='Approved').count(),
-        'requestmade': bmodels.BloodRequest.objects.all().filter(request_by_donor=donor).count(),
-        'requestrejected': bmodels.BloodRequest.objects.all().filter(request_by_donor=donor).filter(status='Rejected').count(),
-    }
+    dict=request_counts(request_by_donor=request.donor)
     return render(request,'donor/donor_dashboard.html',context=dict)
 
 
+@donor_required
 def donate_blood_view(request):
     donation_form=forms.DonationForm()
     if request.method=='POST':
@@ -56,17 +53,17 @@ def donate_blood_view(request):
         if donation_form.is_valid():
             blood_donate=donation_form.save(commit=False)
             blood_donate.bloodgroup=donation_form.cleaned_data['bloodgroup']
-            donor= models.Donor.objects.get(user_id=request.user.id)
-            blood_donate.donor=donor
+            blood_donate.donor=request.donor
             blood_donate.save()
             return HttpResponseRedirect('donation-history')  
     return render(request,'donor/donate_blood.html',{'donation_form':donation_form})
 
+@donor_required
 def donation_history_view(request):
-    donor= models.Donor.objects.get(user_id=request.user.id)
-    donations=models.BloodDonate.objects.all().filter(donor=donor)
+    donations=models.BloodDonate.objects.all().filter(donor=request.donor)
     return render(request,'donor/donation_history.html',{'donations':donations})
 
+@donor_required
 def make_request_view(request):
     request_form=bforms.RequestForm()
     if request.method=='POST':
@@ -74,13 +71,12 @@ def make_request_view(request):
         if request_form.is_valid():
             blood_request=request_form.save(commit=False)
             blood_request.bloodgroup=request_form.cleaned_data['bloodgroup']
-            donor= models.Donor.objects.get(user_id=request.user.id)
-            blood_request.request_by_donor=donor
+            blood_request.request_by_donor=request.donor
             blood_request.save()
             return HttpResponseRedirect('request-history')  
     return render(request,'donor/makerequest.html',{'request_form':request_form})
 
+@donor_required
 def request_history_view(request):
-    donor= models.Donor.objects.get(user_id=request.user.id)
-    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_donor=donor)
+    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_donor=request.donor)
     return render(request,'donor/request_history.html',{'blood_request':blood_request})
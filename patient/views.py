@@ -10,6 +10,7 @@ from django.core.mail import send_mail
 from django.contrib.auth.models import User
 from blood import forms as bforms
 from blood import models as bmodels
+from blood.profiles import patient_required, request_counts
 from django.contrib.auth import authenticate, login
 
 
@@ -38,18 +39,12 @@ def patient_signup_view(request):
         return HttpResponseRedirect('patientlogin')
     return render(request,'patient/patientsignup.html',context=mydict)
 
+@patient_required
 def patient_dashboard_view(request):
-    patient= models.Patient.objects.get(user_id=request.user.id)
-    dict={
-        'requestpending': bmodels.BloodRequest.objects.all().filter(request_by_patient=patient).filter(status='Pending').count(),
-        'requestapproved': bmodels.BloodRequest.objects.all().filter(request_by_patient=patient).filter(status='Approved').count(),
-        'requestmade': bmodels.BloodRequest.objects.all().filter(request_by_patient=patient).count(),
-        'requestrejected': bmodels.BloodRequest.objects.all().filter(request_by_patient=patient).filter(status='Rejected').count(),
-
-    }
-   
+    dict=request_counts(request_by_patient=request.patient)
     return render(request,'patient/patient_dashboard.html',context=dict)
 
+@patient_required
 def make_request_view(request):
     request_form=bforms.RequestForm()
     if request.method=='POST':
@@ -57,13 +52,12 @@ def make_request_view(request):
         if request_form.is_valid():
             blood_request=request_form.save(commit=False)
             blood_request.bloodgroup=request_form.cleaned_data['bloodgroup']
-            patient= models.Patient.objects.get(user_id=request.user.id)
-            blood_request.request_by_patient=patient
+            blood_request.request_by_patient=request.patient
             blood_request.save()
             return HttpResponseRedirect('my-request')  
     return render(request,'patient/makerequest.html',{'request_form':request_form})
 
+@patient_required
 def my_request_view(request):
-    patient= models.Patient.objects.get(user_id=request.user.id)
-    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_patient=patient)
+    blood_request=bmodels.BloodRequest.objects.all().filter(request_by_patient=request.patient)
     return render(request,'patient/my_request.html',{'blood_request':blood_request})
@@ -37,8 +37,8 @@ echo "=================================================="
 
 # Use gunicorn for production
 if command -v gunicorn &> /dev/null; then
-    echo "🔥 Starting with Gunicorn (Production WSGI server)..."
-    gunicorn bloodbankmanagement.wsgi:application --bind 0.0.0.0:8000 --workers 3
+    echo "🔥 Starting with Gunicorn (Production ASGI server with Uvicorn workers)..."
+    gunicorn bloodbankmanagement.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --workers 3
 else
     echo "⚠️ Gunicorn not found, using Django development server..."
     echo "For production, install gunicorn: pip install gunicorn"
@@ -24,6 +24,7 @@ class HospitalLocationManager {
         console.log('Initializing Hospital Location Manager');
         this.setupEventListeners();
         this.initializeMap();
+        this.subscribeToStockUpdates();
     }
     
     setupEventListeners() {
@@ -207,6 +208,30 @@ class HospitalLocationManager {
         }
     }
     
+    subscribeToStockUpdates() {
+        // Live stock changes pushed by the server (Server-Sent Events)
+        if (!window.EventSource) return;
+        
+        this.stockStream = new EventSource('/api/blood-stock/stream/');
+        this.stockStream.addEventListener('snapshot', (event) => {
+            this.applyStockUpdate(JSON.parse(event.data).stock);
+        });
+        this.stockStream.addEventListener('delta', (event) => {
+            this.applyStockUpdate(JSON.parse(event.data).d);
+        });
+    }
+    
+    applyStockUpdate(changes) {
+        if (this.hospitals.length === 0) return;
+        
+        this.hospitals.forEach(hospital => {
+            Object.entries(changes).forEach(([type, units]) => {
+                hospital.blood_stock[type] = { units: units, available: units > 0 };
+            });
+        });
+        this.displayHospitals();
+    }
+    
     displayHospitals() {
         const container = document.getElementById('hospitalsList');
         if (!container) return;
@@ -355,8 +380,8 @@ class HospitalLocationManager {
             if (response.ok) {
                 this.showSuccess(`Notifications queued successfully! You'll receive SMS and email within ${data.estimated_delivery}.`);
                 
-                // Poll for status updates
-                this.pollNotificationStatus(data.job_id);
+                // Follow the job until it is sent
+                this.watchNotificationStatus(data.job_id);
             } else {
                 throw new Error(data.error || 'Failed to send notifications');
             }
@@ -377,36 +402,55 @@ class HospitalLocationManager {
         }
     }
     
-    async pollNotificationStatus(jobId) {
-        const maxPolls = 10;
-        let pollCount = 0;
+    watchNotificationStatus(jobId) {
+        // The server pushes each status change (Server-Sent Events)
+        if (!window.EventSource) {
+            this.longPollNotificationStatus(jobId);
+            return;
+        }
+        
+        const stream = new EventSource(`/api/notification-status/${jobId}/stream/`);
+        stream.addEventListener('status', (event) => {
+            if (this.showNotificationStatus(JSON.parse(event.data))) {
+                // Finished; stop EventSource from reconnecting
+                stream.close();
+            }
+        });
+    }
+    
+    async longPollNotificationStatus(jobId) {
+        // Each request waits on the server until the job changes
+        const maxRequests = 20;
+        let etag = null;
         
-        const poll = async () => {
-            if (pollCount >= maxPolls) return;
-            
+        for (let i = 0; i < maxRequests; i++) {
             try {
-                const response = await fetch(`/api/notification-status/${jobId}/`);
-                const data = await response.json();
+                const response = await fetch(`/api/notification-status/${jobId}/wait/?timeout=25`, {
+                    headers: etag ? { 'If-None-Match': etag } : {}
+                });
+                if (response.status === 304) continue;
+                if (!response.ok) return;
                 
-                if (data.status === 'COMPLETED') {
-                    this.showSuccess('Notifications sent successfully! Check your SMS and email.');
-                    return;
-                } else if (data.status === 'FAILED') {
-                    this.showError(`Notification failed: ${data.error_message}`);
-                    return;
-                } else if (data.status === 'PROCESSING') {
-                    // Continue polling
-                    pollCount++;
-                    setTimeout(poll, 2000);
-                }
+                etag = response.headers.get('ETag');
+                if (this.showNotificationStatus(await response.json())) return;
                 
             } catch (error) {
                 console.error('Status polling error:', error);
+                return;
             }
-        };
-        
-        // Start polling after 2 seconds
-        setTimeout(poll, 2000);
+        }
+    }
+    
+    showNotificationStatus(data) {
+        // True once the job is finished
+        if (data.status === 'COMPLETED') {
+            this.showSuccess('Notifications sent successfully! Check your SMS and email.');
+            return true;
+        } else if (data.status === 'FAILED') {
+            this.showError(`Notification failed: ${data.error_message}`);
+            return true;
+        }
+        return false;
     }
     
     updateLocationButton(text, disabled) {